@@ -46,6 +46,7 @@ export const QueueProvider = ({ children, serviceName = 'inspect' }: { children:
   const wsRef = useRef<WebSocket | null>(null);
   const audioRef = useRef<HTMLAudioElement | null>(null);
   const audioUrlRef = useRef<string | null>(null);
+  const queueSeqRef = useRef<number>(0);
   const location = useLocation();
   const [history, setHistory] = useState<ServerHistoryItem[]>([]);
   const [serverStatus, setServerStatus] = useState<{ online: number; queue_length: number; muted?: boolean; processed_count?: number } | null>(null);
@@ -74,80 +75,96 @@ export const QueueProvider = ({ children, serviceName = 'inspect' }: { children:
 
       ws.onopen = () => console.debug(`[QueueContext:${serviceName}] WebSocket connected`);
 
-      ws.onmessage = (ev) => {
-        try {
-          const msg = JSON.parse(ev.data);
-            if (msg.type === 'queue_update') {
-            const mapped: Queue[] = (msg.queue || []).map((q: any) => ({
-              id: String(q.Q_number),
-              queueNumber: q.Q_number,
-              customerName: q.FULLNAME_TH,
-              status: 'waiting',
-              timestamp: q.timestamp ? new Date(q.timestamp) : new Date(),
-              service: q.service,
-              counter: q.counter,
-            }));
-            setQueues(mapped);
-          } else if (msg.type === 'status') {
-            setServerStatus({
-              online: msg.online,
-              queue_length: msg.queue_length,
-              muted: msg.muted,
-              processed_count: msg.processed_count,
+      const handleMessage = (msg: any) => {
+        const toQueue = (q: any): Queue => ({
+          id: String(q.Q_number),
+          queueNumber: q.Q_number,
+          customerName: q.FULLNAME_TH,
+          status: 'waiting',
+          timestamp: q.timestamp ? new Date(q.timestamp) : new Date(),
+          service: q.service,
+          counter: q.counter,
+        });
+        if (msg.type === 'queue_update') {
+          queueSeqRef.current = msg.seq ?? 0;
+          setQueues((msg.queue || []).map(toQueue));
+        } else if (
+          msg.type === 'queue_append' ||
+          msg.type === 'queue_insert' ||
+          msg.type === 'queue_pop' ||
+          msg.type === 'queue_remove'
+        ) {
+          if (msg.seq <= queueSeqRef.current) return;
+          if (msg.seq !== queueSeqRef.current + 1) {
+            // missed a delta; ask the server for a fresh snapshot
+            ws.send(JSON.stringify({ type: 'snapshot' }));
+            return;
+          }
+          queueSeqRef.current = msg.seq;
+          if (msg.type === 'queue_append') setQueues((prev) => [...prev, toQueue(msg.item)]);
+          else if (msg.type === 'queue_insert')
+            // a priority patient goes in at the position they will be called from
+            setQueues((prev) => [...prev.slice(0, msg.position), toQueue(msg.item), ...prev.slice(msg.position)]);
+          else setQueues((prev) => prev.filter((q) => q.queueNumber !== msg.Q_number));
+        } else if (msg.type === 'status') {
+          setServerStatus({
+            online: msg.online,
+            queue_length: msg.queue_length,
+            muted: msg.muted,
+            processed_count: msg.processed_count,
+          });
+        } else if (msg.type === 'current') {
+          const it = msg.item;
+          if (!it) setCurrentQueue(null);
+          else
+            setCurrentQueue({
+              id: String(it.Q_number),
+              queueNumber: it.Q_number,
+              customerName: it.FULLNAME_TH,
+              status: 'calling',
+              timestamp: it.timestamp ? new Date(it.timestamp) : new Date(),
+              service: it.service,
+              counter: it.counter,
             });
-          } else if (msg.type === 'current') {
-            const it = msg.item;
-            if (!it) setCurrentQueue(null);
-            else
-              setCurrentQueue({
-                id: String(it.Q_number),
-                queueNumber: it.Q_number,
-                customerName: it.FULLNAME_TH,
-                status: 'calling',
-                timestamp: it.timestamp ? new Date(it.timestamp) : new Date(),
-                service: it.service,
-                counter: it.counter,
-              });
-          } else if (msg.type === 'complete') {
-            const qnum = msg.Q_number;
-            setQueues((prev) =>
-              prev.map((q) =>
-                q.id === String(qnum) ? { ...q, status: 'completed' as QueueStatus } : q
-              )
-            );
-            setCurrentQueue(prev => (prev?.id === String(qnum) ? null : prev));
-          } else if (msg.type === 'history') {
-            setHistory(msg.history || []);
-          } else if (msg.type === 'audio') {
-            if (role !== 'display') return;
-            if (serverStatus?.muted) return;
-            try {
-              if (audioRef.current) {
-                try {
-                  audioRef.current.pause();
-                  audioRef.current.currentTime = 0;
-                } catch (e) {}
-              }
-              if (audioUrlRef.current) {
-                try { URL.revokeObjectURL(audioUrlRef.current); } catch (e) {}
-                audioUrlRef.current = null;
-              }
-
-              const blob = b64ToBlob(msg.data, 'audio/mp3');
-              const url = URL.createObjectURL(blob);
-              const audio = new Audio(url);
-              audioRef.current = audio;
-              audioUrlRef.current = url;
-              audio.play().catch(() => {});
-              audio.onended = () => {
-                try { URL.revokeObjectURL(url); } catch (e) {}
-                if (audioRef.current === audio) audioRef.current = null;
-                if (audioUrlRef.current === url) audioUrlRef.current = null;
-              };
-            } catch (e) {
-              console.error('Failed to play audio', e);
+        } else if (msg.type === 'complete') {
+          const qnum = msg.Q_number;
+          setQueues((prev) =>
+            prev.map((q) =>
+              q.id === String(qnum) ? { ...q, status: 'completed' as QueueStatus } : q
+            )
+          );
+          setCurrentQueue(prev => (prev?.id === String(qnum) ? null : prev));
+        } else if (msg.type === 'history') {
+          setHistory(msg.history || []);
+        } else if (msg.type === 'audio') {
+          if (role !== 'display') return;
+          if (serverStatus?.muted) return;
+          try {
+            if (audioRef.current) {
+              try {
+                audioRef.current.pause();
+                audioRef.current.currentTime = 0;
+              } catch (e) {}
             }
+            const url = `${backendUrl.replace(/\/$/, '')}${msg.url}`;
+            const audio = new Audio(url);
+            audioRef.current = audio;
+            audioUrlRef.current = url;
+            audio.play().catch(() => {});
+            audio.onended = () => {
+              if (audioRef.current === audio) audioRef.current = null;
+              if (audioUrlRef.current === url) audioUrlRef.current = null;
+            };
+          } catch (e) {
+            console.error('Failed to play audio', e);
           }
+        }
+      };
+
+      ws.onmessage = (ev) => {
+        try {
+          const msg = JSON.parse(ev.data);
+          (msg.type === 'batch' ? msg.messages : [msg]).forEach(handleMessage);
         } catch (err) {
           console.error('Invalid WS message', err);
         }
@@ -169,19 +186,6 @@ export const QueueProvider = ({ children, serviceName = 'inspect' }: { children:
     };
   }, [backendUrl, location.pathname, serverStatus?.muted, serviceName]);
 
-  const b64ToBlob = (b64Data: string, contentType = '', sliceSize = 512) => {
-    const byteCharacters = atob(b64Data);
-    const byteArrays = [];
-    for (let offset = 0; offset < byteCharacters.length; offset += sliceSize) {
-      const slice = byteCharacters.slice(offset, offset + sliceSize);
-      const byteNumbers = new Array(slice.length);
-      for (let i = 0; i < slice.length; i++) byteNumbers[i] = slice.charCodeAt(i);
-      const byteArray = new Uint8Array(byteNumbers);
-      byteArrays.push(byteArray);
-    }
-    return new Blob(byteArrays, { type: contentType });
-  };
-
   const addQueue = async (name: string) => {
     if (!backendUrl) return;
     const endpoint = `${backendUrl.replace(/\/$/, '')}/api/queue/${serviceName}/enqueue`;
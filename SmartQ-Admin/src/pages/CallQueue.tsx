@@ -242,6 +242,15 @@ const CallQueue = ({ serviceName: propServiceName }: { serviceName?: string } =
                   {c.name}
                 </Button>
               ))}
+              {services[serviceName].counters.length > 1 && (
+                <Button
+                  size="sm"
+                  variant={selectedCounter === 'auto' ? 'default' : 'outline'}
+                  onClick={() => setSelectedCounter('auto')}
+                >
+                  อัตโนมัติ (ช่องที่ว่าง)
+                </Button>
+              )}
             </div>
           </Card>
         )}
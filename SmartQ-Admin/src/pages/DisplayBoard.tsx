@@ -65,6 +65,7 @@ const DisplayBoard: React.FC = () => {
     Record<string, { audio: HTMLAudioElement | null; url: string | null }>
   >({});
   const callTimersRef = useRef<Record<string, number | null>>({});
+  const queueSeqRefs = useRef<Record<string, number>>({});
   const listRef = useRef<HTMLElement>(null);
   
   const { backendUrl, initalData } = useBackend();
@@ -102,36 +103,12 @@ const DisplayBoard: React.FC = () => {
 
         ws.onopen = () =>
           console.debug(`[DisplayBoard] WS connected for ${service}`);
-        ws.onmessage = (ev) => {
-          try {
-            const msg = JSON.parse(ev.data);
-            const triggerCallAnimation = (duration = 2500) => {
-              if (callTimersRef.current[service]) {
-                clearTimeout(callTimersRef.current[service] as number);
-                callTimersRef.current[service] = null;
-              }
-              setStateMap((prev) => {
-                const cur = prev[service] || {
-                  name: service,
-                  label: s.label || service,
-                  current: null,
-                  next: null,
-                  queues: [],
-                  muted: false,
-                  lastCalledTimestamp: 0,
-                };
-                return { ...prev, [service]: { ...cur, isCalling: true } };
-              });
-              callTimersRef.current[service] = window.setTimeout(() => {
-                setStateMap((prev) => {
-                  const st = prev[service];
-                  if (!st) return prev;
-                  return { ...prev, [service]: { ...st, isCalling: false } };
-                });
-                callTimersRef.current[service] = null;
-              }, duration);
-            };
-
+        const handleMessage = (msg: any) => {
+          const triggerCallAnimation = (duration = 2500) => {
+            if (callTimersRef.current[service]) {
+              clearTimeout(callTimersRef.current[service] as number);
+              callTimersRef.current[service] = null;
+            }
             setStateMap((prev) => {
               const cur = prev[service] || {
                 name: service,
@@ -142,93 +119,133 @@ const DisplayBoard: React.FC = () => {
                 muted: false,
                 lastCalledTimestamp: 0,
               };
-              if (msg.type === "queue_update") {
-                const queues = msg.queue || [];
-                const next = queues.length > 0 ? queues[0] : null; 
-                return { ...prev, [service]: { ...cur, queues, next } };
-              } else if (msg.type === "current") {
-                const now = Date.now();
-                const newState = { ...cur, current: msg.item || null };
-                if (msg.item) {
-                  (newState as ServiceState).lastCalledTimestamp = now;
-                  (newState as ServiceState).isCalling = true;
-                }
-                return { ...prev, [service]: newState };
-              } else if (msg.type === "status") {
-                return { ...prev, [service]: { ...cur, muted: msg.muted } };
-              }
-              return prev;
+              return { ...prev, [service]: { ...cur, isCalling: true } };
             });
-
-            if (msg.type === "current" && msg.item) {
-              triggerCallAnimation();
+            callTimersRef.current[service] = window.setTimeout(() => {
+              setStateMap((prev) => {
+                const st = prev[service];
+                if (!st) return prev;
+                return { ...prev, [service]: { ...st, isCalling: false } };
+              });
+              callTimersRef.current[service] = null;
+            }, duration);
+          };
+
+          if (msg.type === "queue_update") {
+            queueSeqRefs.current[service] = msg.seq ?? 0;
+          } else if (
+            msg.type === "queue_append" ||
+            msg.type === "queue_insert" ||
+            msg.type === "queue_pop" ||
+            msg.type === "queue_remove"
+          ) {
+            if (msg.seq <= (queueSeqRefs.current[service] ?? 0)) return;
+            if (msg.seq !== (queueSeqRefs.current[service] ?? 0) + 1) {
+              // missed a delta; ask the server for a fresh snapshot
+              ws.send(JSON.stringify({ type: "snapshot" }));
+              return;
             }
+            queueSeqRefs.current[service] = msg.seq;
+          }
 
-            if (msg.type === "audio") {
-              if (!mounted) return;
-              try {
-                triggerCallAnimation(3000);
+          setStateMap((prev) => {
+            const cur = prev[service] || {
+              name: service,
+              label: s.label || service,
+              current: null,
+              next: null,
+              queues: [],
+              muted: false,
+              lastCalledTimestamp: 0,
+            };
+            if (msg.type === "queue_update") {
+              const queues = msg.queue || [];
+              const next = queues.length > 0 ? queues[0] : null; 
+              return { ...prev, [service]: { ...cur, queues, next } };
+            } else if (
+              msg.type === "queue_append" ||
+              msg.type === "queue_insert" ||
+              msg.type === "queue_pop" ||
+              msg.type === "queue_remove"
+            ) {
+              const queues =
+                msg.type === "queue_append"
+                  ? [...cur.queues, msg.item]
+                  : msg.type === "queue_insert"
+                  ? [...cur.queues.slice(0, msg.position), msg.item, ...cur.queues.slice(msg.position)]
+                  : cur.queues.filter((q) => q.Q_number !== msg.Q_number);
+              const next = queues.length > 0 ? queues[0] : null;
+              return { ...prev, [service]: { ...cur, queues, next } };
+            } else if (msg.type === "current") {
+              const now = Date.now();
+              const newState = { ...cur, current: msg.item || null };
+              if (msg.item) {
+                (newState as ServiceState).lastCalledTimestamp = now;
+                (newState as ServiceState).isCalling = true;
+              }
+              return { ...prev, [service]: newState };
+            } else if (msg.type === "status") {
+              return { ...prev, [service]: { ...cur, muted: msg.muted } };
+            }
+            return prev;
+          });
 
-                const entry = audioRefs.current[service] || {
-                  audio: null,
-                  url: null,
-                };
-                if (entry.audio) {
-                  try {
-                    entry.audio.pause();
-                    entry.audio.currentTime = 0;
-                  } catch (e) {}
-                }
-                if (entry.url) {
-                  try {
-                    URL.revokeObjectURL(entry.url);
-                  } catch (e) {}
-                }
+          if (msg.type === "current" && msg.item) {
+            triggerCallAnimation();
+          }
 
-                const b64 = msg.data;
-                const byteCharacters = atob(b64);
-                const byteNumbers = new Array(byteCharacters.length);
-                for (let i = 0; i < byteCharacters.length; i++)
-                  byteNumbers[i] = byteCharacters.charCodeAt(i);
-                const byteArray = new Uint8Array(byteNumbers);
-                const blob = new Blob([byteArray], { type: "audio/mp3" });
-                const url = URL.createObjectURL(blob);
-                const audio = new Audio(url);
+          if (msg.type === "audio") {
+            if (!mounted) return;
+            try {
+              triggerCallAnimation(3000);
 
+              const entry = audioRefs.current[service] || {
+                audio: null,
+                url: null,
+              };
+              if (entry.audio) {
                 try {
-                  const prev = audioRefs.current[service];
-                  if (prev?.audio) {
-                    try {
-                      prev.audio.pause();
-                      prev.audio.src = "";
-                    } catch (e) {}
-                  }
-                  if (prev?.url) {
-                    try {
-                      URL.revokeObjectURL(prev.url);
-                    } catch (e) {}
-                  }
+                  entry.audio.pause();
+                  entry.audio.currentTime = 0;
                 } catch (e) {}
+              }
 
-                audioRefs.current[service] = { audio, url };
-                audio.play().catch(() => {});
-                audio.onended = () => {
-                  try {
-                    audio.pause();
-                    audio.src = "";
-                  } catch (e) {}
+              const base = backendUrl ? backendUrl.replace(/\/$/, "") : "";
+              const url = `${base}${msg.url}`;
+              const audio = new Audio(url);
+
+              try {
+                const prev = audioRefs.current[service];
+                if (prev?.audio) {
                   try {
-                    URL.revokeObjectURL(url);
+                    prev.audio.pause();
+                    prev.audio.src = "";
                   } catch (e) {}
-                  if (audioRefs.current[service]?.audio === audio)
-                    audioRefs.current[service].audio = null;
-                  if (audioRefs.current[service]?.url === url)
-                    audioRefs.current[service].url = null;
-                };
-              } catch (e) {
-                console.error("Failed to play audio", e);
-              }
+                }
+              } catch (e) {}
+
+              audioRefs.current[service] = { audio, url };
+              audio.play().catch(() => {});
+              audio.onended = () => {
+                try {
+                  audio.pause();
+                  audio.src = "";
+                } catch (e) {}
+                if (audioRefs.current[service]?.audio === audio)
+                  audioRefs.current[service].audio = null;
+                if (audioRefs.current[service]?.url === url)
+                  audioRefs.current[service].url = null;
+              };
+            } catch (e) {
+              console.error("Failed to play audio", e);
             }
+          }
+        };
+
+        ws.onmessage = (ev) => {
+          try {
+            const msg = JSON.parse(ev.data);
+            (msg.type === "batch" ? msg.messages : [msg]).forEach(handleMessage);
           } catch (err) {
             console.error("Invalid WS message", err);
           }
@@ -259,9 +276,6 @@ const DisplayBoard: React.FC = () => {
             entry.audio = null;
           }
           if (entry?.url) {
-            try {
-              URL.revokeObjectURL(entry.url);
-            } catch (e) {}
             entry.url = null;
           }
         } catch (e) {}
@@ -0,0 +1,75 @@
+# Fan-out load test: one broadcast loop, hundreds of simulated sockets, a few of them slow.
+# Usage (from backend/): python -m bench.broadcaster
+import asyncio
+import json
+import random
+import statistics
+import time
+from src.lib.broadcaster import SEND_QUEUE, SLOW_CONSUMER, Connection, encode
+
+CLIENTS = 300
+SLOW = 5
+MESSAGES = 20
+
+
+class FakeSocket:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.latencies: list[float] = []
+
+    async def _deliver(self, sent_at: float):
+        await asyncio.sleep(self.delay)
+        self.latencies.append(time.perf_counter() - sent_at)
+
+    async def send_json(self, message: dict):
+        encode(message)
+        await self._deliver(message["sent_at"])
+
+    async def send_text(self, data: str):
+        await self._deliver(json.loads(data)["sent_at"])
+
+    async def close(self):
+        pass
+
+
+def make_sockets() -> list[FakeSocket]:
+    sockets = [FakeSocket(random.uniform(0, 0.0005)) for _ in range(CLIENTS - SLOW)]
+    sockets += [FakeSocket(0.05) for _ in range(SLOW)]
+    random.shuffle(sockets)
+    return sockets
+
+
+def report(label: str, sockets: list[FakeSocket]):
+    fast = sorted(l * 1000 for s in sockets if s.delay < 0.05 for l in s.latencies)
+    pct = lambda p: fast[min(len(fast) - 1, int(p * (len(fast) - 1)))]
+    print(f"{label:>10}: fast clients n={len(fast)} p50={statistics.median(fast):.2f}ms "
+          f"p95={pct(0.95):.2f}ms p99={pct(0.99):.2f}ms max={fast[-1]:.2f}ms")
+
+
+async def sequential():
+    sockets = make_sockets()
+    for i in range(MESSAGES):
+        message = {"type": "status", "seq": i, "sent_at": time.perf_counter(), "queue": list(range(50))}
+        for ws in sockets:
+            await ws.send_json(message)
+    report("before", sockets)
+
+
+async def fanout():
+    sockets = make_sockets()
+    conns = [Connection(ws, "client", lambda c: None, SEND_QUEUE, SLOW_CONSUMER) for ws in sockets]
+    for i in range(MESSAGES):
+        data = encode({"type": "status", "seq": i, "sent_at": time.perf_counter(), "queue": list(range(50))})
+        for c in conns:
+            c.offer(data)
+        await asyncio.sleep(0)
+    while any(not c.outbox.empty() for c in conns if c.ws.delay < 0.05):
+        await asyncio.sleep(0.001)
+    await asyncio.sleep(0.01)
+    report("after", sockets)
+    for c in conns:
+        c.task.cancel()
+
+
+asyncio.run(sequential())
+asyncio.run(fanout())
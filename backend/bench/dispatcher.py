@@ -0,0 +1,41 @@
+# Simulate a pharmacy with four counters of different speeds: patients
+# arrive steadily and each one goes to the counter the dispatcher picks
+# (or to a fixed rotation) the moment one is needed.
+# Usage (from backend/): python -m bench.dispatcher
+import heapq
+import random
+from src.lib.dispatcher import CounterDispatcher
+
+SPEEDS = {"1": 120, "2": 180, "3": 240, "4": 360}  # mean seconds per patient
+ARRIVAL_GAP = 55
+PATIENTS = 5000
+
+
+def simulate(pick):
+    random.seed(7)
+    d = CounterDispatcher(SPEEDS)
+    free_at = {name: 0.0 for name in SPEEDS}
+    finishes = []
+    waits = []
+    for n in range(PATIENTS):
+        arrival = n * ARRIVAL_GAP + random.uniform(-20, 20)
+        while finishes and finishes[0][0] <= arrival:
+            at, name, qnum = heapq.heappop(finishes)
+            d.release(qnum, at=at)
+        name = pick(d, arrival, n)
+        start = max(arrival, free_at[name])
+        took = random.expovariate(1 / SPEEDS[name])
+        free_at[name] = start + took
+        d.assign(name, n, start)
+        heapq.heappush(finishes, (start + took, name, n))
+        waits.append(start - arrival)
+    waits.sort()
+    return sum(waits) / len(waits), waits[int(len(waits) * 0.95)]
+
+
+for label, pick in (
+    ("round robin", lambda d, at, n: list(SPEEDS)[n % len(SPEEDS)]),
+    ("least loaded", lambda d, at, n: d.choose(at)["counter"]),
+):
+    mean, p95 = simulate(pick)
+    print(f"{label:>13}: mean wait {mean:7.1f}s  p95 wait {p95:7.1f}s")
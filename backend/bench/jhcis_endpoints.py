@@ -0,0 +1,42 @@
+# Concurrency benchmark for the JHCIS endpoints against the configured database.
+# Usage (from backend/): python -m bench.jhcis_endpoints [base_url] [username] [password] [pid]
+# Point it at a test server: /insert_visit writes real rows to the visit table.
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor as Clients
+import requests
+
+base = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8000"
+username = sys.argv[2] if len(sys.argv) > 2 else "admin"
+password = sys.argv[3] if len(sys.argv) > 3 else "admin"
+pid = sys.argv[4] if len(sys.argv) > 4 else "1234567890123"
+concurrency = 20
+requests_per_endpoint = 200
+
+calls = {
+    "/login": lambda s: s.post(f"{base}/api/jhcis/login", json={"username": username, "password": password}),
+    "/check_exist_person": lambda s: s.get(f"{base}/api/jhcis/check_exist_person/{pid}"),
+    "/insert_visit": lambda s: s.post(f"{base}/api/jhcis/insert_visit", json={
+        "username": username, "pid": pid, "claimType": "PG0060001",
+        "claimCode": "BENCH", "datetime_claim": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }),
+}
+
+for name, call in calls.items():
+    session = requests.Session()
+
+    def timed(_):
+        start = time.perf_counter()
+        r = call(session)
+        return (time.perf_counter() - start) * 1000, r.status_code
+
+    start = time.perf_counter()
+    with Clients(max_workers=concurrency) as clients:
+        results = list(clients.map(timed, range(requests_per_endpoint)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(r[0] for r in results)
+    errors = sum(1 for r in results if r[1] >= 500)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * (len(latencies) - 1)))]
+    print(f"{name:>20}: {requests_per_endpoint / elapsed:7.1f} req/s  p50={statistics.median(latencies):.1f}ms  "
+          f"p95={p95:.1f}ms  5xx={errors}")
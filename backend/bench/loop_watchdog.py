@@ -0,0 +1,38 @@
+# Demo: one handler blocks the loop with a synchronous sleep, one does not.
+# Usage (from backend/): python -m bench.loop_watchdog
+import asyncio
+import json
+import time
+from src.lib.loop_watchdog import LoopWatchdog
+
+
+def blocking_io():
+    time.sleep(0.6)
+
+
+async def slow_handler():
+    blocking_io()
+
+
+async def good_handler():
+    await asyncio.to_thread(blocking_io)
+
+
+async def main():
+    watchdog = LoopWatchdog(interval=0.05, threshold=0.1)
+    watchdog.endpoints[(__file__, "slow_handler")] = "POST /demo/slow"
+    watchdog.endpoints[(__file__, "good_handler")] = "POST /demo/good"
+    watchdog.start()
+    await asyncio.sleep(0.2)
+    await good_handler()
+    await asyncio.sleep(0.2)
+    print(f"after awaiting to_thread: {watchdog.stalls} stalls")
+    await slow_handler()
+    await asyncio.sleep(0.2)
+    print(f"after blocking sleep: {watchdog.stalls} stalls")
+    stall = watchdog.recent[-1]
+    print(json.dumps({k: v for k, v in stall.items() if k != "stack"}, indent=2))
+    watchdog.stop()
+
+
+asyncio.run(main())
@@ -0,0 +1,67 @@
+# Overhead benchmark for the instrumentation on the hot paths.
+# Usage (from backend/): python -m bench.metrics
+import asyncio
+import time
+from src.lib.metrics import Registry, RequestMetrics
+
+N = 200000
+bench = Registry()
+h = bench.histogram("bench_seconds", "bench", ("route",))
+c = bench.counter("bench_total", "bench", ("route",))
+child = h.labels("/api/queue/{service}/enqueue")
+
+
+def per_call(fn) -> float:
+    start = time.perf_counter()
+    for _ in range(N):
+        fn()
+    return (time.perf_counter() - start) / N * 1e6
+
+
+baseline = per_call(lambda: None)
+print(f"{'empty call (baseline)':>34}: {baseline:.3f}us")
+print(f"{'histogram child observe':>34}: {per_call(lambda: child.observe(0.0042)) - baseline:.3f}us")
+print(f"{'labels(...).observe':>34}: {per_call(lambda: h.labels('/x').observe(0.0042)) - baseline:.3f}us")
+print(f"{'counter labels(...).inc':>34}: {per_call(lambda: c.labels('/x').inc()) - baseline:.3f}us")
+
+
+def timed_block():
+    with child.time():
+        pass
+
+
+print(f"{'with child.time()':>34}: {per_call(timed_block) - baseline:.3f}us")
+
+
+async def asgi_overhead():
+    class Route:
+        path = "/api/queue/{service}/enqueue"
+
+    async def app(scope, receive, send):
+        scope["route"] = Route
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        pass
+
+    wrapped = RequestMetrics(app)
+    scope = {"type": "http", "method": "POST", "path": "/api/queue/inspect/enqueue"}
+    runs = 50000
+    for label, target in (("plain ASGI app", app), ("with RequestMetrics", wrapped)):
+        start = time.perf_counter()
+        for _ in range(runs):
+            await target(dict(scope), receive, send)
+        print(f"{label:>34}: {(time.perf_counter() - start) / runs * 1e6:.3f}us/request")
+
+
+asyncio.run(asgi_overhead())
+
+for i in range(20):
+    h.labels(f"/route/{i}").observe(i / 100)
+start = time.perf_counter()
+text = bench.render()
+print(f"{'render 21 histogram series':>34}: {(time.perf_counter() - start) * 1000:.2f}ms, {len(text)} bytes")
@@ -0,0 +1,84 @@
+# Benchmark: the FIFO deque the scheduler replaced against the scheduler with
+# and without priority traffic, at clinic-day and much larger queue sizes.
+# Usage (from backend/): python -m bench.scheduler
+import random
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from src.lib.scheduler import PriorityScheduler
+
+BOOSTS = {"urgent": 1800, "pregnant": 900, "elderly": 600, "disabled": 600}
+start_at = datetime(2026, 1, 1, 8, tzinfo=timezone(timedelta(hours=7)))
+
+
+def items(n: int, priority_share: float):
+    classes = list(BOOSTS)
+    out = []
+    for q in range(1, n + 1):
+        item = {"Q_number": q, "FULLNAME_TH": f"ผู้ป่วย {q}", "counter": None,
+                "timestamp": (start_at + timedelta(seconds=q * 3)).isoformat()}
+        if random.random() < priority_share:
+            item["priority"] = random.choice(classes)
+        out.append(item)
+    return out
+
+
+def bench_deque(batch):
+    q = deque()
+    t0 = time.perf_counter()
+    for item in batch:
+        q.append(item)
+    t1 = time.perf_counter()
+    while q:
+        q.popleft()
+    t2 = time.perf_counter()
+    return t1 - t0, t2 - t1
+
+
+def bench_scheduler(batch, boosts):
+    q = PriorityScheduler(boosts)
+    t0 = time.perf_counter()
+    for item in batch:
+        q.push(item)
+    t1 = time.perf_counter()
+    while q:
+        q.pop()
+    t2 = time.perf_counter()
+    return t1 - t0, t2 - t1
+
+
+def report(label, n, times):
+    push, pop = times
+    print(f"{label:>28} n={n:>6}: enqueue {push / n * 1e6:.2f}us  dequeue {pop / n * 1e6:.2f}us")
+
+
+random.seed(1)
+for n in (1000, 20000, 100000):
+    fifo = items(n, 0.0)
+    mixed = items(n, 0.15)
+    report("deque (old FIFO)", n, bench_deque(fifo))
+    report("scheduler, no classes", n, bench_scheduler(fifo, {}))
+    report("scheduler, 15% priority", n, bench_scheduler(mixed, BOOSTS))
+
+# removal from the middle was O(n) with the deque
+n = 20000
+batch = items(n, 0.15)
+q = PriorityScheduler(BOOSTS)
+for item in batch:
+    q.push(item)
+victims = random.sample(range(1, n + 1), n // 4)
+t0 = time.perf_counter()
+for qnum in victims:
+    q.remove(qnum)
+print(f"{'scheduler remove':>28} n={n:>6}: {(time.perf_counter() - t0) / len(victims) * 1e6:.2f}us")
+
+# a normal patient is only overtaken by priority patients arriving within the largest head start
+q = PriorityScheduler(BOOSTS)
+for item in batch:
+    q.push(item)
+called_at = {}
+for position in range(n):
+    called_at[q.pop()["Q_number"]] = position
+worst = max(called_at[item["Q_number"]] - (item["Q_number"] - 1) for item in batch if "priority" not in item)
+print(f"worst overtaking for a normal patient: {worst} places "
+      f"(head start {max(BOOSTS.values()):.0f}s at one arrival per 3s = {max(BOOSTS.values()) / 3:.0f})")
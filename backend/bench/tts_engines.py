@@ -0,0 +1,40 @@
+# Latency of each TTS engine on typical announcements.
+# Usage (from backend/): python -m bench.tts_engines
+import statistics
+import time
+from src.config.config import get as config
+from src.lib.tts_engines import ENGINES
+
+corpus = [
+    "คิวหมายเลข 1 นายสมชาย ใจดี กรุณาไปที่ ช่องตรวจ 1",
+    "คิวหมายเลข 12 นางสาวสุภาพร แสงทอง กรุณาไปที่ ช่องตรวจ 2",
+    "คิวหมายเลข 37 นางบุญมี ศรีสุข กรุณาไปที่ ช่องจ่ายยา 3",
+    "คิวหมายเลข 58 เด็กชายธนากร วงศ์ใหญ่ กรุณาไปที่ ช่องจ่ายยา 1",
+    "คิวหมายเลข 104 นายประเสริฐ พุ่มพวง กรุณาไปที่ ช่องบริการ",
+    "คิวหมายเลข 215 นางสาวกัญญารัตน์ เพชรรัตน์ กรุณาไปที่ ช่องตรวจ 3",
+]
+rounds = 3
+
+for name, cls in ENGINES.items():
+    engine = cls(timeout=config("TTS.ENGINE_TIMEOUT", 5))
+    if not engine.available():
+        print(f"{name}: not available, skipped")
+        continue
+    samples = []
+    errors = 0
+    for _ in range(rounds):
+        for text in corpus:
+            start = time.perf_counter()
+            try:
+                engine.synthesize(text, "th")
+            except Exception:
+                errors += 1
+                continue
+            samples.append((time.perf_counter() - start) * 1000)
+    if not samples:
+        print(f"{name}: all {errors} requests failed")
+        continue
+    samples.sort()
+    p50 = statistics.median(samples)
+    p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+    print(f"{name}: n={len(samples)} errors={errors} p50={p50:.1f}ms p95={p95:.1f}ms")
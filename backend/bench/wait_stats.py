@@ -0,0 +1,20 @@
+# Accuracy and cost of the streaming quantiles against exact ones.
+# Usage (from backend/): python -m bench.wait_stats
+import random
+import time
+from src.lib.wait_stats import StreamStats
+
+random.seed(3)
+for label, draw in (("exponential(300s)", lambda: random.expovariate(1 / 300)),
+                    ("lognormal", lambda: random.lognormvariate(5, 0.8))):
+    samples = [draw() for _ in range(100000)]
+    stats = StreamStats()
+    start = time.perf_counter()
+    for x in samples:
+        stats.add(x)
+    per_event = (time.perf_counter() - start) / len(samples) * 1e6
+    ordered = sorted(samples)
+    exact = {p: ordered[int(p * len(ordered))] for p in (0.5, 0.9)}
+    s = stats.summary()
+    print(f"{label:>18}: p50 {s['p50']:.1f} (exact {exact[0.5]:.1f})  "
+          f"p90 {s['p90']:.1f} (exact {exact[0.9]:.1f})  {per_event:.2f}us/event")
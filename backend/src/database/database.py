@@ -1,12 +1,206 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable
 import pymysql
-from mysql.connector import Error
 from src.config.config import get as config
+from src.lib.metrics import registry
 
-connection = None
-db_cursor = None
+query_seconds = registry.histogram(
+    "smartq_db_query_seconds", "JHCIS statement time on the database thread, per statement.", ("statement",),
+)
 
-try:
-  connection = pymysql.connect(
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of pymysql connections.
+
+    Idle connections that have not been used for ``health_check_interval``
+    seconds are pinged (with reconnect) before being handed out; connections
+    that fail the check or raise a connection error are discarded and replaced.
+    """
+
+    def __init__(self, min_size: int = 1, max_size: int = 5, acquire_timeout: float = 10.0,
+                 health_check_interval: float = 30.0, **connect_kwargs):
+        self.min_size = max(0, int(min_size))
+        self.max_size = max(1, int(max_size), self.min_size)
+        self.acquire_timeout = float(acquire_timeout)
+        self.health_check_interval = float(health_check_interval)
+        self.connect_kwargs = connect_kwargs
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.discarded = 0
+        self.errors = 0
+        self.closed = False
+
+    def _connect(self):
+        conn = pymysql.connect(**self.connect_kwargs)
+        conn.smartq_last_used = time.monotonic()
+        return conn
+
+    def open(self):
+        opened = []
+        try:
+            for _ in range(self.min_size):
+                with self.lock:
+                    if self.size >= self.max_size:
+                        break
+                    self.size += 1
+                try:
+                    opened.append(self._connect())
+                except Exception:
+                    with self.lock:
+                        self.size -= 1
+                    raise
+        finally:
+            for conn in opened:
+                self.idle.put(conn)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                with self.lock:
+                    can_grow = self.size < self.max_size
+                    if can_grow:
+                        self.size += 1
+                if can_grow:
+                    try:
+                        return self._connect()
+                    except Exception:
+                        with self.lock:
+                            self.size -= 1
+                        raise
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"no database connection available within {self.acquire_timeout}s")
+                try:
+                    conn = self.idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+            if time.monotonic() - conn.smartq_last_used >= self.health_check_interval:
+                try:
+                    conn.ping(reconnect=True)
+                except Exception:
+                    self._discard(conn)
+                    self.discarded += 1
+                    continue
+            return conn
+
+    def release(self, conn, broken: bool = False):
+        if broken or self.closed:
+            self._discard(conn)
+            return
+        conn.smartq_last_used = time.monotonic()
+        self.idle.put(conn)
+
+    def _discard(self, conn):
+        with self.lock:
+            self.size -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            broken = True
+            self.errors += 1
+            raise
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.release(conn, broken)
+
+    def close(self):
+        """Close the idle connections; ones still checked out are closed when released."""
+        self.closed = True
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def metrics(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": self.idle.qsize(),
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "discarded": self.discarded,
+            "errors": self.errors,
+        }
+
+
+class Database:
+    """Runs blocking pymysql work on a dedicated thread pool so handlers can await it."""
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self.executor = ThreadPoolExecutor(max_workers=pool.max_size, thread_name_prefix="db")
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self.pool.open)
+        except Exception as e:
+            print(f"Database connection error: {e}")
+
+    async def close(self):
+        """Let statements already running finish, drop queued ones and close the pool."""
+        await asyncio.to_thread(self.executor.shutdown, True, cancel_futures=True)
+        self.pool.close()
+
+    def _run(self, fn: Callable[[Any], Any]):
+        with self.pool.connection() as conn:
+            return fn(conn)
+
+    async def run(self, fn: Callable[[Any], Any]):
+        """Call ``fn(connection)`` on a pooled connection in the DB thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._run, fn)
+
+    async def fetchone(self, query: str, args=None, statement: str = "other"):
+        def work(conn):
+            with query_seconds.labels(statement).time(), conn.cursor() as cur:
+                cur.execute(query, args)
+                return cur.fetchone()
+        return await self.run(work)
+
+    async def fetchall(self, query: str, args=None, statement: str = "other"):
+        def work(conn):
+            with query_seconds.labels(statement).time(), conn.cursor() as cur:
+                cur.execute(query, args)
+                return cur.fetchall()
+        return await self.run(work)
+
+
+pool_connections = registry.gauge("smartq_db_pool_connections", "JHCIS connections by state.", ("state",))
+
+db = Database(ConnectionPool(
+    min_size=config('DB.POOL_MIN', 1),
+    max_size=config('DB.POOL_MAX', 5),
+    acquire_timeout=config('DB.POOL_TIMEOUT', 10),
+    health_check_interval=config('DB.HEALTH_CHECK_INTERVAL', 30),
     host=config('DB.HOST'),
     user=config('DB.USERNAME'),
     password=config('DB.PASSWORD'),
@@ -14,8 +208,7 @@ try:
     port=config('DB.PORT', 3306),
     autocommit=True,
     charset="utf8",
-    use_unicode=True
-  )
-  db_cursor = connection.cursor()
-except Error as e:
-  print(f"Database connection error: {e}")
+    use_unicode=True,
+    connect_timeout=config('DB.CONNECT_TIMEOUT', 5),
+))
+pool_connections.collect = lambda: {("open",): db.pool.size, ("idle",): db.pool.idle.qsize()}
@@ -0,0 +1,426 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable
+from src.config.config import get as config, resource_path
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    next_attempt REAL NOT NULL,
+    leased_until REAL NOT NULL DEFAULT 0,
+    updated REAL,
+    code INTEGER,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_due ON entries (status, next_attempt);
+"""
+
+# mark(phase, start) -> now: timing hook the applier reports its phases to (see register_visit)
+Mark = Callable[[str, float], float]
+Apply = Callable[[dict, Mark | None], Awaitable[tuple[int, dict]]]
+ApplyMany = Callable[[list[dict], Mark | None], Awaitable[list[tuple[int, dict]]]]
+
+# How long a claimed entry is hidden from other server workers draining the same journal.
+# Kept apart from next_attempt (retry backoff), so a restart can reset backoff without
+# stealing entries another live worker is applying.
+CLAIM_LEASE = 300
+
+
+class WriteBehindJournal:
+    """Durable local journal for writes that must reach JHCIS eventually.
+
+    ``submit`` commits the payload to SQLite before anything else, then waits
+    up to ``wait`` seconds for the drain worker to apply it. If the database is
+    slow or down the caller gets ``None`` back and the entry stays pending; the
+    worker keeps retrying with exponential backoff, across restarts.
+
+    Entries are keyed by an idempotency key, so a resubmitted request returns
+    the stored outcome instead of writing twice. ``apply`` returns
+    ``(status_code, body)``: 2xx marks the entry done, 4xx marks it failed for
+    good, 5xx is retried up to ``max_attempts`` times and an exception (the
+    database is unreachable) is retried indefinitely. With ``apply_many`` the
+    drain applies several due entries in one call, which returns one outcome
+    per entry.
+
+    A caller waiting on ``submit`` may pass a ``mark`` timing hook; it is
+    handed to the applier so the caller still sees per-phase timings.
+    """
+
+    def __init__(self, path: str, wait: float = 3.0, retry_base: float = 1.0, retry_max: float = 60.0,
+                 max_attempts: int = 10, batch: int = 20, retain: float = 7 * 86400):
+        self.path = path
+        self.wait = float(wait)
+        self.retry_base = float(retry_base)
+        self.retry_max = float(retry_max)
+        self.max_attempts = max(1, int(max_attempts))
+        self.batch = max(1, int(batch))
+        self.retain = float(retain)
+        # sqlite3 objects stay on one thread; this also serializes journal writes.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self.conn: sqlite3.Connection | None = None
+        self.apply: Apply | None = None
+        self.apply_many: ApplyMany | None = None
+        self.marks: dict[int, Mark] = {}
+        self.task: asyncio.Task | None = None
+        self.wake: asyncio.Event | None = None
+        self.stopping = False
+        # set while the database is known to be unreachable (time.time())
+        self.paused_until = 0.0
+        self.waiters: dict[int, list[asyncio.Future]] = {}
+        self.applied = 0
+        self.retries = 0
+        self.failures = 0
+        self.last_error: str | None = None
+
+    # --- SQLite, journal thread only -------------------------------------
+
+    def _open(self):
+        if self.conn is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, isolation_level=None, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(entries)")}
+        if "leased_until" not in columns:
+            # journals written before leases had their own column
+            self.conn.execute("ALTER TABLE entries ADD COLUMN leased_until REAL NOT NULL DEFAULT 0")
+
+    def _append(self, key: str, payload: dict) -> tuple[int, str, int | None, str | None]:
+        self._open()
+        now = time.time()
+        data = json.dumps(payload, ensure_ascii=False)
+        self.conn.execute(
+            "INSERT OR IGNORE INTO entries (key, payload, created, next_attempt) VALUES (?, ?, ?, ?)",
+            (key, data, now, now),
+        )
+        # a resubmitted request that failed before (e.g. the person was not registered yet) runs again
+        self.conn.execute(
+            "UPDATE entries SET status = ?, payload = ?, attempts = 0, next_attempt = ? WHERE key = ? AND status = ?",
+            (PENDING, data, now, key, FAILED),
+        )
+        return self.conn.execute("SELECT id, status, code, result FROM entries WHERE key = ?", (key,)).fetchone()
+
+    def _append_many(self, items: list[tuple[str, dict]]) -> list[tuple[int, str, int | None, str | None]]:
+        self._open()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = [self._append(key, payload) for key, payload in items]
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _due(self) -> list[tuple[int, int, str]]:
+        self._open()
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                "SELECT id, attempts, payload FROM entries"
+                " WHERE status = ? AND next_attempt <= ? AND leased_until <= ? ORDER BY id LIMIT ?",
+                (PENDING, now, now, self.batch),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE entries SET leased_until = ? WHERE id = ?", [(now + CLAIM_LEASE, row[0]) for row in rows]
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _next_due(self) -> float | None:
+        row = self.conn.execute(
+            "SELECT MIN(MAX(next_attempt, leased_until)) FROM entries WHERE status = ?", (PENDING,)
+        ).fetchone()
+        return row[0]
+
+    def _finish(self, entry_id: int, status: str, code: int | None, body: dict):
+        self.conn.execute(
+            "UPDATE entries SET status = ?, code = ?, result = ?, error = ?, updated = ?, leased_until = 0 WHERE id = ?",
+            (status, code, json.dumps(body, ensure_ascii=False), body.get("error"), time.time(), entry_id),
+        )
+
+    def _delay(self, attempts: int) -> float:
+        return min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+
+    def _defer(self, entry_id: int, attempts: int, error: str, delay: float | None = None) -> float:
+        delay = self._delay(attempts) if delay is None else delay
+        self.conn.execute(
+            "UPDATE entries SET attempts = ?, next_attempt = ?, error = ?, updated = ?, leased_until = 0 WHERE id = ?",
+            (attempts, time.time() + delay, error, time.time(), entry_id),
+        )
+        return delay
+
+    def _release(self, entry_ids: list[int], not_before: float):
+        """Give back claimed entries that were not applied, due no earlier than ``not_before``.
+
+        Entries claimed behind one that hit a database outage become due with
+        it, so the drain still applies them in submission order.
+        """
+        self.conn.executemany(
+            "UPDATE entries SET leased_until = 0, next_attempt = MAX(next_attempt, ?) WHERE id = ?",
+            [(not_before, entry_id) for entry_id in entry_ids],
+        )
+
+    def _recover(self):
+        # a restart is a good moment to retry: backoff from the previous run no longer applies.
+        # Entries another worker holds a live lease on are being applied right now; leave them.
+        self._open()
+        now = time.time()
+        self.conn.execute(
+            "UPDATE entries SET next_attempt = ? WHERE status = ? AND leased_until <= ?", (now, PENDING, now)
+        )
+
+    def _close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _prune(self):
+        self.conn.execute("DELETE FROM entries WHERE status = ? AND updated < ?", (DONE, time.time() - self.retain))
+
+    def _counts(self) -> dict:
+        self._open()
+        counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM entries GROUP BY status").fetchall())
+        oldest = self.conn.execute("SELECT MIN(created) FROM entries WHERE status = ?", (PENDING,)).fetchone()[0]
+        failed = self.conn.execute(
+            "SELECT id, key, error, updated FROM entries WHERE status = ? ORDER BY id DESC LIMIT 20", (FAILED,)
+        ).fetchall()
+        return {
+            "pending": counts.get(PENDING, 0),
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "oldest_pending_age": time.time() - oldest if oldest else None,
+            "recent_failures": [{"id": i, "key": k, "error": e, "at": u} for i, k, e, u in failed],
+        }
+
+    # --- event loop ------------------------------------------------------
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self, apply: Apply, apply_many: ApplyMany | None = None):
+        """Open the journal and start draining it, including entries left from a previous run."""
+        self.apply = apply
+        self.apply_many = apply_many
+        await self._call(self._recover)
+        if self.task is None:
+            self.wake = asyncio.Event()
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Finish the entry being applied, if any, and close the journal; pending entries stay for the next start."""
+        if self.task is not None:
+            self.stopping = True
+            self.wake.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self.task), timeout)
+            except asyncio.TimeoutError:
+                print(f"Journal drain still busy after {timeout}s, cancelling it")
+                self.task.cancel()
+            except Exception:
+                pass
+            self.task = None
+        for entry_id in list(self.waiters):
+            self._resolve(entry_id, None)
+        await self._call(self._close)
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, key: str, payload: dict, mark: Mark | None = None) -> tuple[int, dict] | None:
+        """Journal ``payload`` and return its outcome, or ``None`` if it is still pending after ``wait``."""
+        return (await self.submit_many([(key, payload)], mark))[0]
+
+    async def submit_many(self, items: list[tuple[str, dict]],
+                          mark: Mark | None = None) -> list[tuple[int, dict] | None]:
+        """Journal ``(key, payload)`` pairs in one SQLite transaction and wait for their outcomes together."""
+        rows = await self._call(self._append_many, items)
+        outcomes: list[tuple[int, dict] | None] = [None] * len(rows)
+        # entry id -> future; the same key twice in one call is one entry
+        waiting: dict[int, asyncio.Future] = {}
+        for i, (entry_id, status, code, result) in enumerate(rows):
+            if status != PENDING:
+                outcomes[i] = code, json.loads(result)
+            elif entry_id not in waiting:
+                waiting[entry_id] = asyncio.get_running_loop().create_future()
+                self.waiters.setdefault(entry_id, []).append(waiting[entry_id])
+                if mark is not None:
+                    self.marks[entry_id] = mark
+        if not waiting or self.paused_until > time.time():
+            # nothing to wait for, or the drain is backing off from an outage: the entries are queued
+            for entry_id, future in waiting.items():
+                self.waiters[entry_id].remove(future)
+                if not self.waiters[entry_id]:
+                    del self.waiters[entry_id]
+                    self.marks.pop(entry_id, None)
+            return outcomes
+        self.wake.set()
+        try:
+            await asyncio.wait(list(waiting.values()), timeout=self.wait)
+        finally:
+            for entry_id, future in waiting.items():
+                futures = self.waiters.get(entry_id)
+                if futures and future in futures:
+                    futures.remove(future)
+                    if not futures:
+                        del self.waiters[entry_id]
+                if entry_id not in self.waiters:
+                    self.marks.pop(entry_id, None)
+        for i, (entry_id, status, _, _) in enumerate(rows):
+            future = waiting.get(entry_id)
+            if status == PENDING and future.done():
+                outcomes[i] = future.result()
+        return outcomes
+
+    def _resolve(self, entry_id: int, outcome: tuple[int, dict] | None):
+        for future in self.waiters.pop(entry_id, []):
+            if not future.done():
+                future.set_result(outcome)
+
+    async def _run(self):
+        last_prune = 0.0
+        while not self.stopping:
+            try:
+                if time.monotonic() - last_prune > 3600:
+                    await self._call(self._prune)
+                    last_prune = time.monotonic()
+                # cleared before looking, so a submit that lands meanwhile still wakes us
+                self.wake.clear()
+                entries = await self._call(self._due)
+                if not entries:
+                    next_due = await self._call(self._next_due)
+                    await self._sleep(60.0 if next_due is None else next_due - time.time())
+                    continue
+                if self.apply_many is not None and len(entries) > 1:
+                    batches = [entries]
+                else:
+                    batches = [[entry] for entry in entries]
+                applied, backoff = 0, 0.0
+                for batch in batches:
+                    if self.stopping:
+                        break
+                    backoff = await self._apply_batch(batch)
+                    applied += 1
+                    if backoff:
+                        break
+                rest = [entry[0] for batch in batches[applied:] for entry in batch]
+                if backoff:
+                    # the database is unreachable; later entries would fail the same way, so they
+                    # wait for the retry too (in order), and waiting callers learn their entries are queued
+                    self.paused_until = time.time() + backoff
+                    await self._call(self._release, rest, self.paused_until)
+                    for waiting in list(self.waiters):
+                        self._resolve(waiting, None)
+                    # submits during the pause do not wake us (they return queued); stop() still does
+                    self.wake.clear()
+                    await self._sleep(backoff)
+                    self.paused_until = 0.0
+                elif rest:
+                    await self._call(self._release, rest, 0.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.stopping:
+                    break
+                print(f"Journal drain error: {e}")
+                await asyncio.sleep(self.retry_base)
+
+    async def _sleep(self, timeout: float):
+        """Sleep until ``timeout`` passes or a new entry is submitted."""
+        try:
+            await asyncio.wait_for(self.wake.wait(), max(0.0, min(60.0, timeout)))
+        except asyncio.TimeoutError:
+            pass
+
+    def _batch_mark(self, entry_ids: list[int]) -> Mark | None:
+        marks = [self.marks[i] for i in entry_ids if i in self.marks]
+        if not marks:
+            return None
+        if len(marks) == 1:
+            return marks[0]
+
+        def mark(name: str, start: float) -> float:
+            for m in marks:
+                m(name, start)
+            return time.perf_counter()
+        return mark
+
+    async def _apply_batch(self, batch: list[tuple[int, int, str]]) -> float:
+        """Apply due entries; returns a backoff delay when the database could not be reached."""
+        entry_ids = [entry_id for entry_id, _, _ in batch]
+        payloads = [json.loads(payload) for _, _, payload in batch]
+        mark = self._batch_mark(entry_ids)
+        try:
+            if len(batch) == 1:
+                outcomes = [await self.apply(payloads[0], mark)]
+            else:
+                outcomes = await self.apply_many(payloads, mark)
+        except Exception as e:
+            self.retries += len(batch)
+            self.last_error = str(e)
+            # one delay for the whole batch keeps its entries in order
+            backoff = self._delay(batch[0][1] + 1)
+            for entry_id, attempts, _ in batch:
+                await self._call(self._defer, entry_id, attempts + 1, str(e), backoff)
+            return backoff
+        for (entry_id, attempts, _), (code, body) in zip(batch, outcomes):
+            await self._settle(entry_id, attempts + 1, code, body)
+        return 0.0
+
+    async def _settle(self, entry_id: int, attempts: int, code: int, body: dict):
+        if code < 300:
+            self.applied += 1
+            await self._call(self._finish, entry_id, DONE, code, body)
+            self._resolve(entry_id, (code, body))
+        elif code < 500 or attempts >= self.max_attempts:
+            self.failures += 1
+            self.last_error = body.get("error")
+            print(f"Journal entry {entry_id} failed permanently: {body.get('error')}")
+            await self._call(self._finish, entry_id, FAILED, code, body)
+            self._resolve(entry_id, (code, body))
+        else:
+            self.retries += 1
+            self.last_error = body.get("error")
+            await self._call(self._defer, entry_id, attempts, str(body.get("error")))
+
+    async def metrics(self) -> dict:
+        counts = await self._call(self._counts)
+        return {
+            **counts,
+            "running": self.running,
+            "applied": self.applied,
+            "retries": self.retries,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+visit_journal = WriteBehindJournal(
+    resource_path(config("JOURNAL.PATH", "data/journal.sqlite3")),
+    wait=config("JOURNAL.WAIT", 3),
+    retry_base=config("JOURNAL.RETRY_BASE", 1),
+    retry_max=config("JOURNAL.RETRY_MAX", 60),
+    max_attempts=config("JOURNAL.MAX_ATTEMPTS", 10),
+    retain=config("JOURNAL.RETAIN_DAYS", 7) * 86400,
+)
@@ -0,0 +1,82 @@
+import threading
+from contextlib import contextmanager
+from src.config.config import get as config
+from src.lib.state_broker import MODE_BROKER, SHARED_MODE
+
+LOCK_NAME = "smartq_visitno"
+
+
+class VisitNumberAllocator:
+    """Hands out JHCIS visit numbers from an in-memory counter.
+
+    The counter is seeded from ``MAX(visitno)`` once and then incremented under
+    a lock, so concurrent kiosk registrations never read the same value and no
+    aggregate runs per visit. Other JHCIS clients may still insert visits
+    directly; callers that hit a duplicate key call ``resync`` and retry.
+
+    With ``shared`` (several server workers) an in-process counter would hand
+    every worker the same numbers, so each allocation reads ``MAX(visitno) + 1``
+    instead, under a MySQL named lock that ``allocating`` holds until the
+    insert is committed.
+    """
+
+    def __init__(self, shared: bool = False, lock_timeout: float = 10.0):
+        self.shared = shared
+        self.lock_timeout = float(lock_timeout)
+        self.lock = threading.Lock()
+        self.next_value: int | None = None
+        self.allocated = 0
+        self.resyncs = 0
+        self.lock_waits = 0
+
+    def _seed(self, conn) -> int:
+        with conn.cursor() as cur:
+            # a locking read sees rows other workers committed after this transaction began
+            cur.execute("SELECT COALESCE(MAX(visitno), 0) + 1 FROM visit" + (" FOR UPDATE" if self.shared else ""))
+            return int(cur.fetchone()[0])
+
+    @contextmanager
+    def allocating(self, conn):
+        """Wrap allocation, insert and commit; across workers only one holds it at a time."""
+        if not self.shared:
+            yield
+            return
+        with conn.cursor() as cur:
+            cur.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, self.lock_timeout))
+            if cur.fetchone()[0] != 1:
+                self.lock_waits += 1
+                raise TimeoutError(f"visit number lock not granted within {self.lock_timeout}s")
+        try:
+            yield
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+
+    def next(self, conn) -> int:
+        return self.block(conn, 1)
+
+    def block(self, conn, count: int) -> int:
+        """Reserve ``count`` consecutive numbers and return the first one."""
+        with self.lock:
+            if self.shared or self.next_value is None:
+                self.next_value = self._seed(conn)
+            first = self.next_value
+            self.next_value += count
+            self.allocated += count
+            return first
+
+    def resync(self, conn):
+        with self.lock:
+            seeded = self._seed(conn)
+            self.next_value = max(seeded, self.next_value or 0)
+            self.resyncs += 1
+
+    def metrics(self) -> dict:
+        return {"next": self.next_value, "allocated": self.allocated, "resyncs": self.resyncs,
+                "shared": self.shared, "lock_waits": self.lock_waits}
+
+
+visit_numbers = VisitNumberAllocator(
+    shared=SHARED_MODE == MODE_BROKER,
+    lock_timeout=config("DB.VISITNO_LOCK_TIMEOUT", 10),
+)
@@ -0,0 +1,72 @@
+from src.config.config import get as config
+
+PREFIX = "คิวหมายเลข"
+DIRECTION = "กรุณาไปที่"
+DEFAULT_COUNTER = "ช่องบริการ"
+
+MODE_FULL = "full"
+MODE_SEGMENTED = "segmented"
+
+
+def strip_id3(audio: bytes) -> bytes:
+    """Return only the MPEG frames of an MP3, dropping ID3v2/ID3v1 tags."""
+    start = 0
+    if audio[:3] == b"ID3" and len(audio) >= 10:
+        size = (audio[6] << 21) | (audio[7] << 14) | (audio[8] << 7) | audio[9]
+        start = 10 + size + (10 if audio[5] & 0x10 else 0)
+    end = len(audio)
+    if end - start >= 128 and audio[end - 128:end - 125] == b"TAG":
+        end -= 128
+    return audio[start:end]
+
+
+def join_mp3(fragments: list[bytes]) -> bytes:
+    if len(fragments) == 1:
+        return fragments[0]
+    return b"".join(strip_id3(f) for f in fragments)
+
+
+class Announcer:
+    """Builds the text fragments spoken for a called queue item.
+
+    In ``full`` mode the announcement is one sentence synthesized as a whole.
+    In ``segmented`` mode it is split into fixed phrases (prefix, number,
+    direction, counter) that are pre-rendered once and cached, plus the
+    patient name; the MP3 frames are concatenated at dequeue time.
+    """
+
+    def __init__(self, mode: str = MODE_FULL, prerender_numbers: int = 0):
+        self.mode = mode if mode in (MODE_FULL, MODE_SEGMENTED) else MODE_FULL
+        self.prerender_numbers = int(prerender_numbers)
+
+    def sentence(self, item: dict) -> str:
+        return f"{PREFIX} {item['Q_number']} {item['FULLNAME_TH']} {DIRECTION} {item.get('counter') or DEFAULT_COUNTER}"
+
+    def fragments(self, item: dict) -> list[str]:
+        if self.mode != MODE_SEGMENTED:
+            return [self.sentence(item)]
+        return [
+            PREFIX,
+            str(item["Q_number"]),
+            str(item["FULLNAME_TH"]),
+            DIRECTION,
+            str(item.get("counter") or DEFAULT_COUNTER),
+        ]
+
+    def fixed_fragments(self, services: list[dict]) -> list[str]:
+        if self.mode != MODE_SEGMENTED:
+            return []
+        texts = [PREFIX, DIRECTION, DEFAULT_COUNTER]
+        for s in services:
+            for c in s.get("counters", []):
+                name = c.get("name")
+                if name and name not in texts:
+                    texts.append(name)
+        texts.extend(str(n) for n in range(1, self.prerender_numbers + 1))
+        return texts
+
+
+announcer = Announcer(
+    mode=config("TTS.MODE", MODE_FULL),
+    prerender_numbers=config("TTS.PRERENDER_NUMBERS", 200),
+)
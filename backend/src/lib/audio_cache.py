@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from src.config.config import get as config, resource_path
+from src.lib.tts_engines import engine_chain
+
+
+def cache_key(text: str, lang: str, voice: str = "") -> str:
+    return hashlib.sha256(f"{voice}\0{lang}\0{text}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Content-addressed MP3 cache with an in-memory LRU in front of a disk LRU.
+
+    Files are named by ``cache_key(text, lang, voice)`` so entries survive
+    restarts; disk recency is kept in file mtimes and rebuilt from them on
+    startup. The cache holds audio of one ``voice`` (TTS engine) only, and
+    changing the configured engine starts from an empty set of keys.
+    """
+
+    def __init__(self, directory: str, memory_bytes: int, disk_bytes: int, voice: str = ""):
+        self.directory = directory
+        self.voice = voice
+        self.memory_bytes = int(memory_bytes)
+        self.disk_bytes = int(disk_bytes)
+        self.memory: OrderedDict[str, bytes] = OrderedDict()
+        self.memory_size = 0
+        self.disk: OrderedDict[str, int] = OrderedDict()
+        self.disk_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def _load_index(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".mp3"):
+                    continue
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, name[:-4], st.st_size))
+        except OSError as e:
+            print(f"Audio cache disabled on disk: {e}")
+            self.disk_bytes = 0
+            return
+        for _, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_size += size
+        with self.lock:
+            self._evict_disk()
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.memory_bytes:
+            return
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_size -= len(old)
+        self.memory[key] = audio
+        self.memory_size += len(audio)
+        while self.memory_size > self.memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+
+    def _evict_disk(self):
+        while self.disk_size > self.disk_bytes and self.disk:
+            key, size = self.disk.popitem(last=False)
+            self.disk_size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, text: str, lang: str) -> bytes | None:
+        key = cache_key(text, lang, self.voice)
+        with self.lock:
+            audio = self.memory.get(key)
+            if audio is not None:
+                self.memory.move_to_end(key)
+                if key in self.disk:
+                    self.disk.move_to_end(key)
+                self.hits += 1
+                return audio
+            if key not in self.disk:
+                self.misses += 1
+                return None
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+            os.utime(self._path(key))
+        except OSError:
+            with self.lock:
+                size = self.disk.pop(key, None)
+                if size is not None:
+                    self.disk_size -= size
+                self.misses += 1
+            return None
+        with self.lock:
+            if key in self.disk:
+                self.disk.move_to_end(key)
+            self._remember(key, audio)
+            self.hits += 1
+        return audio
+
+    def put(self, text: str, lang: str, audio: bytes):
+        key = cache_key(text, lang, self.voice)
+        with self.lock:
+            self._remember(key, audio)
+            if self.disk_bytes <= 0 or len(audio) > self.disk_bytes:
+                return
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(audio)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Audio cache write error: {e}")
+            return
+        with self.lock:
+            old = self.disk.pop(key, None)
+            if old is not None:
+                self.disk_size -= old
+            self.disk[key] = len(audio)
+            self.disk_size += len(audio)
+            self._evict_disk()
+
+    def metrics(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory_size,
+            "memory_budget": self.memory_bytes,
+            "disk_entries": len(self.disk),
+            "disk_bytes": self.disk_size,
+            "disk_budget": self.disk_bytes,
+        }
+
+
+audio_cache = AudioCache(
+    resource_path(config("TTS.CACHE_DIR", "cache/tts")),
+    memory_bytes=config("TTS.CACHE_MEMORY_BYTES", 16 * 1024 * 1024),
+    disk_bytes=config("TTS.CACHE_DISK_BYTES", 256 * 1024 * 1024),
+    voice=engine_chain.primary,
+)
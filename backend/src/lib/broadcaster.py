@@ -0,0 +1,129 @@
+import asyncio
+import json
+from typing import Callable
+from fastapi import WebSocket
+from src.config.config import get as config
+
+POLICY_DROP = "drop"
+POLICY_DISCONNECT = "disconnect"
+
+
+def encode(message: dict) -> str:
+    # Same encoding as WebSocket.send_json, done once per broadcast instead of per socket.
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class Encoded(str):
+    """A message serialized ahead of time; frames embed it without re-encoding."""
+
+    def __new__(cls, message: dict):
+        obj = super().__new__(cls, encode(message))
+        obj.type = message.get("type")
+        return obj
+
+    @classmethod
+    def raw(cls, text: str, message_type: str | None) -> "Encoded":
+        """Wrap JSON that was already encoded elsewhere, e.g. by another worker."""
+        obj = str.__new__(cls, text)
+        obj.type = message_type
+        return obj
+
+
+def message_type(message: dict | Encoded) -> str | None:
+    return message.type if isinstance(message, Encoded) else message.get("type")
+
+
+# Messages that carry a full view of some state; within one flush only the
+# last one of each type matters.
+REPLACEABLE = {"status", "history", "current"}
+
+
+def coalesce(pending: list[tuple[dict | Encoded, str | None]]) -> list[tuple[dict | Encoded, str | None]]:
+    seen = set()
+    kept = []
+    for message, role in reversed(pending):
+        key = (message_type(message), role)
+        if key[0] in REPLACEABLE:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append((message, role))
+    kept.reverse()
+    return kept
+
+
+def encode_batch(messages: list[dict | Encoded]) -> str:
+    parts = [m if isinstance(m, Encoded) else encode(m) for m in messages]
+    if len(parts) == 1:
+        return parts[0]
+    return '{"type":"batch","messages":[' + ",".join(parts) + "]}"
+
+
+class Connection:
+    """A WebSocket with its own bounded outbox drained by a dedicated send task.
+
+    A slow client only fills its own outbox. When the outbox is full the
+    ``drop`` policy discards the oldest pending frame and the ``disconnect``
+    policy closes the socket.
+    """
+
+    def __init__(self, ws: WebSocket, role: str, on_close: Callable[["Connection"], None],
+                 max_pending: int = 256, policy: str = POLICY_DROP):
+        self.ws = ws
+        self.role = role
+        self.on_close = on_close
+        self.policy = policy if policy in (POLICY_DROP, POLICY_DISCONNECT) else POLICY_DROP
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=max(1, int(max_pending)))
+        self.dropped = 0
+        self.closed = False
+        self.task = asyncio.create_task(self._pump())
+
+    def offer(self, data: str) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.outbox.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            pass
+        if self.policy == POLICY_DISCONNECT:
+            print(f"Closing slow WebSocket client ({self.role}): {self.outbox.qsize()} frames pending")
+            self.close()
+            return False
+        self.outbox.get_nowait()
+        self.dropped += 1
+        self.outbox.put_nowait(data)
+        return True
+
+    async def _pump(self):
+        try:
+            while True:
+                data = await self.outbox.get()
+                await self.ws.send_text(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+        try:
+            asyncio.create_task(self._close_socket())
+        except RuntimeError:
+            pass
+        self.on_close(self)
+
+    async def _close_socket(self):
+        try:
+            await self.ws.close()
+        except Exception:
+            pass
+
+
+SEND_QUEUE = config("WS.SEND_QUEUE", 256)
+SLOW_CONSUMER = config("WS.SLOW_CONSUMER", POLICY_DROP)
+COALESCE_WINDOW = config("WS.COALESCE_MS", 5) / 1000
@@ -0,0 +1,125 @@
+from typing import Callable, Iterable
+
+
+class CounterDispatcher:
+    """Chooses the counter that should see the next patient.
+
+    An idle counter always wins, the one idle longest first. When every
+    counter is busy the patient goes to the counter expected to be free
+    soonest: its average service time (an EWMA of call-to-finish durations)
+    minus how long it has been serving its current patient. Ties rotate
+    round-robin from ``next_index``.
+
+    Every change takes the event's own timestamp rather than reading the
+    clock, so replaying the queue log or applying broker events on another
+    worker makes the same choices.
+    """
+
+    def __init__(self, counters: Iterable[str], alpha: float = 0.2, default_service_time: float = 300.0):
+        self.names = list(counters)
+        self.alpha = float(alpha)
+        self.default_service_time = float(default_service_time)
+        self.counters: dict[str, dict] = {name: self._new() for name in self.names}
+        self.next_index = 0
+        # told about every finished service: (counter, seconds)
+        self.on_service: Callable[[str, float], None] | None = None
+
+    @staticmethod
+    def _new() -> dict:
+        return {"serving": None, "since": None, "idle_since": None, "avg": None, "served": 0}
+
+    def _counter(self, name: str) -> dict:
+        # counters posted by callers but missing from the config are tracked, never dispatched to
+        return self.counters.setdefault(name, self._new())
+
+    def _finish(self, name: str, state: dict, at: float | None):
+        if state["serving"] is not None and at is not None and state["since"] is not None and at >= state["since"]:
+            took = at - state["since"]
+            state["avg"] = took if state["avg"] is None else state["avg"] + self.alpha * (took - state["avg"])
+            state["served"] += 1
+            if self.on_service is not None:
+                self.on_service(name, took)
+        state["serving"] = None
+        state["since"] = None
+        state["idle_since"] = at
+
+    def assign(self, counter: str, qnum: int, at: float | None):
+        """``counter`` called ``qnum``; calling the next patient also finishes the previous one."""
+        state = self._counter(counter)
+        if state["serving"] is not None:
+            self._finish(counter, state, at)
+        state["serving"] = qnum
+        state["since"] = at
+
+    def release(self, qnum: int | None = None, counter: str | None = None, at: float | None = None) -> str | None:
+        """Mark the counter serving ``qnum`` (or ``counter`` itself) idle; returns its name."""
+        for name, state in self.counters.items():
+            if (counter is not None and name == counter) or (qnum is not None and state["serving"] == qnum):
+                self._finish(name, state, at)
+                return name
+        return None
+
+    def reset(self):
+        """Nobody is being served any more (a new service day); service-time averages are kept."""
+        for state in self.counters.values():
+            state["serving"] = None
+            state["since"] = None
+            state["idle_since"] = None
+
+    def average(self, name: str) -> float:
+        avg = self.counters[name]["avg"]
+        return self.default_service_time if avg is None else avg
+
+    def call_gap(self) -> float:
+        """Seconds between calls when every configured counter is busy, from their averages."""
+        if not self.names:
+            return self.default_service_time
+        return 1.0 / sum(1.0 / max(1.0, self.average(name)) for name in self.names)
+
+    def expected_free_in(self, name: str, at: float | None) -> float:
+        state = self.counters[name]
+        if state["serving"] is None:
+            return 0.0
+        elapsed = at - state["since"] if at is not None and state["since"] is not None else 0.0
+        return max(0.0, self.average(name) - elapsed)
+
+    def loads(self, at: float | None) -> dict[str, dict]:
+        return {
+            name: {
+                "serving": self.counters[name]["serving"],
+                "expected_free_in": round(self.expected_free_in(name, at), 1),
+                "avg_service": round(self.average(name), 1),
+                "served": self.counters[name]["served"],
+            }
+            for name in self.names
+        }
+
+    def choose(self, at: float | None, commit: bool = True) -> dict | None:
+        """The dispatch decision for the next patient, or ``None`` without configured counters."""
+        if not self.names:
+            return None
+        start = self.next_index % len(self.names)
+        order = self.names[start:] + self.names[:start]
+        idle = [name for name in order if self.counters[name]["serving"] is None]
+        if idle:
+            # never-used counters first, then the longest idle; min() keeps rotation order on ties
+            pick = min(idle, key=lambda n: self.counters[n]["idle_since"] if self.counters[n]["idle_since"] is not None else float("-inf"))
+            reason = "idle"
+        else:
+            pick = min(order, key=lambda n: (self.expected_free_in(n, at), self.average(n)))
+            reason = "least_loaded"
+        if commit:
+            self.next_index = (self.names.index(pick) + 1) % len(self.names)
+        return {
+            "counter": pick,
+            "reason": reason,
+            "expected_wait": round(self.expected_free_in(pick, at), 1),
+        }
+
+    def to_state(self) -> dict:
+        return {"counters": {name: dict(state) for name, state in self.counters.items()}, "next_index": self.next_index}
+
+    def load_state(self, state: dict):
+        for name, saved in state.get("counters", {}).items():
+            self.counters[name] = {**self._new(), **saved}
+        self.next_index = state.get("next_index", 0)
@@ -1,11 +1,22 @@
-from getmac import get_mac_address
+import asyncio
 import socket
+import time
+from src.config.config import get as config
+
+try:
+    from getmac import get_mac_address
+except Exception:
+    get_mac_address = None
 
 def get_system_mac() -> str:
-    mac = get_mac_address()
+    mac = get_mac_address() if get_mac_address else None
     if mac:
         return mac.upper()
-    return "00-00-00-00-00-00"
+    try:
+        import uuid
+        return ":".join(f"{b:02X}" for b in uuid.getnode().to_bytes(6, "big"))
+    except Exception:
+        return "00-00-00-00-00-00"
 
 def get_local_ipv4():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -18,7 +29,72 @@ def get_local_ipv4():
         s.close()
     return ip
 
+def get_public_ipv4(url: str, timeout: float = 5) -> str:
+    import requests
+    return requests.get(url, timeout=timeout).text.strip()
+
+
+class HostIdentity:
+    """Addresses of this server, resolved off the request path.
+
+    ``start()`` resolves once and then refreshes every ``ttl`` seconds in the
+    background; request handlers read the cached values and never wait on
+    the network.
+    """
+
+    def __init__(self, public_ip_url: str, ttl: float = 600, timeout: float = 5):
+        self.public_ip_url = public_ip_url
+        self.ttl = float(ttl)
+        self.timeout = float(timeout)
+        self.local_ipv4 = get_local_ipv4()
+        self._public_ipv4: str | None = None
+        self.resolved_at: float | None = None
+        self.task: asyncio.Task | None = None
+
+    def _fallback_ipv4(self) -> str:
+        try:
+            return socket.gethostbyname(socket.gethostname())
+        except Exception:
+            return ""
+
+    def refresh(self):
+        self.local_ipv4 = get_local_ipv4()
+        try:
+            self._public_ipv4 = get_public_ipv4(self.public_ip_url, self.timeout)
+            self.resolved_at = time.time()
+        except Exception as e:
+            print(f"Public IPv4 lookup failed: {e}")
+            if self._public_ipv4 is None:
+                self._public_ipv4 = self._fallback_ipv4()
+
+    @property
+    def public_ipv4(self) -> str:
+        if self._public_ipv4 is None:
+            return self._fallback_ipv4()
+        return self._public_ipv4
+
+    async def _run(self):
+        while True:
+            await asyncio.to_thread(self.refresh)
+            await asyncio.sleep(self.ttl)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+host_identity = HostIdentity(
+    config("HOST.PUBLIC_IP_URL", "https://api.ipify.org?format=text"),
+    ttl=config("HOST.IP_REFRESH", 600),
+    timeout=config("HOST.IP_TIMEOUT", 5),
+)
+
 
 if __name__ == "__main__":
     print("System MAC Address:", get_system_mac())
-    print("System IP Address:", get_local_ipv4())
\ No newline at end of file
+    print("System IP Address:", get_local_ipv4())
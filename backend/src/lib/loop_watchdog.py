@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from src.config.config import get as config, resource_path
+from src.lib.metrics import SLOW_BUCKETS, registry
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+loop_lag_seconds = registry.histogram(
+    "smartq_event_loop_lag_seconds", "How late the event loop ran the watchdog heartbeat.", (),
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+loop_stalls_total = registry.counter(
+    "smartq_event_loop_stalls_total", "Times the event loop was blocked longer than the threshold.", ("route", "site"),
+)
+loop_stall_seconds = registry.histogram(
+    "smartq_event_loop_stall_seconds", "How long each detected event-loop stall lasted.", (), SLOW_BUCKETS,
+)
+
+
+class LoopWatchdog:
+    """Detects blocking calls on the event loop and records where they happened.
+
+    A heartbeat task sleeps ``interval`` seconds at a time and notes how late
+    it wakes up. A monitor thread checks the heartbeat; once it is more than
+    ``threshold`` seconds overdue the loop is blocked, and the thread samples
+    the loop thread's stack until the heartbeat returns. Each stall is then
+    logged with its duration, the request handler it happened in, the
+    innermost frame in our own code (the call site to fix) and the stack, and
+    counted in ``/metrics``. All of that runs on the monitor thread, so
+    reporting a stall never blocks the loop again.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, log_path: str | None = None,
+                 keep: int = 50):
+        self.interval = float(interval)
+        self.threshold = float(threshold)
+        self.log_path = log_path
+        self.recent: deque = deque(maxlen=keep)
+        # (filename, function) of each route handler -> "METHOD /path"
+        self.endpoints: dict[tuple, str] = {}
+        self.loop_thread: int | None = None
+        self.beat = 0.0
+        self.lag = 0.0
+        self.task: asyncio.Task | None = None
+        self.thread: threading.Thread | None = None
+        self.stopping = threading.Event()
+        self.stalls = 0
+        self.max_lag = 0.0
+
+    def register_routes(self, routes, prefix: str = ""):
+        """Let stalls name the route whose handler was running."""
+        for route in routes:
+            included = getattr(route, "original_router", None)
+            if included is not None:
+                # newer FastAPI keeps an included router whole instead of copying its routes
+                self.register_routes(included.routes, prefix + route.include_context.prefix)
+                continue
+            endpoint = getattr(route, "endpoint", None)
+            code = getattr(endpoint, "__code__", None)
+            if code is not None:
+                methods = ",".join(sorted(getattr(route, "methods", None) or ["WS"]))
+                self.endpoints[(code.co_filename, code.co_name)] = f"{methods} {prefix}{route.path}"
+
+    async def _heartbeat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self.interval)
+            loop_lag_seconds.observe(lag)
+            # lag first: the monitor reads it once it sees the new beat
+            self.lag = lag
+            self.beat = now
+
+    def _sample(self) -> list | None:
+        frame = sys._current_frames().get(self.loop_thread)
+        if frame is None:
+            return None
+        return traceback.extract_stack(frame)
+
+    def _describe(self, stack) -> tuple[str, str, str]:
+        route, handler = "-", 0
+        site = blocking = f"{stack[-1].filename}:{stack[-1].lineno} in {stack[-1].name}" if stack else "-"
+        for i, entry in enumerate(stack):
+            label = self.endpoints.get((entry.filename, entry.name))
+            if label:
+                route, handler = label, i
+        # the call site is our innermost frame below the handler, not a middleware wrapping it
+        for entry in reversed(stack[handler:]):
+            if entry.filename.startswith(SRC_DIR):
+                site = f"{os.path.relpath(entry.filename, os.path.dirname(SRC_DIR))}:{entry.lineno} in {entry.name}"
+                break
+        return route, site, blocking
+
+    def _monitor(self):
+        check = min(self.interval, self.threshold) / 2
+        stalled_since = None
+        samples: Counter = Counter()
+        first = None
+        while not self.stopping.wait(check):
+            beat = self.beat
+            overdue = time.monotonic() - beat - self.interval
+            if overdue > self.threshold:
+                stack = self._sample()
+                if stack:
+                    if first is None:
+                        first = stack
+                        stalled_since = beat
+                    samples[self._describe(stack)] += 1
+            elif first is not None and beat != stalled_since:
+                # the loop is running again; the heartbeat measured how long it was held
+                self._report(self.lag, first, samples)
+                first = None
+                samples = Counter()
+
+    def _report(self, duration: float, first, samples: Counter):
+        (route, site, blocking), _ = samples.most_common(1)[0]
+        self.stalls += 1
+        self.max_lag = max(self.max_lag, duration)
+        loop_stalls_total.labels(route, site).inc()
+        loop_stall_seconds.observe(duration)
+        record = {
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "pid": os.getpid(),
+            "duration": round(duration, 3),
+            "route": route,
+            "site": site,
+            "blocking_in": blocking,
+            "samples": sum(samples.values()),
+            "stack": [f"{e.filename}:{e.lineno} in {e.name}" for e in first],
+        }
+        self.recent.append(record)
+        print(f"Event loop blocked for {duration * 1000:.0f}ms in {route} at {site} (innermost: {blocking})")
+        if self.log_path:
+            try:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Writing loop stall log failed: {e}")
+
+    def start(self):
+        """Start watching the running event loop."""
+        if self.task is not None:
+            return
+        self.loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        self.stopping.clear()
+        self.task = asyncio.create_task(self._heartbeat())
+        self.thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def metrics(self) -> dict:
+        return {
+            "running": self.task is not None,
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "stalls": self.stalls,
+            "max_stall": round(self.max_lag, 3),
+            "recent": list(self.recent),
+        }
+
+
+loop_watchdog = LoopWatchdog(
+    interval=config("LOOP_WATCHDOG.INTERVAL", 0.1),
+    threshold=config("LOOP_WATCHDOG.THRESHOLD", 0.25),
+    log_path=resource_path(config("LOOP_WATCHDOG.LOG", "data/loop_stalls.log")),
+)
@@ -0,0 +1,211 @@
+import asyncio
+import glob
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable
+from src.config.config import get as config, resource_path
+
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+
+WAL_RE = re.compile(r"wal\.(\d+)\.jsonl$")
+
+
+def _dump(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+class QueueStore:
+    """Write-ahead log plus periodic snapshots for in-memory queue state.
+
+    Every mutation is appended to ``wal.<generation>.jsonl`` as one JSON line
+    before it is applied. Every ``snapshot_every`` events the full state is
+    captured, the log switches to the next generation and the snapshot is
+    written in the background; log files older than the newest snapshot are
+    then deleted. Recovery loads ``snapshot.json`` and replays the log files
+    from its generation onwards.
+
+    Lines are flushed to the OS on every append, so a crashed process loses
+    nothing. With ``fsync="interval"`` the file is fsynced every
+    ``fsync_interval`` seconds (a power cut can lose up to that much);
+    ``"always"`` fsyncs each event.
+    """
+
+    def __init__(self, directory: str, snapshot_every: int = 1000, fsync: str = FSYNC_INTERVAL,
+                 fsync_interval: float = 1.0):
+        self.directory = directory
+        self.snapshot_every = max(1, int(snapshot_every))
+        self.fsync = fsync
+        self.fsync_interval = float(fsync_interval)
+        self.capture: Callable[[], dict] | None = None
+        self.generation = 0
+        self.wal = None
+        self.dirty = False
+        self.since_snapshot = 0
+        self.writing: asyncio.Future | None = None
+        self.write_lock = threading.Lock()
+        self.written_generation = -1
+        self.task: asyncio.Task | None = None
+        self.events = 0
+        self.snapshots = 0
+        self.last_recovery: dict | None = None
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, "snapshot.json")
+
+    def _wal_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"wal.{generation}.jsonl")
+
+    def _wal_generations(self) -> list[int]:
+        found = []
+        for path in glob.glob(os.path.join(self.directory, "wal.*.jsonl")):
+            m = WAL_RE.search(path)
+            if m:
+                found.append(int(m.group(1)))
+        return sorted(found)
+
+    def recover(self, apply_snapshot: Callable[[dict], None], apply_event: Callable[[str | None, str, dict], None]):
+        """Load the latest snapshot and replay the log; call once at startup, before ``open``."""
+        start = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        generation = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            generation = snapshot.get("generation", 0)
+            apply_snapshot(snapshot.get("state", {}))
+        replayed = 0
+        generations = [g for g in self._wal_generations() if g >= generation]
+        for g in generations:
+            with open(self._wal_path(g), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # torn last line from a crash mid-write
+                        continue
+                    apply_event(event.get("s"), event["op"], event.get("d", {}))
+                    replayed += 1
+        self.generation = max([generation] + generations)
+        self.since_snapshot = replayed
+        self.last_recovery = {
+            "seconds": time.perf_counter() - start,
+            "snapshot_generation": generation,
+            "replayed": replayed,
+        }
+        return self.last_recovery
+
+    def open(self, capture: Callable[[], dict]):
+        self.capture = capture
+        os.makedirs(self.directory, exist_ok=True)
+        self.wal = open(self._wal_path(self.generation), "a", encoding="utf-8")
+
+    def record(self, service: str | None, op: str, data: dict):
+        if self.wal is None:
+            return
+        if self.since_snapshot >= self.snapshot_every and self.writing is None:
+            # before writing: the captured state must not include this not-yet-applied event
+            self.snapshot()
+        self.wal.write(_dump({"s": service, "op": op, "d": data}) + "\n")
+        self.wal.flush()
+        if self.fsync == FSYNC_ALWAYS:
+            os.fsync(self.wal.fileno())
+        else:
+            self.dirty = True
+        self.events += 1
+        self.since_snapshot += 1
+
+    def _rotate(self) -> tuple[int, dict]:
+        # capture and switch logs together, so the snapshot plus the new log is exactly the state
+        state = self.capture()
+        self.wal.close()
+        self.generation += 1
+        self.wal = open(self._wal_path(self.generation), "a", encoding="utf-8")
+        self.dirty = False
+        self.since_snapshot = 0
+        return self.generation, state
+
+    def _write_snapshot(self, generation: int, state: dict):
+        with self.write_lock:
+            if generation <= self.written_generation:
+                # a newer snapshot already landed (e.g. the final one at shutdown)
+                return
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(_dump({"generation": generation, "written_at": time.time(), "state": state}))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+            self.written_generation = generation
+            for g in self._wal_generations():
+                if g < generation:
+                    try:
+                        os.remove(self._wal_path(g))
+                    except OSError:
+                        pass
+            self.snapshots += 1
+
+    def snapshot(self):
+        """Start a snapshot; the file is written off the event loop when one is running."""
+        if self.wal is None or self.capture is None:
+            return
+        generation, state = self._rotate()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_snapshot(generation, state)
+            return
+        self.writing = loop.run_in_executor(None, self._write_snapshot, generation, state)
+        self.writing.add_done_callback(self._written)
+
+    def _written(self, future: asyncio.Future):
+        self.writing = None
+        if future.exception():
+            print(f"Queue snapshot failed: {future.exception()}")
+
+    async def _sync(self):
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            if self.dirty and self.wal is not None:
+                self.dirty = False
+                try:
+                    await asyncio.to_thread(os.fsync, self.wal.fileno())
+                except (OSError, ValueError) as e:
+                    print(f"Queue WAL fsync failed: {e}")
+
+    def start(self):
+        if self.task is None and self.fsync != FSYNC_ALWAYS:
+            self.task = asyncio.create_task(self._sync())
+
+    def close(self):
+        """Write a final snapshot so the next start has nothing to replay."""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.wal is None:
+            return
+        generation, state = self._rotate()
+        self._write_snapshot(generation, state)
+        self.wal.close()
+        self.wal = None
+
+    def metrics(self) -> dict:
+        return {
+            "generation": self.generation,
+            "events": self.events,
+            "since_snapshot": self.since_snapshot,
+            "snapshots": self.snapshots,
+            "last_recovery": self.last_recovery,
+        }
+
+
+queue_store = QueueStore(
+    resource_path(config("QUEUE_STORE.DIR", "data/queue")),
+    snapshot_every=config("QUEUE_STORE.SNAPSHOT_EVERY", 1000),
+    fsync=config("QUEUE_STORE.FSYNC", FSYNC_INTERVAL),
+    fsync_interval=config("QUEUE_STORE.FSYNC_INTERVAL", 1.0),
+)
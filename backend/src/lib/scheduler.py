@@ -0,0 +1,147 @@
+import heapq
+import itertools
+from collections import deque
+from datetime import datetime
+from typing import Iterator
+
+
+class PriorityScheduler:
+    """Waiting queue that calls priority patients first without starving the rest.
+
+    Each priority class gets a head start in seconds (``boosts``, e.g.
+    ``{"urgent": 1800, "elderly": 600}``). A patient's rank is their arrival
+    time minus that head start, and the lowest rank is called next. Priority
+    patients therefore jump ahead of everyone who arrived less than their
+    head start before them, while someone who has waited longer still goes
+    first: waiting time is the aging that keeps low-priority patients from
+    being starved. Patients without a known class are called in arrival order.
+
+    A rank never changes once assigned, so the order depends only on the
+    sequence of operations. That keeps log replay and replicas on other
+    workers identical. Waiting patients are kept in a binary heap, so
+    ``push``, ``pop`` and ``remove`` cost O(log n): a removed patient is only
+    marked and skipped when it reaches the top, and marked entries are swept
+    out in bulk once they outnumber the live ones. ``push`` still reports
+    where the patient landed, so clients can be sent a positioned insert: a
+    rank is never later than its arrival, so everyone ranked behind a new
+    patient arrived within its head start, and counting them is a short walk
+    back from the newest arrival. The full call order is sorted out of the
+    heap when asked for and cached until the queue changes.
+    """
+
+    def __init__(self, boosts: dict[str, float] | None = None):
+        self.boosts = {name: max(0.0, float(seconds)) for name, seconds in (boosts or {}).items()}
+        # heap of [rank, seq, item]; item is None once the entry was removed
+        self.heap: list[list] = []
+        self.dead = 0
+        self.index: dict[int, list] = {}
+        self.seqs = itertools.count()
+        # (highest rank so far, entry) in push order, for counting who a push lands ahead of
+        self.pushed: deque[tuple[float, list]] = deque()
+        self.view: list[dict] | None = None
+        # arrival times never go backwards, so log order is queue order within a class
+        self.clock = float("-inf")
+
+    def classify(self, priority: str | None) -> str | None:
+        """The configured class called ``priority``, or ``None`` for normal order."""
+        return priority if priority in self.boosts else None
+
+    def _arrival(self, item: dict) -> float:
+        try:
+            at = datetime.fromisoformat(item["timestamp"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            at = self.clock
+        self.clock = max(self.clock, at)
+        return self.clock
+
+    def push(self, item: dict, rank: float | None = None) -> int:
+        """Add ``item``; returns its position in call order (0 is called next)."""
+        if rank is None and self.boosts:
+            rank = self._arrival(item) - self.boosts.get(item.get("priority"), 0.0)
+        elif rank is None or not self.boosts:
+            # plain FIFO service: arrival order is all that matters
+            rank = 0.0
+        entry = [rank, next(self.seqs), item]
+        # entries compare by (rank, seq); seq is unique, so items are never compared
+        behind = 0
+        for highest, e in reversed(self.pushed):
+            # nobody pushed before this point ranks after the new entry
+            if highest <= rank:
+                break
+            if e[2] is not None and e[0] > rank:
+                behind += 1
+        self.pushed.append((max(rank, self.pushed[-1][0]) if self.pushed else rank, entry))
+        heapq.heappush(self.heap, entry)
+        self.index[item.get("Q_number")] = entry
+        self.view = None
+        return len(self) - 1 - behind
+
+    def pop(self) -> dict | None:
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            item, entry[2] = entry[2], None
+            if item is None:
+                self.dead -= 1
+                continue
+            if self.index.get(item.get("Q_number")) is entry:
+                del self.index[item.get("Q_number")]
+            while self.pushed and self.pushed[0][1][2] is None:
+                self.pushed.popleft()
+            self.view = None
+            return item
+        return None
+
+    def _ahead(self, entry: list) -> int:
+        return sum(1 for e in self.heap if e[2] is not None and e < entry)
+
+    def position(self, qnum: int) -> int | None:
+        entry = self.index.get(qnum)
+        return None if entry is None else self._ahead(entry)
+
+    def get(self, qnum: int) -> dict | None:
+        entry = self.index.get(qnum)
+        return entry[2] if entry else None
+
+    def remove(self, qnum: int) -> dict | None:
+        entry = self.index.pop(qnum, None)
+        if entry is None:
+            return None
+        item, entry[2] = entry[2], None
+        self.dead += 1
+        self.view = None
+        if self.dead > 64 and self.dead * 2 > len(self.heap):
+            self.heap = [e for e in self.heap if e[2] is not None]
+            heapq.heapify(self.heap)
+            self.dead = 0
+        return item
+
+    def clear(self):
+        self.heap.clear()
+        self.dead = 0
+        self.index.clear()
+        self.pushed.clear()
+        self.view = None
+
+    def __len__(self) -> int:
+        return len(self.heap) - self.dead
+
+    def __iter__(self) -> Iterator[dict]:
+        """Waiting patients in the order they will be called."""
+        if self.view is None:
+            self.view = [e[2] for e in sorted(self.heap) if e[2] is not None]
+        return iter(self.view)
+
+    def to_state(self) -> dict:
+        entries = sorted((e for e in self.heap if e[2] is not None), key=lambda e: e[1])
+        return {
+            "items": [dict(e[2]) for e in entries],
+            "ranks": [e[0] for e in entries],
+            "clock": self.clock if self.clock != float("-inf") else None,
+        }
+
+    def load_state(self, items: list[dict], ranks: list[float] | None = None, clock: float | None = None):
+        """Rebuild from ``to_state``; items without a saved rank are ranked again in list order."""
+        self.clear()
+        self.clock = float("-inf") if clock is None else clock
+        for i, item in enumerate(items):
+            self.push(item, ranks[i] if ranks and i < len(ranks) else None)
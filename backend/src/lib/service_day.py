@@ -0,0 +1,86 @@
+import gzip
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from src.config.config import get as config, resource_path
+
+DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class ServiceCalendar:
+    """Maps wall-clock time to the clinic's service day.
+
+    The day changes at ``rollover`` ("HH:MM", local time) rather than at
+    midnight, so a clinic that closes late can keep its numbering until then.
+    """
+
+    def __init__(self, timezone: str = "Asia/Bangkok", rollover: str = "00:00"):
+        self.tz = ZoneInfo(timezone)
+        hours, minutes = (int(x) for x in rollover.split(":"))
+        self.offset = timedelta(hours=hours, minutes=minutes)
+
+    def now(self) -> datetime:
+        return datetime.now(self.tz)
+
+    def today(self, now: datetime | None = None) -> str:
+        return ((now or self.now()) - self.offset).date().isoformat()
+
+    def seconds_until_rollover(self, now: datetime | None = None) -> float:
+        now = now or self.now()
+        boundary = datetime.combine((now - self.offset).date(), datetime.min.time(), self.tz) + self.offset
+        if boundary <= now:
+            boundary += timedelta(days=1)
+        return (boundary - now).total_seconds()
+
+
+class DayArchive:
+    """Finished service days, one gzipped JSON file per service and day."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, day: str, service: str) -> str:
+        return os.path.join(self.directory, f"{day}.{service}.json.gz")
+
+    def write(self, day: str, service: str, state: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        record = {
+            "day": day,
+            "service": service,
+            "issued": state.get("counter_number", 0),
+            "served": state.get("history", []),
+            "current": state.get("current"),
+            "unserved": state.get("queue", []),
+        }
+        # every worker archives the day it rolls over; a temp file per process keeps
+        # concurrent writers from truncating each other's half-written file
+        tmp = f"{self.path(day, service)}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(record, f, separators=(",", ":"), ensure_ascii=False)
+        os.replace(tmp, self.path(day, service))
+
+    def read(self, day: str, service: str) -> dict | None:
+        if not DAY_RE.match(day):
+            return None
+        try:
+            with gzip.open(self.path(day, service), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def days(self, service: str) -> list[str]:
+        suffix = f".{service}.json.gz"
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(n[:-len(suffix)] for n in names if n.endswith(suffix))
+
+
+service_calendar = ServiceCalendar(
+    config("QUEUE_DAY.TIMEZONE", "Asia/Bangkok"),
+    config("QUEUE_DAY.ROLLOVER", "00:00"),
+)
+day_archive = DayArchive(resource_path(config("QUEUE_DAY.ARCHIVE_DIR", "data/archive")))
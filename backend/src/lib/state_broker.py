@@ -0,0 +1,309 @@
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Callable
+from src.config.config import get as config, resource_path
+
+# Events that only fan out to workers; everything else changes queue state
+# and is applied, logged and replicated in broker order.
+RELAY_OPS = {"broadcast", "status", "audio"}
+
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+def _dump(obj) -> bytes:
+    return (json.dumps(obj, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def parse_address(address: str) -> tuple[str, Any]:
+    """``unix:/path/to.sock`` or ``host:port``."""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+async def open_connection(address: str):
+    kind, target = parse_address(address)
+    if kind == "unix":
+        return await asyncio.open_unix_connection(target, limit=STREAM_LIMIT)
+    return await asyncio.open_connection(*target, limit=STREAM_LIMIT)
+
+
+class StateBroker:
+    """Single authority for queue state shared by several server workers.
+
+    Workers send every queue mutation here. The broker gives it a sequence
+    number, applies it to its own copy of the state (which it persists with
+    the queue store), and sends it to every worker, the sender included. Each
+    worker applies events in that order, so all replicas stay identical and
+    the sender learns the result, e.g. the Q_number it was given. Broadcast,
+    status and audio events are relayed without being applied so every worker
+    can serve its own WebSocket clients.
+
+    Protocol: one JSON object per line.
+      worker -> broker  {"t": "hello"}
+                        {"t": "pub", "rid": n, "e": {"s": service, "op": op, "d": data}}
+      broker -> worker  {"t": "snapshot", "id": worker_id, "seq": n, "state": {...}}
+                        {"t": "ev", "seq": n, "origin": worker_id, "rid": n, "e": {...}}
+    """
+
+    def __init__(self, address: str, apply: Callable[[str | None, str, dict], Any],
+                 record: Callable[[str | None, str, dict], None], capture: Callable[[], dict]):
+        self.address = address
+        self.apply = apply
+        self.record = record
+        self.capture = capture
+        self.seq = 0
+        self.ids = itertools.count(1)
+        self.subscribers: dict[int, asyncio.StreamWriter] = {}
+        self.server: asyncio.AbstractServer | None = None
+        self.lock_file = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker_id = next(self.ids)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                msg = json.loads(line)
+                if msg.get("t") == "hello":
+                    writer.write(_dump({"t": "snapshot", "id": worker_id, "seq": self.seq, "state": self.capture()}))
+                    self.subscribers[worker_id] = writer
+                elif msg.get("t") == "pub":
+                    self._publish(worker_id, msg.get("rid"), msg["e"])
+        except (ConnectionError, ValueError) as e:
+            print(f"Shared-state worker {worker_id} dropped: {e}")
+        finally:
+            self.subscribers.pop(worker_id, None)
+            writer.close()
+
+    def _publish(self, origin: int, rid, event: dict):
+        if event["op"] not in RELAY_OPS:
+            self.record(event.get("s"), event["op"], event.get("d", {}))
+            try:
+                self.apply(event.get("s"), event["op"], event.get("d", {}))
+            except Exception as e:
+                print(f"Shared-state event {event.get('s')}/{event['op']} failed in broker: {e}")
+        self.seq += 1
+        frame = _dump({"t": "ev", "seq": self.seq, "origin": origin, "rid": rid, "e": event})
+        for writer in list(self.subscribers.values()):
+            # a worker that cannot keep up is disconnected and resyncs from a snapshot
+            if writer.transport.get_write_buffer_size() > STREAM_LIMIT:
+                writer.close()
+                continue
+            writer.write(frame)
+
+    async def serve(self):
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            import fcntl
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            # workers may spawn brokers concurrently; only the lock holder serves
+            self.lock_file = open(target + ".lock", "w")
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise RuntimeError(f"a state broker is already running for {target}")
+            if os.path.exists(target):
+                os.unlink(target)
+            self.server = await asyncio.start_unix_server(self._handle, target, limit=STREAM_LIMIT)
+        else:
+            self.server = await asyncio.start_server(self._handle, *target, limit=STREAM_LIMIT)
+        print(f"Shared-state broker listening on {self.address}")
+        async with self.server:
+            await self.server.serve_forever()
+
+
+class BrokerError(Exception):
+    pass
+
+
+class BrokerClient:
+    """A worker's connection to the ``StateBroker``.
+
+    ``on_snapshot(state)`` replaces local state on (re)connect and
+    ``on_event(service, op, data)`` applies each event in broker order; its
+    return value answers the ``publish`` call that sent the event.
+    """
+
+    def __init__(self, address: str, on_snapshot: Callable[[dict], None],
+                 on_event: Callable[[str | None, str, dict], Any], spawn: bool = True,
+                 connect_timeout: float = 10.0, request_timeout: float = 10.0):
+        self.address = address
+        self.on_snapshot = on_snapshot
+        self.on_event = on_event
+        self.spawn = spawn
+        self.connect_timeout = float(connect_timeout)
+        self.request_timeout = float(request_timeout)
+        self.rids = itertools.count(1)
+        self.pending: dict[int, asyncio.Future] = {}
+        self.writer: asyncio.StreamWriter | None = None
+        self.id: int | None = None
+        self.seq = 0
+        self.task: asyncio.Task | None = None
+        self.reconnects = 0
+
+    def _spawn_broker(self):
+        if getattr(sys, "frozen", False):
+            # the bundled executable is the server itself; it cannot be told to run the broker module
+            print(f"Cannot start the shared-state broker from a frozen build; run it separately on {self.address}")
+            return
+        print(f"Starting shared-state broker on {self.address}, output in {SHARED_LOG}")
+        os.makedirs(os.path.dirname(SHARED_LOG) or ".", exist_ok=True)
+        with open(SHARED_LOG, "ab") as log:
+            subprocess.Popen(
+                [sys.executable, "-m", "src.lib.state_broker"],
+                cwd=resource_path(""), start_new_session=True,
+                stdout=log, stderr=subprocess.STDOUT,
+            )
+
+    async def _open(self) -> asyncio.StreamReader:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.connect_timeout
+        spawned = False
+        while True:
+            try:
+                reader, writer = await open_connection(self.address)
+                break
+            except (ConnectionError, FileNotFoundError, OSError):
+                if self.spawn and not spawned:
+                    self._spawn_broker()
+                    spawned = True
+                if loop.time() > deadline:
+                    raise BrokerError(f"shared-state broker not reachable at {self.address}")
+                await asyncio.sleep(0.2)
+        writer.write(_dump({"t": "hello"}))
+        await writer.drain()
+        snapshot = json.loads(await reader.readline())
+        self.id = snapshot["id"]
+        self.seq = snapshot["seq"]
+        self.on_snapshot(snapshot["state"])
+        self.writer = writer
+        return reader
+
+    async def connect(self):
+        reader = await self._open()
+        self.task = asyncio.create_task(self._run(reader))
+
+    async def _run(self, reader: asyncio.StreamReader):
+        while True:
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        raise ConnectionError("broker closed the connection")
+                    self._dispatch(json.loads(line))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Shared-state connection lost: {e}")
+            self.writer = None
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(BrokerError("shared-state broker connection lost"))
+            self.pending.clear()
+            while True:
+                try:
+                    reader = await self._open()
+                    self.reconnects += 1
+                    break
+                except BrokerError as e:
+                    print(f"Shared-state reconnect failed: {e}")
+
+    def _dispatch(self, msg: dict):
+        self.seq = msg["seq"]
+        event = msg["e"]
+        mine = msg.get("origin") == self.id and msg.get("rid") in self.pending
+        try:
+            result = self.on_event(event.get("s"), event["op"], event.get("d", {}))
+        except Exception as e:
+            if mine:
+                self.pending.pop(msg["rid"]).set_exception(e)
+            else:
+                print(f"Shared-state event {event.get('s')}/{event['op']} failed: {e}")
+            return
+        if mine:
+            future = self.pending.pop(msg["rid"])
+            if not future.done():
+                future.set_result(result)
+
+    def send(self, service: str | None, op: str, data: dict) -> int:
+        """Publish without waiting for the echo; returns the request id."""
+        if self.writer is None:
+            raise BrokerError("not connected to the shared-state broker")
+        rid = next(self.rids)
+        self.writer.write(_dump({"t": "pub", "rid": rid, "e": {"s": service, "op": op, "d": data}}))
+        return rid
+
+    async def publish(self, service: str | None, op: str, data: dict):
+        """Publish an event and return what applying it locally returned."""
+        future = asyncio.get_running_loop().create_future()
+        rid = self.send(service, op, data)
+        self.pending[rid] = future
+        try:
+            return await asyncio.wait_for(future, self.request_timeout)
+        finally:
+            self.pending.pop(rid, None)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def metrics(self) -> dict:
+        return {"address": self.address, "worker_id": self.id, "seq": self.seq,
+                "connected": self.writer is not None, "reconnects": self.reconnects,
+                "in_flight": len(self.pending)}
+
+
+MODE_LOCAL = "local"
+MODE_BROKER = "broker"
+
+SHARED_MODE = os.environ.get("SMARTQ_SHARED_STATE") or config("SHARED_STATE.MODE", MODE_LOCAL)
+def _resolve(address: str) -> str:
+    # relative socket paths live next to the config, like the other data files
+    if address.startswith("unix:") and not os.path.isabs(address[len("unix:"):]):
+        return "unix:" + resource_path(address[len("unix:"):])
+    return address
+
+
+SHARED_ADDRESS = _resolve(config("SHARED_STATE.ADDRESS", "unix:data/state.sock"))
+SHARED_SPAWN = config("SHARED_STATE.SPAWN", True)
+SHARED_LOG = resource_path(config("SHARED_STATE.LOG", "data/state_broker.log"))
+
+
+async def _serve():
+    import signal
+    from src.router.queue import apply_event, capture_state, restore_queues, queue_store
+
+    restore_queues()
+    broker = StateBroker(SHARED_ADDRESS, apply_event, queue_store.record, capture_state)
+    task = asyncio.create_task(broker.serve())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        queue_store.close()
+
+
+if __name__ == "__main__":
+    # Run the broker: python -m src.lib.state_broker
+    try:
+        asyncio.run(_serve())
+    except RuntimeError as e:
+        print(e)
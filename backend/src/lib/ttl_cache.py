@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+MISSING = object()
+
+
+class TTLCache:
+    """Bounded key/value cache whose entries expire after a time-to-live.
+
+    Falsy values ("not found" answers) can be given their own, usually
+    shorter, ``negative_ttl`` so a record created elsewhere shows up soon
+    without every lookup for an unknown key reaching the database.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float | None = None, max_entries: int = 10000):
+        self.ttl = float(ttl)
+        self.negative_ttl = self.ttl if negative_ttl is None else float(negative_ttl)
+        self.max_entries = max(1, int(max_entries))
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default=MISSING):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        ttl = self.ttl if value else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, load: Callable[[], Any]):
+        """Return the cached value, awaiting ``load()`` and caching its result on a miss."""
+        value = self.get(key)
+        if value is MISSING:
+            value = await load()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, key: Hashable = MISSING):
+        """Drop one key, or every entry when no key is given."""
+        with self.lock:
+            if key is MISSING:
+                self.invalidations += len(self.entries)
+                self.entries.clear()
+            elif self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
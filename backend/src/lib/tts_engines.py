@@ -0,0 +1,204 @@
+import io
+import shutil
+import subprocess
+import threading
+import time
+from src.config.config import get as config
+from src.lib.metrics import SLOW_BUCKETS, registry
+
+tts_engine_seconds = registry.histogram(
+    "smartq_tts_synthesis_seconds", "Time one TTS engine took to synthesize a fragment.",
+    ("engine", "outcome"), SLOW_BUCKETS,
+)
+
+
+class TTSEngine:
+    name = "base"
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = float(timeout)
+
+    def available(self) -> bool:
+        return True
+
+    def limit(self, timeout: float | None) -> float:
+        """This engine's own timeout, shortened to what is left of the caller's."""
+        return self.timeout if timeout is None else max(0.0, min(self.timeout, timeout))
+
+    def synthesize(self, text: str, lang: str, timeout: float | None = None) -> bytes:
+        raise NotImplementedError
+
+
+class GTTSEngine(TTSEngine):
+    """Google Translate TTS; needs network access."""
+
+    name = "gtts"
+
+    def available(self) -> bool:
+        try:
+            import gtts  # noqa: F401
+            return True
+        except Exception:
+            return False
+
+    def synthesize(self, text: str, lang: str, timeout: float | None = None) -> bytes:
+        from gtts import gTTS
+        limit = self.limit(timeout)
+        deadline = time.monotonic() + limit
+        tts = gTTS(text=text, lang=lang, timeout=limit)
+        fp = io.BytesIO()
+        # long text is sent as several requests; each one only gets the time that is left,
+        # so a slow network cannot hold the synthesis thread past the deadline
+        for part in tts.stream():
+            fp.write(part)
+            tts.timeout = deadline - time.monotonic()
+            if tts.timeout <= 0:
+                raise TimeoutError(f"gTTS took longer than {limit:.1f}s")
+        return fp.getvalue()
+
+
+class EspeakEngine(TTSEngine):
+    """Local espeak-ng voice, encoded to MP3 with ffmpeg so it mixes with other engines."""
+
+    name = "espeak"
+
+    def __init__(self, timeout: float = 5.0):
+        super().__init__(timeout)
+        self.espeak = shutil.which("espeak-ng") or shutil.which("espeak")
+        self.ffmpeg = shutil.which("ffmpeg")
+
+    def available(self) -> bool:
+        return bool(self.espeak and self.ffmpeg)
+
+    def synthesize(self, text: str, lang: str, timeout: float | None = None) -> bytes:
+        if not self.available():
+            raise RuntimeError("espeak-ng and ffmpeg are required for the espeak engine")
+        deadline = time.monotonic() + self.limit(timeout)
+        # subprocess.run kills the child when its timeout expires
+        wav = subprocess.run(
+            [self.espeak, "-v", lang, "--stdout", text],
+            capture_output=True, timeout=max(0.0, deadline - time.monotonic()), check=True,
+        ).stdout
+        return subprocess.run(
+            [self.ffmpeg, "-loglevel", "error", "-f", "wav", "-i", "pipe:0", "-f", "mp3", "pipe:1"],
+            input=wav, capture_output=True, timeout=max(0.0, deadline - time.monotonic()), check=True,
+        ).stdout
+
+
+ENGINES = {
+    GTTSEngine.name: GTTSEngine,
+    EspeakEngine.name: EspeakEngine,
+}
+
+
+class EngineHealth:
+    def __init__(self):
+        self.failures = 0
+        self.down_until = 0.0
+        self.successes = 0
+        self.errors = 0
+        self.last_error: str | None = None
+        self.last_latency: float | None = None
+
+
+class EngineChain:
+    """Tries engines in configured order, skipping ones marked unhealthy.
+
+    An engine that fails ``failure_threshold`` times in a row is taken out of
+    rotation for ``cooldown`` seconds. If every engine is cooling down the
+    chain still tries them all rather than dropping the announcement.
+    """
+
+    def __init__(self, engines: list[TTSEngine], failure_threshold: int = 2, cooldown: float = 60.0):
+        self.engines = engines
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown = float(cooldown)
+        self.health = {e.name: EngineHealth() for e in engines}
+        self.lock = threading.Lock()
+
+    @property
+    def primary(self) -> str:
+        """The configured voice; audio from any other engine is a stand-in while it is down."""
+        return self.engines[0].name
+
+    def _ordered(self, only: str | None = None) -> list[TTSEngine]:
+        if only is not None:
+            return [e for e in self.engines if e.name == only]
+        now = time.monotonic()
+        usable = [e for e in self.engines if e.available()] or list(self.engines)
+        healthy = [e for e in usable if self.health[e.name].down_until <= now]
+        return healthy or usable
+
+    def synthesize(self, text: str, lang: str, deadline: float | None = None) -> bytes:
+        return self.render(text, lang, deadline)[0]
+
+    def render(self, text: str, lang: str, deadline: float | None = None,
+               only: str | None = None) -> tuple[bytes, str]:
+        """Audio and the name of the engine that made it, from the first engine that succeeds.
+
+        ``deadline`` is a ``time.monotonic()`` value; ``only`` restricts the
+        chain to one engine.
+        """
+        last_error: Exception | None = None
+        for engine in self._ordered(only):
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                raise TimeoutError(f"TTS deadline passed before trying {engine.name}; last error: {last_error}")
+            health = self.health[engine.name]
+            start = time.perf_counter()
+            try:
+                audio = engine.synthesize(text, lang, timeout)
+            except Exception as e:
+                tts_engine_seconds.labels(engine.name, "error").observe(time.perf_counter() - start)
+                last_error = e
+                with self.lock:
+                    health.errors += 1
+                    health.failures += 1
+                    health.last_error = str(e)
+                    if health.failures >= self.failure_threshold:
+                        health.down_until = time.monotonic() + self.cooldown
+                print(f"TTS engine {engine.name} failed: {e}")
+                continue
+            tts_engine_seconds.labels(engine.name, "ok").observe(time.perf_counter() - start)
+            with self.lock:
+                health.successes += 1
+                health.failures = 0
+                health.down_until = 0.0
+                health.last_latency = time.perf_counter() - start
+            return audio, engine.name
+        raise RuntimeError(f"all TTS engines failed: {last_error}")
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        return {
+            e.name: {
+                "available": e.available(),
+                "healthy": self.health[e.name].down_until <= now,
+                "successes": self.health[e.name].successes,
+                "errors": self.health[e.name].errors,
+                "last_error": self.health[e.name].last_error,
+                "last_latency": self.health[e.name].last_latency,
+            }
+            for e in self.engines
+        }
+
+
+def build_chain(names: list[str], timeout: float, failure_threshold: int, cooldown: float) -> EngineChain:
+    engines = []
+    for name in names:
+        cls = ENGINES.get(name)
+        if not cls:
+            print(f"Unknown TTS engine in config: {name}")
+            continue
+        engines.append(cls(timeout=timeout))
+    if not engines:
+        engines.append(GTTSEngine(timeout=timeout))
+    return EngineChain(engines, failure_threshold=failure_threshold, cooldown=cooldown)
+
+
+engine_chain = build_chain(
+    config("TTS.ENGINES", ["gtts"]),
+    timeout=config("TTS.ENGINE_TIMEOUT", 5),
+    failure_threshold=config("TTS.FAILURE_THRESHOLD", 2),
+    cooldown=config("TTS.COOLDOWN", 60),
+)
@@ -0,0 +1,222 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable
+from src.config.config import get as config
+from src.lib.audio_cache import AudioCache, audio_cache
+from src.lib.announcer import join_mp3
+from src.lib.tts_engines import engine_chain
+from src.lib.metrics import SLOW_BUCKETS, registry
+
+tts_job_seconds = registry.histogram(
+    "smartq_tts_job_seconds", "Time to produce one announcement, cached fragments included.", (), SLOW_BUCKETS,
+)
+tts_queue_wait_seconds = registry.histogram(
+    "smartq_tts_queue_wait_seconds", "Time announcements waited for a free TTS thread.", (), SLOW_BUCKETS,
+)
+
+
+class TTSJob:
+    def __init__(self, texts: list[str], lang: str, on_done: Callable[[bytes], Awaitable[None]]):
+        self.texts = texts
+        self.lang = lang
+        self.on_done = on_done
+        self.created = time.monotonic()
+
+
+class TTSWorker:
+    """Runs speech synthesis on a thread pool fed by a bounded job queue.
+
+    Jobs are submitted from request handlers without awaiting synthesis; the
+    job's ``on_done`` coroutine is awaited on the event loop once audio is ready.
+    A job is a list of text fragments whose audio is concatenated in order;
+    each fragment is looked up in and stored to the cache on its own.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 32, timeout: float = 15.0, cache: AudioCache | None = None):
+        self.cache = cache
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.timeout = float(timeout)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tts")
+        self.jobs: asyncio.Queue | None = None
+        self.tasks: list[asyncio.Task] = []
+        # prerender runs and the like; held here so they are not garbage-collected and stop() cancels them
+        self.background: set[asyncio.Task] = set()
+        self.stopping = False
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def _ensure_started(self):
+        if self.jobs is not None:
+            return
+        self.jobs = asyncio.Queue(maxsize=self.max_queue)
+        self.tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    @property
+    def depth(self) -> int:
+        pending = self.jobs.qsize() if self.jobs is not None else 0
+        return pending + self.in_flight
+
+    def submit(self, texts: list[str], lang: str, on_done: Callable[[bytes], Awaitable[None]]) -> bool:
+        if self.stopping:
+            return False
+        self._ensure_started()
+        try:
+            self.jobs.put_nowait(TTSJob(texts, lang, on_done))
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            print(f"TTS queue full, dropping announcement: {' '.join(texts)}")
+            return False
+
+    async def announce(self, texts: list[str], lang: str, on_done: Callable[[bytes], Awaitable[None]]) -> bool:
+        if self.cache is not None:
+            parts = [self.cache.get(t, lang) for t in texts]
+            if all(p is not None for p in parts):
+                await on_done(join_mp3(parts))
+                return True
+        return self.submit(texts, lang, on_done)
+
+    def start_prerender(self, texts: list[str], lang: str) -> asyncio.Task | None:
+        """Run ``prerender`` in the background; ``stop`` cancels it."""
+        if self.stopping:
+            return None
+        task = asyncio.create_task(self.prerender(texts, lang))
+        self.background.add(task)
+        task.add_done_callback(self._background_done)
+        return task
+
+    def _background_done(self, task: asyncio.Task):
+        self.background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"TTS background task failed: {task.exception()}")
+
+    async def prerender(self, texts: list[str], lang: str):
+        """Synthesize uncached fragments one at a time so live jobs keep a free thread."""
+        if self.cache is None:
+            return
+        loop = asyncio.get_running_loop()
+        rendered = 0
+        for text in texts:
+            if self.stopping:
+                break
+            if self.cache.get(text, lang) is not None:
+                continue
+            try:
+                deadline = time.monotonic() + self.timeout
+                await asyncio.wait_for(
+                    loop.run_in_executor(self.executor, self._fragment, text, lang, deadline, engine_chain.primary),
+                    timeout=self.timeout,
+                )
+                rendered += 1
+            except Exception as e:
+                print(f"TTS prerender failed for {text!r}: {e}")
+        if rendered:
+            print(f"TTS prerendered {rendered} announcement fragments")
+
+    def _fragment(self, text: str, lang: str, deadline: float | None = None,
+                  only: str | None = None) -> tuple[bytes, str]:
+        """Audio for one fragment and the engine (voice) it is in."""
+        primary = engine_chain.primary
+        if self.cache is not None and only in (None, primary):
+            audio = self.cache.get(text, lang)
+            if audio is not None:
+                return audio, primary
+        audio, voice = engine_chain.render(text, lang, deadline, only)
+        # a fallback voice is only a stand-in while the configured engine is down; caching
+        # it would keep serving it after that engine recovers
+        if self.cache is not None and voice == primary:
+            self.cache.put(text, lang, audio)
+        return audio, voice
+
+    def _synthesize(self, texts: list[str], lang: str, deadline: float | None = None) -> bytes:
+        parts = [self._fragment(t, lang, deadline) for t in texts]
+        voices = {voice for _, voice in parts}
+        if len(voices) > 1:
+            # cached fragments mixed with fallback ones: say the whole announcement in the fallback voice
+            fallback = next(voice for _, voice in parts if voice != engine_chain.primary)
+            for i, text in enumerate(texts):
+                if parts[i][1] != fallback:
+                    try:
+                        parts[i] = self._fragment(text, lang, deadline, only=fallback)
+                    except Exception as e:
+                        print(f"TTS could not re-voice {text!r} with {fallback}: {e}")
+        return join_mp3([audio for audio, _ in parts])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.jobs.get()
+            self.in_flight += 1
+            start = time.monotonic()
+            tts_queue_wait_seconds.observe(start - job.created)
+            try:
+                # the engines stop at the deadline themselves, so a timed-out job frees its thread;
+                # wait_for only stops waiting for it
+                audio = await asyncio.wait_for(
+                    loop.run_in_executor(self.executor, self._synthesize, job.texts, job.lang, start + self.timeout),
+                    timeout=self.timeout,
+                )
+                tts_job_seconds.observe(time.monotonic() - start)
+            except (asyncio.TimeoutError, TimeoutError):
+                self.timeouts += 1
+                print(f"TTS job timed out after {self.timeout}s: {' '.join(job.texts)}")
+                continue
+            except Exception as e:
+                self.failed += 1
+                print(f"TTS synthesis error: {e}")
+                continue
+            finally:
+                self.in_flight -= 1
+                self.jobs.task_done()
+            self.completed += 1
+            try:
+                await job.on_done(audio)
+            except Exception as e:
+                print(f"TTS callback error: {e}")
+
+    async def stop(self):
+        """Drop queued jobs, cancel prerendering and wait briefly for the synthesis threads to finish."""
+        self.stopping = True
+        for task in self.tasks + list(self.background):
+            task.cancel()
+        await asyncio.gather(*self.tasks, *self.background, return_exceptions=True)
+        self.tasks = []
+        self.jobs = None
+        await asyncio.to_thread(self.executor.shutdown, True, cancel_futures=True)
+
+    def metrics(self) -> dict:
+        return {
+            "depth": self.depth,
+            "queued": self.jobs.qsize() if self.jobs is not None else 0,
+            "in_flight": self.in_flight,
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "cache": self.cache.metrics() if self.cache is not None else None,
+            "engines": engine_chain.metrics(),
+        }
+
+
+tts_worker = TTSWorker(
+    workers=config("TTS.WORKERS", 2),
+    max_queue=config("TTS.QUEUE_SIZE", 32),
+    timeout=config("TTS.TIMEOUT", 15),
+    cache=audio_cache,
+)
+
+registry.gauge("smartq_tts_queue_depth", "Announcements queued or being synthesized.",
+               collect=lambda: {(): tts_worker.depth})
+registry.counter("smartq_tts_jobs_total", "Announcement jobs by outcome.", ("outcome",), collect=lambda: {
+    ("completed",): tts_worker.completed,
+    ("failed",): tts_worker.failed,
+    ("timeout",): tts_worker.timeouts,
+    ("rejected",): tts_worker.rejected,
+})
@@ -0,0 +1,178 @@
+import math
+from typing import Iterable
+
+
+class P2Quantile:
+    """Streaming estimate of one quantile in O(1) time and memory (the P² algorithm).
+
+    Five markers track the minimum, the target quantile, the maximum and the
+    points halfway between; each observation nudges them towards their ideal
+    positions with a parabolic fit, so no samples are kept.
+    """
+
+    def __init__(self, p: float):
+        self.p = float(p)
+        self.heights: list[float] = []
+        self.positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.desired = [1.0, 1 + 2 * self.p, 1 + 4 * self.p, 3 + 2 * self.p, 5.0]
+        self.increments = [0.0, self.p / 2, self.p, (1 + self.p) / 2, 1.0]
+
+    def add(self, x: float):
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1.0 if d > 0 else -1.0
+                height = self._parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + int(d)] - q[i]) / (n[i + int(d)] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def _parabolic(self, i: int, d: float) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> float | None:
+        q = self.heights
+        if not q:
+            return None
+        if len(q) < 5:
+            # too few samples for the markers: nearest rank
+            return q[min(len(q) - 1, max(0, math.ceil(self.p * len(q)) - 1))]
+        return q[2]
+
+    def to_state(self) -> dict:
+        return {"q": list(self.heights), "n": list(self.positions), "d": list(self.desired)}
+
+    def load_state(self, state: dict):
+        self.heights = list(state.get("q", []))
+        self.positions = list(state.get("n", self.positions))
+        self.desired = list(state.get("d", self.desired))
+
+
+class StreamStats:
+    """Count, EWMA and a few streaming quantiles of one kind of duration."""
+
+    def __init__(self, alpha: float = 0.2, quantiles: Iterable[float] = (0.5, 0.9)):
+        self.alpha = float(alpha)
+        self.count = 0
+        self.ewma: float | None = None
+        self.quantiles = {p: P2Quantile(p) for p in quantiles}
+
+    def add(self, x: float):
+        self.count += 1
+        self.ewma = x if self.ewma is None else self.ewma + self.alpha * (x - self.ewma)
+        for q in self.quantiles.values():
+            q.add(x)
+
+    def summary(self) -> dict:
+        out = {"count": self.count, "ewma": None if self.ewma is None else round(self.ewma, 1)}
+        for p, q in self.quantiles.items():
+            value = q.value()
+            out[f"p{round(p * 100)}"] = None if value is None else round(value, 1)
+        return out
+
+    def to_state(self) -> dict:
+        return {"count": self.count, "ewma": self.ewma,
+                "quantiles": {str(p): q.to_state() for p, q in self.quantiles.items()}}
+
+    def load_state(self, state: dict):
+        self.count = state.get("count", 0)
+        self.ewma = state.get("ewma")
+        for p, q in self.quantiles.items():
+            saved = state.get("quantiles", {}).get(str(p))
+            if saved:
+                q.load_state(saved)
+
+
+class WaitEstimator:
+    """Online wait-time statistics for one service.
+
+    Fed from queue events as they are applied: how long each patient
+    waited between enqueue and call, the gap between consecutive calls
+    while patients were waiting (how fast the service as a whole works
+    through its queue) and each counter's service time. The patient at
+    position k can expect to wait about k call gaps.
+    """
+
+    def __init__(self, alpha: float = 0.2, max_gap: float = 3600.0):
+        self.alpha = float(alpha)
+        self.max_gap = float(max_gap)
+        self.wait = StreamStats(alpha)
+        self.gap = StreamStats(alpha)
+        self.counters: dict[str, StreamStats] = {}
+        self.last_call: float | None = None
+
+    def called(self, at: float | None, enqueued_at: float | None, backlogged: bool):
+        """A patient was called; ``backlogged`` says whether others were waiting since the last call."""
+        if at is None:
+            return
+        if enqueued_at is not None and at >= enqueued_at:
+            self.wait.add(at - enqueued_at)
+        if backlogged and self.last_call is not None and 0 <= at - self.last_call <= self.max_gap:
+            # gaps spanning an empty queue or a long break say nothing about throughput
+            self.gap.add(at - self.last_call)
+        self.last_call = at
+
+    def served(self, counter: str, took: float):
+        stats = self.counters.get(counter)
+        if stats is None:
+            stats = self.counters[counter] = StreamStats(self.alpha)
+        stats.add(took)
+
+    def new_day(self):
+        self.last_call = None
+
+    def call_gap(self, fallback: float) -> float:
+        return fallback if self.gap.ewma is None else self.gap.ewma
+
+    def positions(self, count: int, fallback_gap: float) -> list[float]:
+        gap = self.call_gap(fallback_gap)
+        return [round(gap * k, 1) for k in range(1, count + 1)]
+
+    def summary(self) -> dict:
+        return {
+            "wait": self.wait.summary(),
+            "call_gap": self.gap.summary(),
+            "counters": {name: s.summary() for name, s in self.counters.items()},
+        }
+
+    def to_state(self) -> dict:
+        return {
+            "wait": self.wait.to_state(),
+            "gap": self.gap.to_state(),
+            "counters": {name: s.to_state() for name, s in self.counters.items()},
+            "last_call": self.last_call,
+        }
+
+    def load_state(self, state: dict):
+        self.wait.load_state(state.get("wait", {}))
+        self.gap.load_state(state.get("gap", {}))
+        self.counters = {}
+        for name, saved in state.get("counters", {}).items():
+            self.counters[name] = StreamStats(self.alpha)
+            self.counters[name].load_state(saved)
+        self.last_call = state.get("last_call")
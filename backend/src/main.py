@@ -1,27 +1,21 @@
 import os
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from src.router.jhcis import jhcis_router
-from src.router.queue import queue_router
+from src.router.jhcis import jhcis_router, apply_journaled_visit, apply_journaled_visits
+from src.router.queue import queue_router, prerender_announcements, start_queue_state, stop_queue_state
+from src.database.database import db
+from src.database.journal import visit_journal
+from src.lib.tts_worker import tts_worker
 from src.config.config import get , resource_path
-
-try:
-    from src.lib.infosystem import get_system_mac
-except Exception:
-    def get_system_mac():
-        try:
-            import uuid
-            mac_int = uuid.getnode()
-            mac = mac_int.to_bytes(6, "big")
-            return ":".join(f"{b:02X}" for b in mac)
-        except Exception:
-            return "00:00:00:00:00:00"
+from src.lib.infosystem import get_system_mac, host_identity
+from src.lib.metrics import CONTENT_TYPE, RequestMetrics, registry
+from src.lib.loop_watchdog import loop_watchdog
 import json
 import urllib.request
-import socket
 import base64
 import sys
+from contextlib import asynccontextmanager
 
 SECURE_API = "https://lock-software-api.unknowkubbrother.net"
 
@@ -49,18 +43,7 @@ def image_to_data_uri(path: str, mime_type: str = "image/png") -> str:
         encoded = base64.b64encode(image_file.read()).decode("utf-8")
     return f"data:{mime_type};base64,{encoded}"
 
-def get_local_ipv4():
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    try:
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-    except Exception:
-        ip = "127.0.0.1"
-    finally:
-        s.close()
-    return ip
-
-ip = get_local_ipv4()
+ip = host_identity.local_ipv4
 
 GREEN = "\033[92m"
 CYAN = "\033[96m"
@@ -78,7 +61,26 @@ else:
     print("No assets folder found.")
 
 
-app = FastAPI(title="SmartQ Voice Backend", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if get("LOOP_WATCHDOG.ENABLED", True):
+        # started first so blocking work during startup is caught as well
+        loop_watchdog.start()
+    await start_queue_state()
+    host_identity.start()
+    await db.open()
+    await visit_journal.start(apply_journaled_visit, apply_journaled_visits)
+    await prerender_announcements()
+    yield
+    # reverse order of startup: the journal may still be applying a visit through the pool
+    await visit_journal.stop()
+    await tts_worker.stop()
+    await db.close()
+    host_identity.stop()
+    await stop_queue_state()
+    loop_watchdog.stop()
+
+app = FastAPI(title="SmartQ Voice Backend", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -87,6 +89,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetrics)
 
 @app.get("/")
 def server():
@@ -96,6 +99,16 @@ def server():
         logging.exception("Unhandled error in root endpoint")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint; each worker process reports its own series."""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+@app.get("/loop/metrics")
+def loop_metrics():
+    """Event-loop stalls this worker's watchdog has seen, with where they came from."""
+    return loop_watchdog.metrics()
+
 @app.get("/api/initial")
 def initial():
     try:
@@ -137,6 +150,7 @@ def initial():
 
 app.include_router(queue_router, prefix="/api/queue")
 app.include_router(jhcis_router, prefix="/api/jhcis")
+loop_watchdog.register_routes(app.routes)
 
 if __name__ == "__main__":
     import uvicorn
@@ -178,10 +192,30 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"License validation error: {e}")
             print("Proceeding cautiously: starting server (validation could not be completed).")
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=port,
-        log_level="info",
-        reload=False
-    )
+    workers = int(get('SERVER.WORKERS', 1) or 1)
+    if workers > 1 and getattr(sys, "frozen", False):
+        print("\n===============================================================")
+        print(f"SmartQ server will not start: SERVER.WORKERS is {workers}, but this packaged build")
+        print("cannot run the shared-state broker that several workers need.")
+        print("Set SERVER.WORKERS to 1 in config.json, or run the server from source.")
+        print("===============================================================\n")
+        sys.exit(1)
+    if workers > 1:
+        # queue state must be shared between worker processes
+        os.environ.setdefault("SMARTQ_SHARED_STATE", "broker")
+        uvicorn.run(
+            "src.main:app",
+            host="0.0.0.0",
+            port=port,
+            log_level="info",
+            reload=False,
+            workers=workers
+        )
+    else:
+        uvicorn.run(
+            app,
+            host="0.0.0.0",
+            port=port,
+            log_level="info",
+            reload=False
+        )
@@ -3,6 +3,7 @@ from typing import Optional
 
 class EnqueueItem(BaseModel):
     FULLNAME_TH: str
+    priority: Optional[str] = None
 
 class InsertVisit(BaseModel):
     username: str
@@ -1,7 +1,14 @@
-from src.database.database import db_cursor, connection
-from fastapi import APIRouter, Response, status
-import numpy as np
-import socket
+from src.database.database import db, query_seconds
+from src.database.visitno import visit_numbers
+from src.database.journal import visit_journal
+from src.lib.infosystem import host_identity
+from src.lib.ttl_cache import TTLCache
+from src.config.config import get as config
+import hashlib
+import json
+import pymysql
+from fastapi import APIRouter, Header, Response, status
+import time
 from datetime import datetime
 from src.models.models import InsertVisit
 
@@ -40,6 +47,54 @@ def qDisClose() -> str:
 
 jhcis_router = APIRouter()
 
+VISITNO_RETRIES = 3
+LOOKUP_QUERY = """
+    SELECT u.pcucode, o.offid, p.pcucodeperson, p.pid
+    FROM user u
+    LEFT JOIN office o ON o.offid = u.pcucode
+    LEFT JOIN person p ON p.idcard = %s
+    WHERE u.username = %s
+    LIMIT 1
+"""
+ER_DUP_ENTRY = 1062
+VISIT_EXISTS_QUERY = """
+    SELECT visitno, visitdate FROM visit
+    WHERE pcucodeperson = %s AND pid = %s AND claimcode_nhso = %s AND datetime_claim = %s
+    LIMIT 1
+"""
+BULK_MAX_ITEMS = config("DB.BULK_MAX", 500)
+INSERT_VISIT_QUERY = """
+    INSERT INTO visit (
+        pcucode,
+        visitno,
+        visitdate,
+        pcucodeperson,
+        pid,
+        username,
+        flagservice,
+        dateupdate,
+        servicetype,
+        ipv4this,
+        receivepatient,
+        refer,
+        hiciauthen_nhso,
+        claimcode_nhso,
+        datetime_claim,
+        main_inscl,
+        sub_inscl,
+        qdiscloser
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Usernames change rarely and the kiosk asks for them on every screen load;
+# person lookups repeat for the same patient across check-in steps.
+usernames_cache = TTLCache(config("CACHE.USERNAMES_TTL", 300))
+person_cache = TTLCache(
+    config("CACHE.PERSON_TTL", 3600),
+    negative_ttl=config("CACHE.PERSON_NEGATIVE_TTL", 30),
+    max_entries=config("CACHE.PERSON_MAX_ENTRIES", 10000),
+)
+
 @jhcis_router.post("/login", status_code=status.HTTP_200_OK)
 async def login(payload: dict, response: Response):
     try:
@@ -47,8 +102,7 @@ async def login(payload: dict, response: Response):
         password = payload.get('password')
 
         query = "SELECT * FROM user WHERE username = %s AND password = %s"
-        db_cursor.execute(query, (username, password))
-        user = db_cursor.fetchone()
+        user = await db.fetchone(query, (username, password), statement="login")
 
         if user:
             response.status_code = status.HTTP_200_OK
@@ -61,120 +115,167 @@ async def login(payload: dict, response: Response):
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return {"status": 500, "message": "Internal server error"}
 
+async def load_usernames() -> bytes:
+    users = await db.fetchall("SELECT username FROM user", statement="usernames")
+    body = [str(u[0]) for u in users] if users else {"users": []}
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 @jhcis_router.get("/usernames")
 async def get_usernames(response: Response):
     try:
-        query = "SELECT username FROM user"
-        db_cursor.execute(query)
-        users = db_cursor.fetchall()
-        if not users:
-            return {"users": []}
-        arr = np.array(users)
-        usernames = arr.ravel().astype(str).tolist()
-        return usernames
+        body = await usernames_cache.get_or_load("usernames", load_usernames)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         print(f"Get usernames error: {e}")
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return {"status": 500, "message": "Internal server error"}
 
+async def person_exists(pid: str) -> bool:
+    count = (await db.fetchone("SELECT COUNT(*) FROM person WHERE idcard = %s", (pid,), statement="person_exists"))[0]
+    return count > 0
+
 @jhcis_router.get("/check_exist_person/{pid}")
 async def check_exist_person(pid: str, response: Response):
     try:
-        query = "SELECT COUNT(*) FROM person WHERE idcard = %s"
-        db_cursor.execute(query, (pid,))
-        count = db_cursor.fetchone()[0]
-        exists = count > 0
+        exists = await person_cache.get_or_load(pid, lambda: person_exists(pid))
         return {"exists": exists}
     except Exception as e:
         print(f"Check exist person error: {e}")
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return {"status": 500, "message": "Internal server error"}
 
-@jhcis_router.post("/insert_visit")
-async def insert_visit(payload: InsertVisit, response: Response):
+@jhcis_router.post("/cache/invalidate")
+async def invalidate_cache(payload: dict | None = None):
+    """Drop cached lookups after JHCIS data changed outside this server.
+
+    ``{"pid": "..."}`` drops one person, ``{"usernames": true}`` the user list;
+    an empty body clears everything.
+    """
     try:
-        username = payload.username
-        pid = payload.pid
-        claimType = payload.claimType
-        claimCode = payload.claimCode
-        datetime_claim = payload.datetime_claim
-        mainInscl = payload.mainInscl
-        subInscl = payload.subInscl
-
-        with connection.cursor() as db_cursor:
-            db_cursor.execute("SELECT pcucode FROM user WHERE username = %s", (username,))
-            user = db_cursor.fetchone()
-            if not user:
-                response.status_code = status.HTTP_404_NOT_FOUND
-                return {"error": "User not found"}
-            pcucode = user[0]
+        payload = payload or {}
+        if payload.get("pid"):
+            person_cache.invalidate(str(payload["pid"]))
+        if payload.get("usernames"):
+            usernames_cache.invalidate()
+        if not payload.get("pid") and not payload.get("usernames"):
+            person_cache.invalidate()
+            usernames_cache.invalidate()
+        return {"message": "Cache invalidated"}
+    except Exception as e:
+        return {"error": str(e)}
 
-            db_cursor.execute("SELECT offid FROM office WHERE offid = %s", (pcucode,))
-            office = db_cursor.fetchone()
-            if not office:
-                response.status_code = status.HTTP_404_NOT_FOUND
-                return {"error": f"Office with offid={pcucode} not found in 'office' table"}
+@jhcis_router.get("/cache/metrics")
+async def cache_metrics():
+    return {"usernames": usernames_cache.metrics(), "person": person_cache.metrics()}
 
-            db_cursor.execute("SELECT pcucodeperson, pid FROM person WHERE idcard = %s", (pid,))
-            person = db_cursor.fetchone()
-            if not person:
-                response.status_code = status.HTTP_404_NOT_FOUND
-                return {"error": "Person not found for this user"}
-            pcucodeperson, pid = person
+def visit_key(payload: InsertVisit) -> str:
+    """Idempotency key for a visit: the same claim scanned twice is one visit."""
+    parts = (payload.username, payload.pid, payload.claimType, payload.claimCode, payload.datetime_claim)
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
 
-            db_cursor.execute("SELECT COALESCE(MAX(visitno), 0) + 1 FROM visit")
-            visitno = db_cursor.fetchone()[0]
+def insert_visit_rows(conn, cursor, rows: list[list], renumber) -> list[list]:
+    """Insert visit ``rows``; returns the rows as inserted.
 
-            visitdate = datetime.now().strftime("%Y-%m-%d")
-            dateupdate = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    A duplicate visitno means another JHCIS client took the number: the
+    allocator is resynced, ``renumber(first_visitno)`` rebuilds the rows and
+    the insert is retried in a new transaction, up to ``VISITNO_RETRIES``
+    times. Other errors propagate with the transaction still open.
+    """
+    for attempt in range(VISITNO_RETRIES):
+        try:
+            cursor.executemany(INSERT_VISIT_QUERY, rows)
+            return rows
+        except pymysql.err.IntegrityError as e:
+            if e.args[0] != ER_DUP_ENTRY or attempt == VISITNO_RETRIES - 1:
+                raise
+            conn.rollback()
+            visit_numbers.resync(conn)
+            rows = renumber(visit_numbers.block(conn, len(rows)))
+            # the rollback ended the transaction; the retried insert needs its own
+            conn.begin()
 
-            try:
-                import requests
-                ipv4this = requests.get("https://api.ipify.org?format=text", timeout=5).text
-            except Exception:
-                try:
-                    ipv4this = socket.gethostbyname(socket.gethostname())
-                except Exception:
-                    ipv4this = ""
-
-            flagservice = "01"
-            servicetype = 1
-            receivepatient = "00"
-            refer = "00"
-            qdiscloser = qDisClose()
-
-            mainInscl = mainInscl if mainInscl not in (None, "") else None
-            subInscl = subInscl if subInscl not in (None, "") else None
-
-            insert_query = """
-                INSERT INTO visit (
-                    pcucode,
-                    visitno,
-                    visitdate,
-                    pcucodeperson,
-                    pid,
-                    username,
-                    flagservice,
-                    dateupdate,
-                    servicetype,
-                    ipv4this,
-                    receivepatient,
-                    refer,
-                    hiciauthen_nhso,
-                    claimcode_nhso,
-                    datetime_claim,
-                    main_inscl,
-                    sub_inscl,
-                    qdiscloser
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-
-            values = (
+def register_visit(conn, payload: InsertVisit, mark=None, idempotent: bool = False):
+    """Insert one JHCIS visit on ``conn``; returns ``(status_code, body)``.
+
+    With ``idempotent`` an existing visit for the same person and claim is
+    returned instead of inserting a second one, which makes journal replays
+    after a crash safe.
+    """
+    def _mark(name, start):
+        # every phase lands in query_seconds; the caller's ``mark`` (Server-Timing) sees it too
+        query_seconds.labels(name).observe(time.perf_counter() - start)
+        return mark(name, start) if mark else time.perf_counter()
+
+    username = payload.username
+    pid = payload.pid
+    claimType = payload.claimType
+    claimCode = payload.claimCode
+    datetime_claim = payload.datetime_claim
+    mainInscl = payload.mainInscl
+    subInscl = payload.subInscl
+    mainInscl = mainInscl if mainInscl not in (None, "") else None
+    subInscl = subInscl if subInscl not in (None, "") else None
+
+    t = time.perf_counter()
+    conn.begin()
+    with conn.cursor() as db_cursor:
+        # user -> pcucode, office check and person lookup in one round trip
+        db_cursor.execute(LOOKUP_QUERY, (pid, username))
+        row = db_cursor.fetchone()
+        t = _mark("lookup", t)
+        error = None
+        if not row:
+            error = "User not found"
+        elif row[1] is None:
+            error = f"Office with offid={row[0]} not found in 'office' table"
+        elif row[2] is None:
+            error = "Person not found for this user"
+        if row and row[1] is not None:
+            # the lookup already answered whether the person exists
+            person_cache.put(pid, row[2] is not None)
+        if error:
+            conn.rollback()
+            return status.HTTP_404_NOT_FOUND, {"error": error}
+        pcucode, _, pcucodeperson, person_pid = row
+
+        if idempotent:
+            db_cursor.execute(VISIT_EXISTS_QUERY, (pcucodeperson, person_pid, claimCode, datetime_claim))
+            existing = db_cursor.fetchone()
+            t = _mark("visit_exists", t)
+            if existing:
+                conn.rollback()
+                return status.HTTP_200_OK, {
+                    "message": "Visit already recorded",
+                    "data": {
+                        "pcucode": pcucode,
+                        "visitno": existing[0],
+                        "visitdate": str(existing[1]),
+                        "pcucodeperson": pcucodeperson,
+                        "pid": person_pid,
+                        "username": username,
+                    }
+                }
+
+        visitdate = datetime.now().strftime("%Y-%m-%d")
+        dateupdate = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        ipv4this = host_identity.public_ipv4
+
+        flagservice = "01"
+        servicetype = 1
+        receivepatient = "00"
+        refer = "00"
+        qdiscloser = qDisClose()
+
+        with visit_numbers.allocating(conn):
+            visitno = visit_numbers.next(conn)
+            t = _mark("visitno", t)
+            values = [
                 pcucode,
                 visitno,
                 visitdate,
                 pcucodeperson,
-                pid,
+                person_pid,
                 username,
                 flagservice,
                 dateupdate,
@@ -188,36 +289,264 @@ async def insert_visit(payload: InsertVisit, response: Response):
                 mainInscl,
                 subInscl,
                 qdiscloser
-            )
+            ]
 
             try:
-                db_cursor.execute(insert_query, values)
-                connection.commit()
+                values = insert_visit_rows(conn, db_cursor, [values],
+                                           lambda first: [values[:1] + [first] + values[2:]])[0]
+                visitno = values[1]
+                t = _mark("insert", t)
+                conn.commit()
+                t = _mark("commit", t)
+            except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+                # lost the connection: let the pool discard it and the caller retry
+                raise
             except Exception as e:
-                connection.rollback()
+                conn.rollback()
                 print(f"Database insert failed: {e}")
-                response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-                return {"error": f"Database insert failed: {str(e)}"}
-
-        return {
-            "message": "Insert success",
-            "data": {
-                "pcucode": pcucode,
-                "visitno": visitno,
-                "visitdate": visitdate,
-                "pcucodeperson": pcucodeperson,
-                "pid": pid,
-                "username": username,
-                "flagservice": flagservice,
-                "dateupdate": dateupdate,
-                "servicetype": servicetype,
-                "ipv4this": ipv4this,
-                "mainInscl": mainInscl,
-                "subInscl": subInscl
-            }
+                return status.HTTP_500_INTERNAL_SERVER_ERROR, {"error": f"Database insert failed: {str(e)}"}
+
+    return status.HTTP_200_OK, {
+        "message": "Insert success",
+        "data": {
+            "pcucode": pcucode,
+            "visitno": visitno,
+            "visitdate": visitdate,
+            "pcucodeperson": pcucodeperson,
+            "pid": person_pid,
+            "username": username,
+            "flagservice": flagservice,
+            "dateupdate": dateupdate,
+            "servicetype": servicetype,
+            "ipv4this": ipv4this,
+            "mainInscl": mainInscl,
+            "subInscl": subInscl
         }
+    }
+
+async def apply_journaled_visit(payload: dict, mark=None):
+    visit = InsertVisit(**payload)
+    return await db.run(lambda conn: register_visit(conn, visit, mark, idempotent=True))
+
+async def apply_journaled_visits(payloads: list[dict], mark=None) -> list[tuple[int, dict]]:
+    """Apply a drained batch of journal entries in one transaction."""
+    visits = [InsertVisit(**payload) for payload in payloads]
+    results = await db.run(lambda conn: register_visits(conn, visits, mark, idempotent=True))
+    outcomes = []
+    for result in results:
+        if "data" in result:
+            outcomes.append((result["status"], {"message": result["message"], "data": result["data"]}))
+        else:
+            outcomes.append((result["status"], {"error": result["error"]}))
+    return outcomes
+
+def server_timing(timings: list) -> str:
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings)
+
+@jhcis_router.post("/insert_visit")
+async def insert_visit(payload: InsertVisit, response: Response,
+                       idempotency_key: str | None = Header(None, alias="Idempotency-Key")):
+    try:
+        timings = []
+
+        def mark(name, start):
+            timings.append((name, (time.perf_counter() - start) * 1000))
+            return time.perf_counter()
+
+        start = time.perf_counter()
+        if visit_journal.running:
+            # journaled first, so the visit survives a database outage or a restart;
+            # the drain reports its lookup/visitno/insert/commit phases through mark
+            key = idempotency_key or visit_key(payload)
+            outcome = await visit_journal.submit(key, payload.model_dump(), mark)
+            if outcome is None:
+                mark("journal", start)
+                response.headers["Server-Timing"] = server_timing(timings)
+                response.status_code = status.HTTP_202_ACCEPTED
+                return {"message": "Visit queued", "key": key}
+            code, body = outcome
+        else:
+            code, body = await db.run(lambda conn: register_visit(conn, payload, mark))
+        mark("total", start)
+        response.headers["Server-Timing"] = server_timing(timings)
+        response.status_code = code
+        return body
     
     except Exception as e:
         print(f"Insert visit error: {e}")
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return {"status": 500, "message": "Internal server error"}
+
+@jhcis_router.get("/journal/metrics")
+async def journal_metrics():
+    try:
+        return await visit_journal.metrics()
+    except Exception as e:
+        return {"error": str(e)}
+
+def in_clause(values) -> str:
+    return ", ".join(["%s"] * len(values))
+
+def register_visits(conn, visits: list[InsertVisit], mark=None, idempotent: bool = False) -> list[dict]:
+    """Insert a batch of JHCIS visits in one transaction; returns one result per visit.
+
+    Users and persons are resolved with one query each, visit numbers are
+    reserved as a block and all resolvable visits go in with a single
+    ``executemany``. Items that cannot be resolved are reported and skipped.
+    With ``idempotent`` visits already recorded for the same person and
+    claim are reported instead of inserted again.
+    """
+    def _mark(name, start):
+        query_seconds.labels(name).observe(time.perf_counter() - start)
+        return mark(name, start) if mark else time.perf_counter()
+
+    usernames = sorted({v.username for v in visits})
+    pids = sorted({v.pid for v in visits})
+    results = [None] * len(visits)
+    conn.begin()
+    with conn.cursor() as db_cursor:
+        t = time.perf_counter()
+        db_cursor.execute(f"""
+            SELECT u.username, u.pcucode, o.offid
+            FROM user u
+            LEFT JOIN office o ON o.offid = u.pcucode
+            WHERE u.username IN ({in_clause(usernames)})
+        """, usernames)
+        users = {row[0]: row[1:] for row in db_cursor.fetchall()}
+        t = _mark("bulk_users", t)
+        db_cursor.execute(
+            f"SELECT idcard, pcucodeperson, pid FROM person WHERE idcard IN ({in_clause(pids)})", pids
+        )
+        persons = {row[0]: row[1:] for row in db_cursor.fetchall()}
+        t = _mark("bulk_persons", t)
+        for pid in pids:
+            person_cache.put(pid, pid in persons)
+
+        visitdate = datetime.now().strftime("%Y-%m-%d")
+        dateupdate = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        ipv4this = host_identity.public_ipv4
+        qdiscloser = qDisClose()
+
+        pending = []
+        for index, visit in enumerate(visits):
+            user = users.get(visit.username)
+            person = persons.get(visit.pid)
+            if not user:
+                results[index] = {"index": index, "status": 404, "error": "User not found"}
+            elif user[1] is None:
+                results[index] = {"index": index, "status": 404,
+                                  "error": f"Office with offid={user[0]} not found in 'office' table"}
+            elif not person:
+                results[index] = {"index": index, "status": 404, "error": "Person not found for this user"}
+            else:
+                pending.append((index, visit, user[0], person[0], person[1]))
+
+        if idempotent and pending:
+            # journal replays: a visit that made it in before a crash is reported, not inserted again
+            fresh = []
+            for entry in pending:
+                index, visit, pcucode, pcucodeperson, person_pid = entry
+                db_cursor.execute(VISIT_EXISTS_QUERY, (pcucodeperson, person_pid, visit.claimCode, visit.datetime_claim))
+                existing = db_cursor.fetchone()
+                if existing:
+                    results[index] = {"index": index, "status": 200, "message": "Visit already recorded", "data": {
+                        "pcucode": pcucode,
+                        "visitno": existing[0],
+                        "visitdate": str(existing[1]),
+                        "pcucodeperson": pcucodeperson,
+                        "pid": person_pid,
+                        "username": visit.username,
+                    }}
+                else:
+                    fresh.append(entry)
+            pending = fresh
+            t = _mark("bulk_exists", t)
+
+        def values_for(first_visitno):
+            return [
+                [
+                    pcucode, first_visitno + offset, visitdate, pcucodeperson, person_pid,
+                    visit.username, "01", dateupdate, 1, ipv4this, "00", "00",
+                    visit.claimType, visit.claimCode, visit.datetime_claim,
+                    visit.mainInscl or None, visit.subInscl or None, qdiscloser,
+                ]
+                for offset, (_, visit, pcucode, pcucodeperson, person_pid) in enumerate(pending)
+            ]
+
+        rows = []
+        if pending:
+            with visit_numbers.allocating(conn):
+                rows = values_for(visit_numbers.block(conn, len(pending)))
+                t = _mark("bulk_visitno", t)
+                try:
+                    rows = insert_visit_rows(conn, db_cursor, rows, values_for)
+                    conn.commit()
+                    t = _mark("bulk_insert", t)
+                except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+                    # lost the connection: let the pool discard it and the caller retry
+                    raise
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Database bulk insert failed: {e}")
+                    for index, *_ in pending:
+                        results[index] = {"index": index, "status": 500,
+                                          "error": f"Database insert failed: {str(e)}"}
+                    pending = []
+        else:
+            conn.rollback()
+
+        for (index, visit, *_), row in zip(pending, rows):
+            results[index] = {"index": index, "status": 200, "message": "Insert success", "data": {
+                "pcucode": row[0],
+                "visitno": row[1],
+                "visitdate": visitdate,
+                "pcucodeperson": row[3],
+                "pid": row[4],
+                "username": visit.username,
+                "flagservice": row[6],
+                "dateupdate": dateupdate,
+                "servicetype": row[8],
+                "ipv4this": ipv4this,
+                "mainInscl": row[15],
+                "subInscl": row[16],
+            }}
+    return results
+
+@jhcis_router.post("/insert_visits")
+async def insert_visits(payload: list[InsertVisit], response: Response,
+                        idempotency_key: str | None = Header(None, alias="Idempotency-Key")):
+    """Register a burst of visits (offline kiosk, outreach upload).
+
+    Like ``/insert_visit`` the visits are journaled first, each under its own
+    idempotency key (``<Idempotency-Key>:<index>`` when the header is sent),
+    so a kiosk retrying an upload during an outage never inserts twice; the
+    journal applies drained batches with ``register_visits``. Visits still
+    pending after the journal's wait are reported with status 202.
+    """
+    try:
+        if not payload:
+            return {"inserted": 0, "failed": 0, "queued": 0, "results": []}
+        if len(payload) > BULK_MAX_ITEMS:
+            response.status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            return {"error": f"At most {BULK_MAX_ITEMS} visits per request"}
+
+        if visit_journal.running:
+            keys = [f"{idempotency_key}:{i}" if idempotency_key else visit_key(v) for i, v in enumerate(payload)]
+            outcomes = await visit_journal.submit_many(list(zip(keys, (v.model_dump() for v in payload))))
+            results = []
+            for index, (key, outcome) in enumerate(zip(keys, outcomes)):
+                if outcome is None:
+                    results.append({"index": index, "status": 202, "message": "Visit queued", "key": key})
+                else:
+                    code, body = outcome
+                    results.append({"index": index, "status": code, **body})
+        else:
+            results = await db.run(lambda conn: register_visits(conn, payload))
+        inserted = sum(1 for r in results if r["status"] == 200)
+        queued = sum(1 for r in results if r["status"] == 202)
+        return {"inserted": inserted, "failed": len(results) - inserted - queued, "queued": queued, "results": results}
+
+    except Exception as e:
+        print(f"Insert visits error: {e}")
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return {"status": 500, "message": "Internal server error"}
@@ -1,93 +1,602 @@
+import asyncio
 from collections import deque
-from datetime import datetime
 from src.models.models import EnqueueItem
-from gtts import gTTS
-import base64, io
+from src.lib.tts_worker import tts_worker
+from src.lib.audio_cache import audio_cache
+from src.lib.announcer import announcer, join_mp3
+from src.lib.queue_store import queue_store
+from src.lib.dispatcher import CounterDispatcher
+from src.lib.scheduler import PriorityScheduler
+from src.lib.service_day import day_archive, service_calendar
+from src.lib.wait_stats import WaitEstimator
+from src.lib.metrics import registry
+from src.lib.state_broker import BrokerClient, MODE_BROKER, SHARED_ADDRESS, SHARED_MODE, SHARED_SPAWN
+from src.lib.broadcaster import Connection, Encoded, coalesce, encode, encode_batch, COALESCE_WINDOW, SEND_QUEUE, SLOW_CONSUMER
+import base64
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from itertools import islice
 from typing import List
-from fastapi import WebSocket, WebSocketDisconnect, APIRouter
+from fastapi import WebSocket, WebSocketDisconnect, APIRouter, Request, Response
 from src.config.config import get as config
-from zoneinfo import ZoneInfo
 
 queue_router = APIRouter()
 
 operator_registry: dict[str, str] = {}
 
+# Set when running as one of several workers; state changes then go through the broker.
+shared_state: BrokerClient | None = None
+
+AUDIO_RETAIN = int(config("TTS.AUDIO_RETAIN", 32))
+AUDIO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+HISTORY_CAPACITY = int(config("HISTORY.CAPACITY", 5000))
+HISTORY_BROADCAST = int(config("HISTORY.BROADCAST", 50))
+DISPATCH_ALPHA = float(config("DISPATCH.EWMA_ALPHA", 0.2))
+DISPATCH_DEFAULT_SERVICE_TIME = float(config("DISPATCH.DEFAULT_SERVICE_TIME", 300))
+WAIT_ALPHA = float(config("WAIT_ESTIMATE.EWMA_ALPHA", 0.2))
+WAIT_MAX_GAP = float(config("WAIT_ESTIMATE.MAX_GAP", 3600))
+WAIT_POSITIONS = int(config("WAIT_ESTIMATE.POSITIONS", 10))
+
+fanout_seconds = registry.histogram(
+    "smartq_ws_fanout_seconds", "Time to encode a flush and hand it to every WebSocket of a service.", ("service",),
+)
+
 def get_operator_name(operator_id: str | None) -> str | None:
     if not operator_id:
         return None
     return operator_registry.get(operator_id)
 
+def to_epoch(timestamp: str | None) -> float | None:
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
 class QueueManager:
-    def __init__(self, name: str, counters: List[dict]):
+    def __init__(self, name: str, counters: List[dict], priority: dict | None = None):
         self.name = name
         self.counters = counters
-        self.queue = deque()
-        self.active_connections: List[dict] = []
+        self.queue = PriorityScheduler(priority)
+        self.active_connections: List[Connection] = []
         self.muted = False
-        self.history: List[dict] = []
+        # newest first; maxlen makes both deques fixed-size rings
+        self.history: deque = deque(maxlen=HISTORY_CAPACITY)
+        self.history_view: deque = deque(maxlen=HISTORY_CAPACITY)
+        self.history_index: dict[int, tuple[dict, dict]] = {}
+        self.history_encoded: Encoded | None = None
         self.current: dict | None = None
-        self.current_audio_base64: str | None = None
+        self.current_audio_id: str | None = None
+        self.audio_store: OrderedDict[str, bytes] = OrderedDict()
+        self.day = service_calendar.today()
         self.counter_number = 0
-        self.next_counter_index = 0
+        self.dispatcher = CounterDispatcher(
+            [c["name"] for c in counters if c.get("name")], DISPATCH_ALPHA, DISPATCH_DEFAULT_SERVICE_TIME,
+        )
+        self.waits = WaitEstimator(WAIT_ALPHA, WAIT_MAX_GAP)
+        self.dispatcher.on_service = self.waits.served
+        # whether patients have been waiting ever since the last call
+        self.backlogged = False
+        self.queue_seq = 0
+        self.pending: list[tuple[dict | Encoded, str | None]] = []
+        self.status_dirty = False
+        self.flush_handle: asyncio.TimerHandle | None = None
+        self.fanout_seconds = fanout_seconds.labels(name)
 
     async def connect(self, websocket: WebSocket, role: str = "client"):
         await websocket.accept()
-        self.active_connections.append({"ws": websocket, "role": role})
-        await self.send_initial_state(websocket)
+        conn = Connection(websocket, role, self._drop_connection, SEND_QUEUE, SLOW_CONSUMER)
+        # deliver anything queued before this socket's snapshot is taken
+        self.flush()
+        self.active_connections.append(conn)
+        await self.send_initial_state(conn)
         await self.broadcast_status()
+        return conn
+
+    def _drop_connection(self, conn: Connection):
+        self.active_connections = [c for c in self.active_connections if c is not conn]
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections = [c for c in self.active_connections if c["ws"] != websocket]
+        for conn in [c for c in self.active_connections if c.ws is websocket]:
+            conn.close()
+
+    async def broadcast(self, message: dict | Encoded, role: str | None = None):
+        if shared_state is not None:
+            # every worker delivers it to its own sockets, in broker order
+            if isinstance(message, Encoded):
+                shared_state.send(self.name, "broadcast", {"raw": str(message), "type": message.type, "role": role})
+            else:
+                shared_state.send(self.name, "broadcast", {"m": message, "role": role})
+            return
+        self.deliver(message, role)
 
-    async def broadcast(self, message: dict, role: str | None = None):
-        for conn in list(self.active_connections):
-            try:
-                if role and conn.get("role") != role:
-                    continue
-                await conn["ws"].send_json(message)
-            except Exception:
-                try:
-                    conn["ws"].close()
-                except Exception:
-                    pass
-                self.disconnect(conn["ws"])
+    def deliver(self, message: dict | Encoded, role: str | None = None):
+        # encoded now: the items it refers to may change before the flush sends it
+        if not isinstance(message, Encoded):
+            message = Encoded(message)
+        self.pending.append((message, role))
+        self._schedule_flush()
 
-    async def broadcast_status(self):
-        await self.broadcast({
-            "type": "status",
-            "online": len(self.active_connections),
-            "queue_length": len(self.queue),
-            "processed_count": len(self.history),
+    def _schedule_flush(self):
+        if self.flush_handle is not None:
+            return
+        if COALESCE_WINDOW <= 0:
+            self.flush()
+            return
+        self.flush_handle = asyncio.get_running_loop().call_later(COALESCE_WINDOW, self.flush)
+
+    def flush(self):
+        """Send everything broadcast since the last flush as one frame per role."""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        pending, self.pending = self.pending, []
+        if self.status_dirty:
+            self.status_dirty = False
+            pending.append((self.status_message(), None))
+        if not pending:
+            return
+        start = time.perf_counter()
+        pending = coalesce(pending)
+        frames: dict[str, str | None] = {}
+        for conn in list(self.active_connections):
+            if conn.role not in frames:
+                messages = [m for m, r in pending if not r or r == conn.role]
+                frames[conn.role] = encode_batch(messages) if messages else None
+            if frames[conn.role] is not None:
+                conn.offer(frames[conn.role])
+        self.fanout_seconds.observe(time.perf_counter() - start)
+
+    async def mutate(self, op: str, **data):
+        """Apply a state change, writing it to the queue store's log first.
+
+        With a shared-state broker the change is applied when it comes back
+        from the broker, in the same order on every worker.
+        """
+        if shared_state is not None:
+            return await shared_state.publish(self.name, op, data)
+        queue_store.record(self.name, op, data)
+        return self.apply(op, data)
+
+    def apply(self, op: str, data: dict):
+        """Change in-memory state; shared by live requests and log replay at startup.
+
+        ``append``, ``call`` and ``remove`` return ``(item, seq, position)`` as
+        of this change: with a broker, other workers' events may be applied
+        before the caller resumes, so it must not read ``queue_seq`` or the
+        queue afterwards. ``item`` is a copy for the same reason, and
+        ``position`` is set only for an append that landed ahead of others.
+        """
+        if op == "append":
+            item = data["item"]
+            if item.get("Q_number") is None:
+                # numbered here, in log/broker order, so concurrent workers never share a number
+                item["Q_number"] = self.counter_number + 1
+            position = self.queue.push(item)
+            self.counter_number = max(self.counter_number, item.get("Q_number") or 0)
+            self.queue_seq += 1
+            return dict(item), self.queue_seq, position if position < len(self.queue) - 1 else None
+        if op == "call":
+            item = self.queue.pop()
+            if item is None:
+                return None, self.queue_seq, None
+            counter = data.get("counter")
+            at = data.get("at")
+            self.waits.called(at, to_epoch(item.get("timestamp")), self.backlogged)
+            self.backlogged = len(self.queue) > 0
+            if counter:
+                item["dispatch"] = {"counter": counter, "reason": "requested"}
+            else:
+                # decided here, in log/broker order, so two workers never send patients to the same idle counter
+                decision = self.dispatcher.choose(at)
+                if decision:
+                    counter = decision["counter"]
+                    item["dispatch"] = decision
+            if counter:
+                self.dispatcher.assign(counter, item.get("Q_number"), at)
+            item["counter"] = counter
+            self.queue_seq += 1
+            self.current = item
+            self.current_audio_id = None
+            return dict(item), self.queue_seq, None
+        if op == "remove":
+            item = self.queue.remove(data["Q_number"])
+            if item is not None:
+                self.queue_seq += 1
+                self.backlogged = self.backlogged and len(self.queue) > 0
+            return item, self.queue_seq, None
+        if op == "clear_current":
+            if data.get("counter"):
+                self.dispatcher.release(counter=data["counter"], at=data.get("at"))
+            self.current = None
+            self.current_audio_id = None
+            return None
+        if op == "complete":
+            entry = data["entry"]
+            self.add_history(entry)
+            self.dispatcher.release(entry.get("Q_number"), at=data.get("at"))
+            if self.current and self.current.get("Q_number") == entry.get("Q_number"):
+                self.current = None
+                self.current_audio_id = None
+                return True
+            return False
+        if op == "transfer":
+            found = self.find_history(data["Q_number"])
+            if not found or found.get("transferred") or found.get("transferable") is False:
+                return None
+            found["transferred"] = True
+            found["transferred_to"] = data["target"]
+            self.update_history(found)
+            return found
+        if op == "mute":
+            self.muted = bool(data["muted"])
+            return self.muted
+        if op == "rollover":
+            # a new service day: numbering restarts and yesterday lives in the archive
+            if self.day == data["day"]:
+                return False
+            self.day = data["day"]
+            self.queue.clear()
+            self.history.clear()
+            self.history_view.clear()
+            self.history_index.clear()
+            self.history_encoded = None
+            self.current = None
+            self.current_audio_id = None
+            self.counter_number = 0
+            self.dispatcher.reset()
+            self.waits.new_day()
+            self.backlogged = False
+            self.queue_seq += 1
+            return True
+        raise ValueError(f"unknown queue operation {op}")
+
+    def to_state(self) -> dict:
+        # copies, so a snapshot written off the event loop never sees later mutations
+        queue = self.queue.to_state()
+        return {
+            "day": self.day,
+            "queue": queue["items"],
+            "queue_ranks": queue["ranks"],
+            "queue_clock": queue["clock"],
+            "history": [dict(h) for h in reversed(self.history)],
+            "current": dict(self.current) if self.current else None,
+            "counter_number": self.counter_number,
+            "queue_seq": self.queue_seq,
             "muted": self.muted,
-        })
-
-    async def send_initial_state(self, websocket: WebSocket):
-        await websocket.send_json({"type": "queue_update", "queue": list(self.queue)})
-        await websocket.send_json({"type": "current", "item": self.current})
-        history_with_names = []
-        for h in self.history:
-            h_copy = dict(h)
-            cb = h_copy.get("completed_by")
-            if cb:
-                name = get_operator_name(cb)
-                if name:
-                    h_copy["completed_by_name"] = name
-            history_with_names.append(h_copy)
-        await websocket.send_json({"type": "history", "history": history_with_names})
-        await websocket.send_json({
+            "dispatch": self.dispatcher.to_state(),
+            "waits": self.waits.to_state(),
+            "backlogged": self.backlogged,
+        }
+
+    def load_state(self, state: dict):
+        self.day = state.get("day", self.day)
+        self.queue.load_state(state.get("queue", []), state.get("queue_ranks"), state.get("queue_clock"))
+        self.history.clear()
+        self.history_view.clear()
+        self.history_index.clear()
+        for entry in state.get("history", []):
+            self.add_history(entry)
+        self.current = state.get("current")
+        self.current_audio_id = None
+        self.counter_number = state.get("counter_number", 0)
+        self.queue_seq = state.get("queue_seq", 0)
+        self.muted = state.get("muted", False)
+        self.dispatcher.load_state(state.get("dispatch", {}))
+        self.waits.load_state(state.get("waits", {}))
+        self.backlogged = state.get("backlogged", False)
+
+    def queue_snapshot(self) -> dict:
+        return {"type": "queue_update", "seq": self.queue_seq, "queue": list(self.queue)}
+
+    async def queue_append(self, item: dict) -> dict:
+        item, seq, position = await self.mutate("append", item=item)
+        if position is not None:
+            # called ahead of others: clients insert it where it goes instead of at the end
+            await self.broadcast({"type": "queue_insert", "seq": seq, "item": item, "position": position})
+        else:
+            await self.broadcast({"type": "queue_append", "seq": seq, "item": item})
+        return item
+
+    async def queue_pop(self, counter=None) -> dict | None:
+        item, seq, _ = await self.mutate("call", counter=counter, at=service_calendar.now().timestamp())
+        if item is not None:
+            await self.broadcast({"type": "queue_pop", "seq": seq, "Q_number": item["Q_number"]})
+        return item
+
+    async def queue_remove(self, qnum: int) -> dict | None:
+        if self.queue.get(qnum) is None:
+            return None
+        item, seq, _ = await self.mutate("remove", Q_number=qnum)
+        if item is not None:
+            await self.broadcast({"type": "queue_remove", "seq": seq, "Q_number": qnum})
+        return item
+
+    async def announce(self, item: dict):
+        async def on_audio(audio: bytes):
+            if shared_state is not None:
+                # displays may fetch the clip from any worker
+                shared_state.send(self.name, "audio", {
+                    "audio": base64.b64encode(audio).decode("ascii"), "Q_number": item.get("Q_number"),
+                })
+                return
+            self.receive_audio(audio, item.get("Q_number"))
+
+        await tts_worker.announce(announcer.fragments(item), "th", on_audio)
+
+    def receive_audio(self, audio: bytes, qnum: int | None):
+        audio_id = self.store_audio(audio)
+        if self.current and self.current.get("Q_number") == qnum:
+            self.current_audio_id = audio_id
+        if not self.muted:
+            self.deliver(self.audio_message(audio_id), role="display")
+
+    def store_audio(self, audio: bytes) -> str:
+        audio_id = hashlib.sha256(audio).hexdigest()[:32]
+        self.audio_store[audio_id] = audio
+        self.audio_store.move_to_end(audio_id)
+        while len(self.audio_store) > AUDIO_RETAIN:
+            self.audio_store.popitem(last=False)
+        return audio_id
+
+    def audio_message(self, audio_id: str) -> dict:
+        return {"type": "audio", "id": audio_id, "url": f"/api/queue/{self.name}/audio/{audio_id}"}
+
+    def cached_audio(self, item: dict) -> bytes | None:
+        parts = [audio_cache.get(t, "th") for t in announcer.fragments(item)]
+        if any(p is None for p in parts):
+            return None
+        return join_mp3(parts)
+
+    def _enrich(self, entry: dict) -> dict:
+        h_copy = dict(entry)
+        name = get_operator_name(entry.get("completed_by"))
+        if name:
+            h_copy["completed_by_name"] = name
+        return h_copy
+
+    def add_history(self, entry: dict):
+        if len(self.history) == self.history.maxlen:
+            oldest = self.history[-1]
+            indexed = self.history_index.get(oldest.get("Q_number"))
+            if indexed and indexed[0] is oldest:
+                del self.history_index[oldest.get("Q_number")]
+        view = self._enrich(entry)
+        self.history.appendleft(entry)
+        self.history_view.appendleft(view)
+        self.history_index[entry.get("Q_number")] = (entry, view)
+        self.history_encoded = None
+
+    def find_history(self, qnum: int) -> dict | None:
+        indexed = self.history_index.get(qnum)
+        return indexed[0] if indexed else None
+
+    def update_history(self, entry: dict):
+        indexed = self.history_index.get(entry.get("Q_number"))
+        if indexed and indexed[0] is entry:
+            indexed[1].clear()
+            indexed[1].update(self._enrich(entry))
+            self.history_encoded = None
+
+    def rename_operator(self, operator_id: str) -> bool:
+        changed = False
+        for h, view in zip(self.history, self.history_view):
+            if h.get("completed_by") == operator_id:
+                view.update(self._enrich(h))
+                changed = True
+        if changed:
+            self.history_encoded = None
+        return changed
+
+    def history_message(self) -> Encoded:
+        # enriched history is serialized once and reused until it changes
+        if self.history_encoded is None:
+            recent = list(islice(self.history_view, HISTORY_BROADCAST))
+            self.history_encoded = Encoded({"type": "history", "history": recent})
+        return self.history_encoded
+
+    def status_message(self) -> dict:
+        return {
             "type": "status",
             "online": len(self.active_connections),
             "queue_length": len(self.queue),
             "processed_count": len(self.history),
             "muted": self.muted,
-        })
+            "day": self.day,
+            "wait": self.wait_estimate(WAIT_POSITIONS),
+        }
+
+    def wait_estimate(self, positions: int) -> dict:
+        """Expected wait in seconds for the first ``positions`` places in the queue."""
+        observed = self.waits.wait.summary()
+        return {
+            "positions": self.waits.positions(min(positions, len(self.queue)), self.dispatcher.call_gap()),
+            "call_gap": round(self.waits.call_gap(self.dispatcher.call_gap()), 1),
+            "p50": observed["p50"],
+            "p90": observed["p90"],
+        }
+
+    async def broadcast_status(self):
+        if shared_state is not None:
+            shared_state.send(self.name, "status", {})
+            return
+        self.mark_status()
+
+    def mark_status(self):
+        # built at flush time so several mutations share one up-to-date status
+        self.status_dirty = True
+        self._schedule_flush()
+
+    async def send_initial_state(self, conn: Connection):
+        conn.offer(encode_batch([
+            self.queue_snapshot(),
+            {"type": "current", "item": self.current},
+            self.history_message(),
+            self.status_message(),
+        ]))
 
 SERVICES = config("SERVICES")
 
 service_managers: dict[str, QueueManager] = {
-    s["name"]: QueueManager(s["name"], s.get("counters", [])) for s in SERVICES
+    s["name"]: QueueManager(s["name"], s.get("counters", []), s.get("priority")) for s in SERVICES
 }
 
+def _connection_counts() -> dict[tuple, int]:
+    counts: dict[tuple, int] = {}
+    for manager in service_managers.values():
+        for conn in manager.active_connections:
+            key = (manager.name, conn.role)
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+registry.gauge("smartq_queue_length", "Patients waiting, per service.", ("service",),
+               collect=lambda: {(m.name,): len(m.queue) for m in service_managers.values()})
+registry.gauge("smartq_queue_processed", "Patients completed in the current service day.", ("service",),
+               collect=lambda: {(m.name,): len(m.history) for m in service_managers.values()})
+registry.gauge("smartq_ws_connections", "Open WebSocket connections on this worker.", ("service", "role"),
+               collect=_connection_counts)
+
+def capture_state() -> dict:
+    return {
+        "services": {name: m.to_state() for name, m in service_managers.items()},
+        "operators": dict(operator_registry),
+    }
+
+def load_state(state: dict):
+    operator_registry.clear()
+    operator_registry.update(state.get("operators", {}))
+    for name, service_state in state.get("services", {}).items():
+        manager = service_managers.get(name)
+        if manager:
+            manager.load_state(service_state)
+
+def apply_event(service: str | None, op: str, data: dict):
+    """Apply one logged or replicated state change."""
+    if op == "operator":
+        operator_registry[data["operatorId"]] = data["name"]
+        return [m.name for m in service_managers.values() if m.rename_operator(data["operatorId"])]
+    manager = service_managers.get(service)
+    if manager is None:
+        raise ValueError(f"unknown service {service}")
+    return manager.apply(op, data)
+
+def restore_queues():
+    """Rebuild queue state from the last snapshot and log, then start logging."""
+    def replay(service: str | None, op: str, data: dict):
+        try:
+            apply_event(service, op, data)
+        except Exception as e:
+            print(f"Skipping queue log entry {service}/{op}: {e}")
+
+    if not config("QUEUE_STORE.ENABLED", True):
+        return
+    try:
+        stats = queue_store.recover(load_state, replay)
+        print(f"Queue state restored in {stats['seconds'] * 1000:.1f}ms "
+              f"({stats['replayed']} log entries after snapshot {stats['snapshot_generation']})")
+    except Exception as e:
+        print(f"Queue state recovery failed: {e}")
+    queue_store.open(capture_state)
+    queue_store.start()
+
+def on_shared_snapshot(state: dict):
+    # (re)joined the broker: adopt its state and resync this worker's sockets
+    load_state(state)
+    for manager in service_managers.values():
+        manager.deliver(manager.queue_snapshot())
+        manager.deliver({"type": "current", "item": manager.current})
+        manager.deliver(manager.history_message())
+        manager.mark_status()
+
+def on_shared_event(service: str | None, op: str, data: dict):
+    manager = service_managers.get(service)
+    if op == "broadcast" and manager:
+        message = Encoded.raw(data["raw"], data.get("type")) if "raw" in data else data["m"]
+        manager.deliver(message, data.get("role"))
+        return None
+    if op == "status" and manager:
+        manager.mark_status()
+        return None
+    if op == "audio" and manager:
+        manager.receive_audio(base64.b64decode(data["audio"]), data.get("Q_number"))
+        return None
+    return apply_event(service, op, data)
+
+async def mutate_shared(op: str, data: dict):
+    """State change that is not tied to one service (e.g. operator names)."""
+    if shared_state is not None:
+        return await shared_state.publish(None, op, data)
+    queue_store.record(None, op, data)
+    return apply_event(None, op, data)
+
+async def start_queue_state():
+    """Restore queue state locally, or join the shared-state broker when running several workers."""
+    global shared_state
+    if SHARED_MODE == MODE_BROKER:
+        client = BrokerClient(SHARED_ADDRESS, on_shared_snapshot, on_shared_event, spawn=SHARED_SPAWN)
+        await client.connect()
+        shared_state = client
+    else:
+        restore_queues()
+    # the server may have been down across the rollover time
+    await ensure_service_day()
+    start_day_rollover()
+
+async def stop_queue_state():
+    if shared_state is not None:
+        await shared_state.close()
+    else:
+        queue_store.close()
+
+async def rollover_if_due() -> list[QueueManager]:
+    """Archive and reset every service whose day has ended; returns the ones that rolled over."""
+    today = service_calendar.today()
+    rolled = []
+    for manager in service_managers.values():
+        if manager.day == today:
+            continue
+        try:
+            day_archive.write(manager.day, manager.name, manager.to_state())
+        except Exception as e:
+            # keep the old day in memory rather than lose it; the next check retries
+            print(f"Archiving {manager.name} for {manager.day} failed: {e}")
+            continue
+        # another worker may have rolled this service over already
+        if await manager.mutate("rollover", day=today):
+            rolled.append(manager)
+    return rolled
+
+async def ensure_service_day():
+    for manager in await rollover_if_due():
+        await manager.broadcast(manager.queue_snapshot())
+        await manager.broadcast({"type": "current", "item": None})
+        await manager.broadcast(manager.history_message())
+        await manager.broadcast_status()
+
+async def run_day_rollover():
+    while True:
+        await asyncio.sleep(service_calendar.seconds_until_rollover() + 1)
+        try:
+            await ensure_service_day()
+        except Exception as e:
+            print(f"Day rollover failed: {e}")
+
+def start_day_rollover():
+    global day_rollover_task
+    if day_rollover_task is None:
+        day_rollover_task = asyncio.create_task(run_day_rollover())
+
+day_rollover_task: asyncio.Task | None = None
+
+async def prerender_announcements():
+    texts = announcer.fixed_fragments(SERVICES)
+    if texts:
+        tts_worker.start_prerender(texts, "th")
+
 @queue_router.get("/services")
 def get_services():
     try:
@@ -102,17 +611,21 @@ async def enqueue_item(service: str, item: EnqueueItem):
         if not manager:
             return {"error": f"unknown service {service}"}
 
-        manager.counter_number += 1
+        priority = manager.queue.classify(item.priority)
+        if item.priority and not priority:
+            return {"error": f"unknown priority class {item.priority} for {service}"}
+
+        await ensure_service_day()
         counter = getattr(item, "counter", None)
-        thailand_tz = ZoneInfo("Asia/Bangkok")
-        data = {
-            "Q_number": manager.counter_number,
+        entry = {
+            "Q_number": None,
             "FULLNAME_TH": item.FULLNAME_TH,
             "counter": counter,
-            "timestamp": datetime.now(thailand_tz).isoformat()
+            "timestamp": service_calendar.now().isoformat()
         }
-        manager.queue.append(data)
-        await manager.broadcast({"type": "queue_update", "queue": list(manager.queue)})
+        if priority:
+            entry["priority"] = priority
+        data = await manager.queue_append(entry)
         await manager.broadcast_status()
         return {"message": f"Item enqueued in {service}", "item": data}
     except Exception as e:
@@ -126,38 +639,46 @@ async def dequeue_item(service: str, payload: dict = {}):
             return {"error": f"unknown service {service}"}
 
         counter = payload.get("counter")
+        if counter == "auto":
+            # no counter posted, or "auto": the dispatcher picks one
+            counter = None
 
-        if manager.queue:
-            item = manager.queue.popleft()
-            item["counter"] = counter
-
-            text = f"คิวหมายเลข {item['Q_number']} {item['FULLNAME_TH']} กรุณาไปที่ {counter or 'ช่องบริการ'}"
-            tts = gTTS(text=text, lang="th")
-            fp = io.BytesIO()
-            tts.write_to_fp(fp)
-            fp.seek(0)
-            audio_base64 = base64.b64encode(fp.read()).decode("utf-8")
-
-            manager.current = item
-            manager.current_audio_base64 = audio_base64
-
-            if not manager.muted:
-                await manager.broadcast({"type": "audio", "data": audio_base64}, role="display")
+        item = await manager.queue_pop(counter) if manager.queue else None
+        if item is not None:
+            await manager.announce(item)
 
             await manager.broadcast({"type": "current", "item": item})
-            await manager.broadcast({"type": "queue_update", "queue": list(manager.queue)})
             await manager.broadcast_status()
 
             return {"message": "Item dequeued", "item": item}
 
-        manager.current = None
-        manager.current_audio_base64 = None
+        await manager.mutate("clear_current", counter=counter, at=service_calendar.now().timestamp())
         await manager.broadcast({"type": "current", "item": None})
         await manager.broadcast_status()
         return {"message": "Queue is empty"}
     except Exception as e:
         return {"error": str(e)}
 
+@queue_router.post("/{service}/remove")
+async def remove_item(service: str, payload: dict):
+    try:
+        manager = service_managers.get(service)
+        if not manager:
+            return {"error": f"unknown service {service}"}
+
+        try:
+            qnum = int(payload.get("Q_number"))
+        except Exception:
+            return {"error": "missing or invalid Q_number"}
+
+        item = await manager.queue_remove(qnum)
+        if not item:
+            return {"error": "Q_number not waiting in queue"}
+        await manager.broadcast_status()
+        return {"message": "item removed", "item": item}
+    except Exception as e:
+        return {"error": str(e)}
+
 @queue_router.post("/{service}/complete")
 async def complete_item(service: str, payload: dict):
     try:
@@ -177,26 +698,17 @@ async def complete_item(service: str, payload: dict):
         if allow_transfer is None:
             allow_transfer = True
 
-        manager.history.insert(0, {"Q_number": qnum, "FULLNAME_TH": fullname, "service": service, "transferred": False, "transferable": bool(allow_transfer), "completed_by": completed_by})
-        if len(manager.history) > 50:
-            manager.history = manager.history[:50]
+        entry = {"Q_number": qnum, "FULLNAME_TH": fullname, "service": service, "transferred": False, "transferable": bool(allow_transfer), "completed_by": completed_by}
+        # keep the priority class so a transfer to the next service honours it too
+        if manager.current and manager.current.get("Q_number") == qnum and manager.current.get("priority"):
+            entry["priority"] = manager.current["priority"]
+        cleared = await manager.mutate("complete", entry=entry, at=service_calendar.now().timestamp())
 
         await manager.broadcast({"type": "complete", "Q_number": qnum})
-        history_with_names = []
-        for h in manager.history:
-            h_copy = dict(h)
-            cb = h_copy.get("completed_by")
-            if cb:
-                name = get_operator_name(cb)
-                if name:
-                    h_copy["completed_by_name"] = name
-            history_with_names.append(h_copy)
-        await manager.broadcast({"type": "history", "history": history_with_names})
+        await manager.broadcast(manager.history_message())
         await manager.broadcast_status()
 
-        if manager.current and manager.current.get("Q_number") == qnum:
-            manager.current = None
-            manager.current_audio_base64 = None
+        if cleared:
             await manager.broadcast({"type": "current", "item": None})
 
         return {"message": "item completed", "Q_number": qnum}
@@ -213,7 +725,7 @@ async def set_mute(service: str, payload: dict):
             muted = bool(payload.get("muted", True))
         except Exception:
             muted = True
-        manager.muted = muted
+        await manager.mutate("mute", muted=muted)
         await manager.broadcast_status()
         return {"message": "mute updated", "muted": manager.muted}
     except Exception as e:
@@ -227,13 +739,103 @@ async def reannounce_current(service: str):
             return {"error": f"unknown service {service}"}
         if not manager.current:
             return {"message": "no current item"}
-        if manager.current_audio_base64 and not manager.muted:
-            await manager.broadcast({"type": "audio", "data": manager.current_audio_base64}, role="display")
+        if manager.current_audio_id not in manager.audio_store:
+            manager.current_audio_id = None
+            audio = manager.cached_audio(manager.current)
+            if audio is not None:
+                manager.current_audio_id = manager.store_audio(audio)
+        if manager.current_audio_id and not manager.muted:
+            await manager.broadcast(manager.audio_message(manager.current_audio_id), role="display")
             return {"message": "reannounced"}
+        if not manager.muted:
+            return {"message": "audio pending"}
         return {"message": "muted or no audio"}
     except Exception as e:
         return {"error": str(e)}
 
+@queue_router.get("/{service}/audio/{audio_id}")
+def get_audio(service: str, audio_id: str, request: Request):
+    manager = service_managers.get(service)
+    audio = manager.audio_store.get(audio_id) if manager else None
+    if audio is None:
+        return Response(status_code=404)
+
+    etag = f'"{audio_id}"'
+    headers = {"ETag": etag, "Cache-Control": AUDIO_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    size = len(audio)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        # one byte range is served partially; multiple or malformed ranges are ignored (full 200)
+        m = RANGE_RE.match(range_header.strip())
+        first, last = (m.group(1), m.group(2)) if m else ("", "")
+        if first and (not last or int(last) >= int(first)):
+            start, end, satisfiable = int(first), min(int(last), size - 1) if last else size - 1, int(first) < size
+        elif not first and last:
+            start, end, satisfiable = max(size - int(last), 0), size - 1, int(last) > 0 and size > 0
+        else:
+            start = None
+        if start is not None:
+            if not satisfiable:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return Response(content=audio[start:end + 1], status_code=206, media_type="audio/mpeg", headers=headers)
+
+    return Response(content=audio, media_type="audio/mpeg", headers=headers)
+
+@queue_router.get("/{service}/counters")
+def get_counters(service: str):
+    try:
+        manager = service_managers.get(service)
+        if not manager:
+            return {"error": f"unknown service {service}"}
+        now = service_calendar.now().timestamp()
+        return {"service": service, "counters": manager.dispatcher.loads(now),
+                "next": manager.dispatcher.choose(now, commit=False)}
+    except Exception as e:
+        return {"error": str(e)}
+
+@queue_router.get("/{service}/wait")
+def get_wait(service: str):
+    try:
+        manager = service_managers.get(service)
+        if not manager:
+            return {"error": f"unknown service {service}"}
+        gap = manager.waits.call_gap(manager.dispatcher.call_gap())
+        waiting = [
+            {"position": k, "Q_number": item.get("Q_number"), "estimated_wait": round(gap * k, 1)}
+            for k, item in enumerate(manager.queue, start=1)
+        ]
+        return {"service": service, "queue_length": len(manager.queue), "call_gap": round(gap, 1),
+                "waiting": waiting, "stats": manager.waits.summary()}
+    except Exception as e:
+        return {"error": str(e)}
+
+@queue_router.get("/{service}/archive")
+async def list_archive(service: str):
+    try:
+        if service not in service_managers:
+            return {"error": f"unknown service {service}"}
+        return {"service": service, "today": service_managers[service].day,
+                "days": await asyncio.to_thread(day_archive.days, service)}
+    except Exception as e:
+        return {"error": str(e)}
+
+@queue_router.get("/{service}/archive/{day}")
+async def get_archive(service: str, day: str):
+    try:
+        if service not in service_managers:
+            return {"error": f"unknown service {service}"}
+        record = await asyncio.to_thread(day_archive.read, day, service)
+        if record is None:
+            return {"error": f"no archive for {service} on {day}"}
+        return record
+    except Exception as e:
+        return {"error": str(e)}
+
 @queue_router.post("/{service}/transfer")
 async def transfer_item(service: str, payload: dict):
     try:
@@ -254,11 +856,8 @@ async def transfer_item(service: str, payload: dict):
         if not target_manager:
             return {"error": f"unknown target service {target}"}
 
-        found = None
-        for h in manager.history:
-            if h.get("Q_number") == qnum:
-                found = h
-                break
+        await ensure_service_day()
+        found = manager.find_history(qnum)
 
         if not found:
             return {"error": "source Q_number not found in history"}
@@ -270,33 +869,25 @@ async def transfer_item(service: str, payload: dict):
         if found.get("transferable") is False:
             return {"error": "item not transferable"}
 
+        # marked first, so two concurrent transfers of the same item enqueue it only once
+        if not await manager.mutate("transfer", Q_number=qnum, target=target):
+            return {"error": "item already transferred"}
+
         fullname = found.get("FULLNAME_TH", "Unknown")
 
-        target_manager.counter_number += 1
-        thailand_tz = ZoneInfo("Asia/Bangkok")
-        new_item = {
-            "Q_number": target_manager.counter_number,
+        new_entry = {
+            "Q_number": None,
             "FULLNAME_TH": fullname,
-            "timestamp": datetime.now(thailand_tz).isoformat()
+            "timestamp": service_calendar.now().isoformat()
         }
-        target_manager.queue.append(new_item)
+        priority = target_manager.queue.classify(found.get("priority"))
+        if priority:
+            new_entry["priority"] = priority
+        new_item = await target_manager.queue_append(new_entry)
 
-        found["transferred"] = True
-        found["transferred_to"] = target
-
-        await target_manager.broadcast({"type": "queue_update", "queue": list(target_manager.queue)})
         await target_manager.broadcast_status()
 
-        history_with_names = []
-        for h in manager.history:
-            h_copy = dict(h)
-            cb = h_copy.get("completed_by")
-            if cb:
-                name = get_operator_name(cb)
-                if name:
-                    h_copy["completed_by_name"] = name
-            history_with_names.append(h_copy)
-        await manager.broadcast({"type": "history", "history": history_with_names})
+        await manager.broadcast(manager.history_message())
         await manager.broadcast_status()
 
         return {"message": "transferred", "from": {"service": service, "Q_number": qnum}, "to": {"service": target, "Q_number": new_item["Q_number"]}}
@@ -312,10 +903,18 @@ async def websocket_endpoint(websocket: WebSocket, service: str):
             return
 
         role = websocket.query_params.get("role", "client")
-        await manager.connect(websocket, role=role)
+        conn = await manager.connect(websocket, role=role)
         try:
             while True:
-                await websocket.receive_text()
+                text = await websocket.receive_text()
+                try:
+                    msg = json.loads(text)
+                except ValueError:
+                    continue
+                if isinstance(msg, dict) and msg.get("type") == "snapshot":
+                    # client saw a gap in queue delta seq numbers
+                    manager.flush()
+                    conn.offer(encode(manager.queue_snapshot()))
         except WebSocketDisconnect:
             manager.disconnect(websocket)
             await manager.broadcast_status()
@@ -325,6 +924,22 @@ async def websocket_endpoint(websocket: WebSocket, service: str):
         except Exception:
             pass
 
+@queue_router.get("/state/metrics")
+def get_state_metrics():
+    try:
+        if shared_state is not None:
+            return {"mode": MODE_BROKER, **shared_state.metrics()}
+        return queue_store.metrics()
+    except Exception as e:
+        return {"error": str(e)}
+
+@queue_router.get("/tts/metrics")
+def get_tts_metrics():
+    try:
+        return tts_worker.metrics()
+    except Exception as e:
+        return {"error": str(e)}
+
 @queue_router.post('/operator/register')
 async def register_operator(payload: dict):
     try:
@@ -332,7 +947,10 @@ async def register_operator(payload: dict):
         name = payload.get('name')
         if not operator_id or not name:
             return {"error": "operatorId and name required"}
-        operator_registry[operator_id] = name
+        renamed = await mutate_shared("operator", {"operatorId": operator_id, "name": name})
+        for service_name in renamed:
+            manager = service_managers[service_name]
+            await manager.broadcast(manager.history_message())
         return {"message": "registered", "operatorId": operator_id, "name": name}
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,67 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.router.queue import QueueManager, queue_router, service_managers
+
+AUDIO = bytes(range(100))
+AUDIO_ID = "a" * 32
+
+
+@pytest.fixture
+def client(monkeypatch):
+    manager = QueueManager("inspect", [])
+    manager.audio_store[AUDIO_ID] = AUDIO
+    monkeypatch.setitem(service_managers, "inspect", manager)
+    app = FastAPI()
+    app.include_router(queue_router, prefix="/api/queue")
+    return TestClient(app)
+
+
+def fetch(client, range_header: str | None = None, **headers):
+    if range_header is not None:
+        headers["Range"] = range_header
+    return client.get(f"/api/queue/inspect/audio/{AUDIO_ID}", headers=headers)
+
+
+def test_whole_file_without_range(client):
+    r = fetch(client)
+    assert r.status_code == 200 and r.content == AUDIO
+    assert r.headers["accept-ranges"] == "bytes"
+
+
+@pytest.mark.parametrize("range_header, start, end", [
+    ("bytes=10-19", 10, 19),
+    ("bytes=90-", 90, 99),
+    ("bytes=95-500", 95, 99),
+    ("bytes=-5", 95, 99),
+    ("bytes=-500", 0, 99),
+])
+def test_single_range(client, range_header, start, end):
+    r = fetch(client, range_header)
+    assert r.status_code == 206
+    assert r.content == AUDIO[start:end + 1]
+    assert r.headers["content-range"] == f"bytes {start}-{end}/100"
+
+
+@pytest.mark.parametrize("range_header", ["bytes=100-", "bytes=150-200", "bytes=-0"])
+def test_unsatisfiable_range(client, range_header):
+    r = fetch(client, range_header)
+    assert r.status_code == 416
+    assert r.headers["content-range"] == "bytes */100"
+
+
+@pytest.mark.parametrize("range_header", ["bytes=0-9,20-29", "bytes=20-10", "items=0-5", "bytes=-", "bytes=abc"])
+def test_unsupported_range_gets_the_whole_file(client, range_header):
+    r = fetch(client, range_header)
+    assert r.status_code == 200 and r.content == AUDIO
+
+
+def test_stale_if_range_gets_the_whole_file(client):
+    r = fetch(client, "bytes=0-9", **{"If-Range": '"other"'})
+    assert r.status_code == 200 and r.content == AUDIO
+    assert fetch(client, "bytes=0-9", **{"If-Range": f'"{AUDIO_ID}"'}).status_code == 206
+
+
+def test_matching_etag_is_not_modified(client):
+    assert fetch(client, **{"If-None-Match": f'"{AUDIO_ID}"'}).status_code == 304
+    assert client.get("/api/queue/inspect/audio/missing").status_code == 404
@@ -0,0 +1,71 @@
+import asyncio
+import json
+from src.lib.broadcaster import POLICY_DISCONNECT, POLICY_DROP, Connection, Encoded, coalesce, encode_batch
+
+
+class StuckSocket:
+    """Never finishes a send, like a client that stopped reading."""
+
+    def __init__(self):
+        self.sent: list[str] = []
+        self.closed = False
+
+    async def send_text(self, data: str):
+        self.sent.append(data)
+        await asyncio.Event().wait()
+
+    async def close(self):
+        self.closed = True
+
+
+def test_coalesce_keeps_last_full_view_per_role_and_every_delta():
+    pending = [
+        ({"type": "status", "n": 1}, None),
+        ({"type": "queue_append", "n": 2}, None),
+        ({"type": "status", "n": 3}, "display"),
+        ({"type": "status", "n": 4}, None),
+        ({"type": "queue_append", "n": 5}, None),
+    ]
+    kept = [m["n"] for m, _ in coalesce(pending)]
+    assert kept == [2, 3, 4, 5]
+
+
+def test_encode_batch_wraps_several_messages():
+    assert json.loads(encode_batch([{"type": "status"}])) == {"type": "status"}
+    batch = json.loads(encode_batch([Encoded({"type": "a"}), {"type": "b", "x": "ไทย"}]))
+    assert batch == {"type": "batch", "messages": [{"type": "a"}, {"type": "b", "x": "ไทย"}]}
+
+
+def test_drop_policy_discards_oldest_pending_frame():
+    async def run():
+        ws = StuckSocket()
+        conn = Connection(ws, "client", lambda c: None, max_pending=2, policy=POLICY_DROP)
+        conn.offer("0")
+        await asyncio.sleep(0)  # the pump takes "0" and blocks sending it
+        for data in ("1", "2", "3"):
+            assert conn.offer(data)
+        pending = [conn.outbox.get_nowait() for _ in range(conn.outbox.qsize())]
+        conn.close()
+        return conn.dropped, pending
+
+    dropped, pending = asyncio.run(run())
+    assert dropped == 1
+    assert pending == ["2", "3"]
+
+
+def test_disconnect_policy_closes_slow_client():
+    async def run():
+        ws = StuckSocket()
+        closed = []
+        conn = Connection(ws, "client", closed.append, max_pending=1, policy=POLICY_DISCONNECT)
+        conn.offer("0")
+        await asyncio.sleep(0)
+        conn.offer("1")
+        accepted = conn.offer("2")
+        await asyncio.sleep(0)
+        return conn, accepted, closed, ws
+
+    conn, accepted, closed, ws = asyncio.run(run())
+    assert not accepted
+    assert conn.closed and closed == [conn]
+    assert ws.closed
@@ -0,0 +1,89 @@
+import time
+import pymysql
+import pytest
+from src.database.database import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, n: int):
+        self.n = n
+        self.closed = False
+        self.ping_fails = False
+        self.rolled_back = 0
+
+    def ping(self, reconnect=False):
+        if self.ping_fails:
+            raise pymysql.err.OperationalError(2006, "MySQL server has gone away")
+
+    def rollback(self):
+        self.rolled_back += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(ConnectionPool):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.made: list[FakeConnection] = []
+
+    def _connect(self):
+        conn = FakeConnection(len(self.made))
+        conn.smartq_last_used = time.monotonic()
+        self.made.append(conn)
+        return conn
+
+
+def test_reuses_idle_connections_and_caps_size():
+    pool = FakePool(min_size=1, max_size=2, acquire_timeout=0.05, health_check_interval=3600)
+    pool.open()
+    a = pool.acquire()
+    b = pool.acquire()
+    assert (a.n, b.n) == (0, 1)
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    pool.release(b)
+    assert pool.acquire() is b
+    assert pool.size == 2
+
+
+def test_connection_error_discards_the_connection():
+    pool = FakePool(max_size=1, health_check_interval=3600)
+    with pytest.raises(pymysql.err.OperationalError):
+        with pool.connection() as conn:
+            raise pymysql.err.OperationalError(2013, "Lost connection")
+    assert conn.closed
+    assert pool.size == 0 and pool.errors == 1
+    with pool.connection() as fresh:
+        assert fresh is not conn
+
+
+def test_other_errors_roll_back_and_keep_the_connection():
+    pool = FakePool(max_size=1, health_check_interval=3600)
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError("bad row")
+    assert conn.rolled_back == 1 and not conn.closed
+    assert pool.acquire() is conn
+
+
+def test_stale_connection_failing_ping_is_replaced():
+    pool = FakePool(max_size=1, health_check_interval=0)
+    pool.open()
+    stale = pool.made[0]
+    stale.ping_fails = True
+    conn = pool.acquire()
+    assert conn is not stale and stale.closed
+    assert pool.discarded == 1 and pool.size == 1
+
+
+def test_close_drops_idle_and_later_released_connections():
+    pool = FakePool(min_size=1, max_size=2, health_check_interval=3600)
+    pool.open()
+    held = pool.acquire()
+    pool.acquire()
+    pool.release(pool.made[1])
+    pool.close()
+    assert pool.made[1].closed and not held.closed
+    pool.release(held)
+    assert held.closed and pool.size == 0
@@ -0,0 +1,70 @@
+from src.lib.dispatcher import CounterDispatcher
+
+
+def test_unused_counters_rotate_then_longest_idle_wins():
+    d = CounterDispatcher(["1", "2", "3"])
+    picks = []
+    for qnum, at in ((1, 0), (2, 10), (3, 20)):
+        decision = d.choose(at)
+        picks.append((decision["counter"], decision["reason"]))
+        d.assign(decision["counter"], qnum, at)
+    assert picks == [("1", "idle"), ("2", "idle"), ("3", "idle")]
+    d.release(2, at=100)
+    d.release(1, at=110)
+    assert d.choose(120)["counter"] == "2"
+
+
+def test_busy_counters_go_to_the_one_free_soonest():
+    d = CounterDispatcher(["fast", "slow"], alpha=1.0)
+    # learn service times: fast takes 60s, slow 300s
+    d.assign("fast", 1, 0)
+    d.assign("slow", 2, 0)
+    d.release(1, at=60)
+    d.release(2, at=300)
+    d.assign("fast", 3, 1000)
+    d.assign("slow", 4, 1000)
+    decision = d.choose(1030)
+    assert decision == {"counter": "fast", "reason": "least_loaded", "expected_wait": 30.0}
+    # fast has just started on someone else while slow is nearly done
+    d.assign("fast", 5, 1280)
+    assert d.choose(1290) == {"counter": "slow", "reason": "least_loaded", "expected_wait": 10.0}
+
+
+def test_preview_does_not_move_the_rotation():
+    d = CounterDispatcher(["1", "2"])
+    assert d.choose(0, commit=False)["counter"] == "1"
+    assert d.choose(0, commit=False)["counter"] == "1"
+    assert d.choose(0)["counter"] == "1"
+    assert d.next_index == 1
+
+
+def test_average_is_an_ewma_of_finished_services():
+    served = []
+    d = CounterDispatcher(["1"], alpha=0.5, default_service_time=300)
+    d.on_service = lambda name, took: served.append((name, took))
+    assert d.average("1") == 300
+    for qnum, start, end in ((1, 0, 100), (2, 100, 300)):
+        d.assign("1", qnum, start)
+        d.release(qnum, at=end)
+    assert d.average("1") == 150
+    assert served == [("1", 100), ("1", 200)]
+    assert d.call_gap() == 150
+
+
+def test_unconfigured_counter_is_tracked_but_never_chosen():
+    d = CounterDispatcher(["1"])
+    d.assign("9", 1, 0)
+    assert d.release(1, at=50) == "9"
+    assert d.choose(60)["counter"] == "1"
+    assert CounterDispatcher([]).choose(0) is None
+
+
+def test_state_round_trip_makes_the_same_choice():
+    d = CounterDispatcher(["1", "2", "3"])
+    for qnum, at in ((1, 0), (2, 5)):
+        d.assign(d.choose(at)["counter"], qnum, at)
+    d.release(1, at=90)
+    restored = CounterDispatcher(["1", "2", "3"])
+    restored.load_state(d.to_state())
+    assert restored.choose(100) == d.choose(100)
+    assert restored.next_index == d.next_index
@@ -0,0 +1,144 @@
+import asyncio
+import sqlite3
+import time
+from src.database.journal import CLAIM_LEASE, WriteBehindJournal
+
+
+class Applier:
+    def __init__(self):
+        self.down = False
+        self.applied: list[int] = []
+        self.calls: list[list[int]] = []
+
+    async def apply(self, payload, mark=None):
+        if self.down:
+            raise ConnectionError("database unreachable")
+        self.applied.append(payload["n"])
+        self.calls.append([payload["n"]])
+        return payload.get("code", 200), {"n": payload["n"]}
+
+    async def apply_many(self, payloads, mark=None):
+        if self.down:
+            raise ConnectionError("database unreachable")
+        self.calls.append([p["n"] for p in payloads])
+        self.applied.extend(p["n"] for p in payloads)
+        return [(200, {"n": p["n"]}) for p in payloads]
+
+
+def journal(tmp_path, **kwargs) -> WriteBehindJournal:
+    kwargs = {"wait": 0.5, "retry_base": 0.2, "retry_max": 0.4, **kwargs}
+    return WriteBehindJournal(str(tmp_path / "journal.sqlite3"), **kwargs)
+
+
+def test_resubmitted_key_returns_stored_outcome(tmp_path):
+    applier = Applier()
+
+    async def run():
+        j = journal(tmp_path)
+        await j.start(applier.apply)
+        first = await j.submit("visit-1", {"n": 1})
+        again = await j.submit("visit-1", {"n": 1})
+        await j.stop()
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert first == again == (200, {"n": 1})
+    assert applier.applied == [1]
+
+
+def test_client_error_fails_for_good_until_resubmitted(tmp_path):
+    applier = Applier()
+
+    async def run():
+        j = journal(tmp_path)
+        await j.start(applier.apply)
+        failed = await j.submit("visit-1", {"n": 1, "code": 404})
+        retried = await j.submit("visit-1", {"n": 2})
+        await j.stop()
+        return failed, retried
+
+    failed, retried = asyncio.run(run())
+    assert failed == (404, {"n": 1})
+    assert retried == (200, {"n": 2})
+
+
+def test_outage_backs_off_and_keeps_submission_order(tmp_path):
+    applier = Applier()
+    applier.down = True
+
+    async def run():
+        j = journal(tmp_path)
+        await j.start(applier.apply)
+        queued = await j.submit_many([(f"visit-{n}", {"n": n}) for n in (1, 2, 3)])
+        assert j.paused_until > time.time()
+        # while backing off, new submits are queued at once instead of waiting
+        start = time.monotonic()
+        late = await j.submit("visit-4", {"n": 4})
+        waited = time.monotonic() - start
+        applier.down = False
+        for _ in range(50):
+            if len(applier.applied) == 4:
+                break
+            await asyncio.sleep(0.05)
+        metrics = await j.metrics()
+        await j.stop()
+        return queued, late, waited, metrics
+
+    queued, late, waited, metrics = asyncio.run(run())
+    assert queued == [None, None, None]
+    assert late is None and waited < 0.1
+    assert applier.applied == [1, 2, 3, 4]
+    assert metrics["pending"] == 0 and metrics["done"] == 4
+
+
+def test_due_entries_are_applied_as_one_batch(tmp_path):
+    applier = Applier()
+
+    async def run():
+        j = journal(tmp_path)
+        await j.start(applier.apply, applier.apply_many)
+        outcomes = await j.submit_many([(f"visit-{n}", {"n": n}) for n in (1, 2, 3)])
+        await j.stop()
+        return outcomes
+
+    outcomes = asyncio.run(run())
+    assert outcomes == [(200, {"n": 1}), (200, {"n": 2}), (200, {"n": 3})]
+    assert applier.calls == [[1, 2, 3]]
+
+
+def test_claimed_entries_are_hidden_from_other_drains(tmp_path):
+    async def run():
+        j = journal(tmp_path)
+        await j._call(j._append_many, [("visit-1", {"n": 1}), ("visit-2", {"n": 2})])
+        first = await j._call(j._due)
+        second = await j._call(j._due)
+        await j.stop()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [row[0] for row in first] == [1, 2]
+    assert second == []
+
+
+def test_recover_leaves_entries_leased_by_live_workers(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    now = time.time()
+
+    async def run():
+        j = journal(tmp_path)
+        await j._call(j._open)
+        conn = sqlite3.connect(path)
+        conn.executemany(
+            "INSERT INTO entries (key, payload, created, next_attempt, leased_until) VALUES (?, '{}', ?, ?, ?)",
+            [("leased", now, now + 100, now + CLAIM_LEASE), ("expired", now, now + 100, now - 1)],
+        )
+        conn.commit()
+        await j._call(j._recover)
+        rows = dict(conn.execute("SELECT key, next_attempt FROM entries").fetchall())
+        conn.close()
+        await j.stop()
+        return rows
+
+    rows = asyncio.run(run())
+    assert rows["leased"] == now + 100
+    assert rows["expired"] <= time.time()
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import time
+import traceback
+from fastapi import APIRouter, FastAPI, WebSocket
+from src.lib.loop_watchdog import SRC_DIR, LoopWatchdog
+
+
+def test_register_routes_labels_included_routers_with_their_prefix():
+    router = APIRouter()
+
+    @router.post("/{service}/enqueue")
+    async def enqueue(service: str):
+        return {}
+
+    @router.websocket("/ws/{service}")
+    async def ws(websocket: WebSocket, service: str):
+        pass
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/queue")
+    watchdog = LoopWatchdog()
+    watchdog.register_routes(app.routes)
+    labels = set(watchdog.endpoints.values())
+    assert "POST /api/queue/{service}/enqueue" in labels
+    assert "WS /api/queue/ws/{service}" in labels
+
+
+def test_site_is_our_innermost_frame_below_the_handler():
+    frame = traceback.FrameSummary
+    src = lambda path: os.path.join(SRC_DIR, path)
+    stack = [
+        frame(src("lib/metrics.py"), 280, "__call__"),
+        frame(src("router/jhcis.py"), 90, "insert_visit"),
+        frame(src("database/visitno.py"), 35, "_seed"),
+        frame("/usr/lib/python3/socket.py", 700, "recv_into"),
+    ]
+    watchdog = LoopWatchdog()
+    watchdog.endpoints[(src("router/jhcis.py"), "insert_visit")] = "POST /api/jhcis/insert_visit"
+    route, site, blocking = watchdog._describe(stack)
+    assert route == "POST /api/jhcis/insert_visit"
+    assert site == os.path.join("src", "database", "visitno.py") + ":35 in _seed"
+    assert blocking == "/usr/lib/python3/socket.py:700 in recv_into"
+
+
+def test_blocking_handler_is_reported_and_offloaded_work_is_not():
+    def blocking_io():
+        time.sleep(0.4)
+
+    async def slow_handler():
+        blocking_io()
+
+    async def good_handler():
+        await asyncio.to_thread(blocking_io)
+
+    async def run():
+        watchdog = LoopWatchdog(interval=0.02, threshold=0.1)
+        watchdog.endpoints[(__file__, "slow_handler")] = "POST /slow"
+        watchdog.endpoints[(__file__, "good_handler")] = "POST /good"
+        watchdog.start()
+        await asyncio.sleep(0.1)
+        await good_handler()
+        await asyncio.sleep(0.1)
+        offloaded = watchdog.stalls
+        await slow_handler()
+        await asyncio.sleep(0.2)
+        watchdog.stop()
+        return offloaded, watchdog
+
+    offloaded, watchdog = asyncio.run(run())
+    assert offloaded == 0
+    assert watchdog.stalls == 1
+    stall = watchdog.recent[-1]
+    assert stall["route"] == "POST /slow"
+    assert stall["blocking_in"].endswith("in blocking_io")
+    assert 0.3 <= stall["duration"] < 1.0
+
+
+def test_metrics_endpoint_reports_this_workers_stalls(monkeypatch):
+    from fastapi.testclient import TestClient
+    from src import main
+
+    watchdog = LoopWatchdog(interval=0.05, threshold=0.2)
+    watchdog.stalls, watchdog.max_lag = 1, 0.4567
+    watchdog.recent.append({"duration": 0.457, "route": "POST /slow", "blocking_in": "x.py:1 in f"})
+    monkeypatch.setattr(main, "loop_watchdog", watchdog)
+    out = TestClient(main.app).get("/loop/metrics").json()
+    assert out == {
+        "running": False, "interval": 0.05, "threshold": 0.2, "stalls": 1, "max_stall": 0.457,
+        "recent": [{"duration": 0.457, "route": "POST /slow", "blocking_in": "x.py:1 in f"}],
+    }
@@ -0,0 +1,44 @@
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from src.lib.metrics import Registry, RequestMetrics, http_request_seconds
+
+
+def test_render_uses_prometheus_text_format():
+    registry = Registry()
+    hist = registry.histogram("smartq_test_seconds", "Test latency.", ("route",), (0.1, 1.0))
+    hist.labels("/a").observe(0.05)
+    hist.labels("/a").observe(0.5)
+    registry.counter("smartq_test_total", "Test count.", ("kind",)).labels('say "hi"').inc(2)
+    registry.gauge("smartq_test_depth", "Test depth.", ("service",), collect=lambda: {("inspect",): 3})
+    lines = registry.render().splitlines()
+    assert "# TYPE smartq_test_seconds histogram" in lines
+    assert 'smartq_test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'smartq_test_seconds_bucket{route="/a",le="+Inf"} 2' in lines
+    assert 'smartq_test_seconds_count{route="/a"} 2' in lines
+    assert 'smartq_test_total{kind="say \\"hi\\""} 2.0' in lines
+    assert 'smartq_test_depth{service="inspect"} 3' in lines
+
+
+def test_same_name_registers_once():
+    registry = Registry()
+    first = registry.counter("smartq_test_total", "Test count.")
+    assert registry.counter("smartq_test_total", "Test count.") is first
+
+
+def test_requests_are_labelled_with_the_prefixed_route_template():
+    router = APIRouter()
+
+    @router.get("/{service}/wait")
+    def wait(service: str):
+        return {}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/metrics-test")
+    app.add_middleware(RequestMetrics)
+    client = TestClient(app)
+    client.get("/api/metrics-test/inspect/wait")
+    client.get("/api/metrics-test/lab/wait")
+    client.get("/api/metrics-test/nowhere")
+    counts = {key: child.counts for key, child in http_request_seconds.children.items()}
+    assert sum(counts[("GET", "/api/metrics-test/{service}/wait", "200")]) == 2
+    assert ("GET", "unmatched", "404") in counts
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from src.lib.broadcaster import COALESCE_WINDOW
+from src.lib.service_day import DayArchive
+from src.router import queue as queue_module
+from src.router.queue import QueueManager, get_wait, service_managers
+
+OPEN = datetime(2026, 1, 1, 8, tzinfo=timezone(timedelta(hours=7)))
+
+
+def manager(counters=(), priority=None) -> tuple[QueueManager, list]:
+    m = QueueManager("inspect", [{"name": c} for c in counters], priority)
+    sent = []
+
+    async def broadcast(message, role=None):
+        sent.append(message)
+
+    m.broadcast = broadcast
+    return m, sent
+
+
+def patient(minute: float, priority: str | None = None) -> dict:
+    item = {"FULLNAME_TH": f"ผู้ป่วย {minute}", "counter": None,
+            "timestamp": (OPEN + timedelta(minutes=minute)).isoformat()}
+    if priority:
+        item["priority"] = priority
+    return item
+
+
+def test_priority_enqueue_sends_positioned_insert():
+    m, sent = manager(priority={"urgent": 1800})
+
+    async def run():
+        for minute in (0, 5, 10):
+            await m.queue_append(patient(minute))
+        await m.queue_append(patient(12, "urgent"))
+        # a priority patient with nobody to overtake is a plain append
+        await m.queue_append(patient(90, "urgent"))
+
+    asyncio.run(run())
+    assert [(s["type"], s.get("position")) for s in sent] == [
+        ("queue_append", None), ("queue_append", None), ("queue_append", None),
+        ("queue_insert", 0), ("queue_append", None),
+    ]
+    assert [s["seq"] for s in sent] == [1, 2, 3, 4, 5]
+    # clients applying the deltas end up with the server's order
+    view = []
+    for s in sent:
+        view.insert(s.get("position", len(view)), s["item"]["Q_number"])
+    assert view == [item["Q_number"] for item in m.queue] == [4, 1, 2, 3, 5]
+
+
+def test_broadcasts_use_the_seq_and_position_of_their_own_change():
+    m, sent = manager(priority={"urgent": 1800})
+
+    async def mutate(op, **data):
+        # with a broker, another worker's event can be applied before this caller resumes
+        result = m.apply(op, data)
+        m.apply("append", {"item": patient(1, "urgent")})
+        return result
+
+    m.mutate = mutate
+
+    async def run():
+        await m.queue_append(patient(0))
+        await m.queue_append(patient(20, "urgent"))
+        await m.queue_pop("1")
+
+    asyncio.run(run())
+    assert [(s["type"], s["seq"], s.get("position")) for s in sent] == [
+        ("queue_append", 1, None), ("queue_insert", 3, 1), ("queue_pop", 5, None),
+    ]
+    # the popped item was called by this request, not whatever the other worker added
+    assert sent[2]["Q_number"] == 2
+
+
+def test_called_item_carries_only_the_dispatch_decision():
+    m, _ = manager(counters=("1", "2"))
+    for minute in (0, 1, 2):
+        m.apply("append", {"item": patient(minute)})
+    auto, _, _ = m.apply("call", {"at": OPEN.timestamp()})
+    assert auto["counter"] == "1"
+    assert auto["dispatch"] == {"counter": "1", "reason": "idle", "expected_wait": 0.0}
+    requested, _, _ = m.apply("call", {"counter": "2", "at": OPEN.timestamp() + 60})
+    assert requested["dispatch"] == {"counter": "2", "reason": "requested"}
+    # loads stay on the dispatcher, for GET /{service}/counters
+    assert set(m.dispatcher.loads(OPEN.timestamp() + 60)) == {"1", "2"}
+
+
+def test_wait_endpoint_keeps_the_estimate_apart_from_the_stats(monkeypatch):
+    m, _ = manager(counters=("1",))
+    monkeypatch.setitem(service_managers, "inspect", m)
+    start = OPEN.timestamp()
+    for minute in range(4):
+        m.apply("append", {"item": patient(minute)})
+    # with patients waiting throughout, calls every 90s make a 90s call gap
+    for i in range(2):
+        m.apply("call", {"counter": "1", "at": start + 600 + 90 * i})
+    out = get_wait("inspect")
+    assert out["call_gap"] == 90.0
+    assert out["queue_length"] == 2
+    assert out["waiting"] == [
+        {"position": 1, "Q_number": 3, "estimated_wait": 90.0},
+        {"position": 2, "Q_number": 4, "estimated_wait": 180.0},
+    ]
+    assert set(out["stats"]) == {"wait", "call_gap", "counters"}
+    assert out["stats"]["call_gap"]["count"] == 1
+    assert get_wait("nowhere") == {"error": "unknown service nowhere"}
+
+
+class FrameSink:
+    role = "client"
+
+    def __init__(self):
+        self.frames: list[str] = []
+
+    def offer(self, data: str) -> bool:
+        self.frames.append(data)
+        return True
+
+
+def test_buffered_deltas_show_the_item_as_it_was_when_sent():
+    m = QueueManager("inspect", [{"name": "c1"}], {"urgent": 1800})
+    sink = FrameSink()
+    m.active_connections.append(sink)
+
+    async def run():
+        for minute in (0, 1):
+            await m.queue_append(patient(minute))
+        await m.queue_append(patient(2, "urgent"))
+        # called inside the same coalescing window, before the insert frame is flushed
+        await m.queue_pop()
+        await asyncio.sleep(COALESCE_WINDOW + 0.05)
+
+    asyncio.run(run())
+    messages = [msg for frame in sink.frames for msg in json.loads(frame).get("messages", [json.loads(frame)])]
+    insert = next(msg for msg in messages if msg["type"] == "queue_insert")
+    assert insert["item"]["counter"] is None
+    assert "dispatch" not in insert["item"]
+    popped = next(msg for msg in messages if msg["type"] == "queue_pop")
+    assert popped["Q_number"] == insert["item"]["Q_number"]
+
+
+class FixedCalendar:
+    def __init__(self, day: str):
+        self.day = day
+
+    def today(self) -> str:
+        return self.day
+
+    def now(self) -> datetime:
+        return datetime.fromisoformat(f"{self.day}T08:00:00+07:00")
+
+
+def test_day_rollover_archives_and_resets_once(monkeypatch, tmp_path):
+    m, sent = manager(counters=("1",))
+    calendar = FixedCalendar("2026-01-01")
+    archive = DayArchive(str(tmp_path))
+    monkeypatch.setattr(queue_module, "service_managers", {"inspect": m})
+    monkeypatch.setattr(queue_module, "service_calendar", calendar)
+    monkeypatch.setattr(queue_module, "day_archive", archive)
+    m.day = calendar.today()
+    for minute in range(3):
+        m.apply("append", {"item": patient(minute)})
+    m.apply("call", {"counter": "1", "at": OPEN.timestamp() + 300})
+
+    async def run():
+        same_day = await queue_module.rollover_if_due()
+        calendar.day = "2026-01-02"
+        await queue_module.ensure_service_day()
+        again = await queue_module.rollover_if_due()
+        return same_day, again
+
+    same_day, again = asyncio.run(run())
+    assert same_day == [] and again == []
+    assert m.day == "2026-01-02"
+    assert len(m.queue) == 0 and m.current is None and m.counter_number == 0
+    record = archive.read("2026-01-01", "inspect")
+    assert record["issued"] == 3
+    assert [item["Q_number"] for item in record["unserved"]] == [2, 3]
+    assert record["current"]["Q_number"] == 1
+    assert archive.days("inspect") == ["2026-01-01"]
+    # clients are sent the empty day
+    snapshot = next(s for s in sent if s["type"] == "queue_update")
+    assert snapshot["queue"] == []
+    # numbering starts over
+    assert m.apply("append", {"item": patient(0)})[0]["Q_number"] == 1
+
+
+def test_archive_writers_do_not_share_a_temp_file(tmp_path):
+    archive = DayArchive(str(tmp_path))
+    # another worker halfway through archiving the same day
+    other = tmp_path / f"2026-01-01.inspect.json.gz.{os.getpid() + 1}.tmp"
+    other.write_bytes(b"\x1f\x8b partial")
+    archive.write("2026-01-01", "inspect", {"counter_number": 2})
+    assert other.read_bytes() == b"\x1f\x8b partial"
+    assert archive.read("2026-01-01", "inspect")["issued"] == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["2026-01-01.inspect.json.gz", other.name]
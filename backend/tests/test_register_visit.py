@@ -0,0 +1,122 @@
+import pymysql
+import pytest
+from src.database.visitno import VisitNumberAllocator
+from src.models.models import InsertVisit
+from src.router import jhcis
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, args=None):
+        self.conn.log.append(" ".join(query.split())[:30])
+        if "INSERT INTO visit" in query:
+            self.executemany(query, [args])
+        elif "MAX(visitno)" in query:
+            self.result = [(self.conn.max_visitno + 1,)]
+        elif "FROM user u" in query and "LIMIT 1" in query:
+            # pcucode, office, pcucodeperson, pid
+            self.result = [("07001", "07001", "07001", 55)]
+        elif "FROM user u" in query:
+            self.result = [(name, "07001", "07001") for name in args]
+        elif "FROM person" in query:
+            self.result = [(idcard, "07001", 55 + i) for i, idcard in enumerate(args)]
+        else:
+            self.result = []
+
+    def executemany(self, query, rows):
+        if self.conn.duplicates:
+            self.conn.duplicates -= 1
+            # another JHCIS client took these numbers meanwhile
+            self.conn.max_visitno += 10
+            raise pymysql.err.IntegrityError(jhcis.ER_DUP_ENTRY, "Duplicate entry for key 'PRIMARY'")
+        self.conn.inserted.extend(list(row) for row in rows)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self, duplicates: int = 0):
+        self.max_visitno = 41
+        self.duplicates = duplicates
+        self.inserted: list[list] = []
+        self.log: list[str] = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def begin(self):
+        self.log.append("BEGIN")
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+
+@pytest.fixture(autouse=True)
+def fresh_visit_numbers(monkeypatch):
+    monkeypatch.setattr(jhcis, "visit_numbers", VisitNumberAllocator())
+
+
+def visit(pid: str = "1234567890123", code: str = "PP1") -> InsertVisit:
+    return InsertVisit(username="admin", pid=pid, claimType="PG0060001", claimCode=code,
+                       datetime_claim="2026-01-01 08:00:00")
+
+
+def test_register_visit_reports_its_phases_to_the_callers_mark():
+    phases = []
+
+    def mark(name, start):
+        phases.append(name)
+        return 0.0
+
+    code, body = jhcis.register_visit(FakeConnection(), visit(), mark)
+    assert code == 200 and body["data"]["visitno"] == 42
+    assert phases == ["lookup", "visitno", "insert", "commit"]
+
+
+def test_duplicate_visitno_retries_in_a_new_transaction():
+    conn = FakeConnection(duplicates=1)
+    code, body = jhcis.register_visit(conn, visit())
+    assert code == 200
+    # 42 was taken meanwhile; the resync moves past everything the other client inserted
+    assert body["data"]["visitno"] == 52
+    assert [row[1] for row in conn.inserted] == [52]
+    # the retried insert runs in a transaction begun after the rollback
+    assert "BEGIN" in conn.log[conn.log.index("ROLLBACK"):]
+
+
+def test_bulk_insert_retries_and_renumbers_the_whole_block():
+    phases = []
+
+    def mark(name, start):
+        phases.append(name)
+        return 0.0
+
+    conn = FakeConnection(duplicates=1)
+    results = jhcis.register_visits(conn, [visit("1111111111111"), visit("2222222222222")], mark)
+    assert [r["data"]["visitno"] for r in results] == [52, 53]
+    assert [row[1] for row in conn.inserted] == [52, 53]
+    assert conn.log.count("BEGIN") == 2 and conn.log[-1] == "COMMIT"
+    assert phases == ["bulk_users", "bulk_persons", "bulk_visitno", "bulk_insert"]
+
+
+def test_gives_up_after_repeated_duplicates():
+    conn = FakeConnection(duplicates=jhcis.VISITNO_RETRIES)
+    code, body = jhcis.register_visit(conn, visit())
+    assert code == 500 and "Duplicate entry" in body["error"]
+    assert conn.inserted == [] and conn.log[-1] == "ROLLBACK"
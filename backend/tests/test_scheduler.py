@@ -0,0 +1,107 @@
+import random
+from datetime import datetime, timedelta, timezone
+from src.lib.scheduler import PriorityScheduler
+
+BOOSTS = {"urgent": 1800, "elderly": 600}
+OPEN = datetime(2026, 1, 1, 8, tzinfo=timezone(timedelta(hours=7)))
+
+
+def patient(qnum: int, minute: float, priority: str | None = None) -> dict:
+    item = {"Q_number": qnum, "timestamp": (OPEN + timedelta(minutes=minute)).isoformat()}
+    if priority:
+        item["priority"] = priority
+    return item
+
+
+def called(queue: PriorityScheduler) -> list[int]:
+    return [item["Q_number"] for item in queue]
+
+
+def test_without_classes_patients_are_called_in_arrival_order():
+    queue = PriorityScheduler()
+    for q in (1, 2, 3):
+        assert queue.push(patient(q, q, "urgent")) == q - 1
+    assert called(queue) == [1, 2, 3]
+
+
+def test_priority_overtakes_only_within_its_head_start():
+    queue = PriorityScheduler(BOOSTS)
+    queue.push(patient(1, 0))
+    queue.push(patient(2, 5))
+    queue.push(patient(3, 8))
+    # elderly arriving at minute 12 ranks as minute 2: after 1, ahead of 2 and 3
+    assert queue.push(patient(4, 12, "elderly")) == 1
+    queue.push(patient(5, 15))
+    # urgent arriving at minute 40 ranks as minute 10: ahead of 5 only, everyone else has waited longer
+    assert queue.push(patient(6, 40, "urgent")) == 4
+    assert called(queue) == [1, 4, 2, 3, 6, 5]
+    assert [queue.pop()["Q_number"] for _ in range(6)] == [1, 4, 2, 3, 6, 5]
+    assert queue.pop() is None
+
+
+def test_unknown_class_keeps_arrival_order():
+    queue = PriorityScheduler(BOOSTS)
+    queue.push(patient(1, 0))
+    assert queue.push(patient(2, 1, "vip")) == 1
+    assert queue.classify("vip") is None and queue.classify("urgent") == "urgent"
+
+
+def test_position_get_and_remove():
+    queue = PriorityScheduler(BOOSTS)
+    for q in range(1, 6):
+        queue.push(patient(q, q))
+    queue.pop()
+    assert queue.position(4) == 2
+    assert queue.get(4)["Q_number"] == 4
+    assert queue.remove(3)["Q_number"] == 3
+    assert queue.remove(3) is None
+    assert queue.position(4) == 1 and queue.position(1) is None
+    assert len(queue) == 3 and called(queue) == [2, 4, 5]
+
+
+def test_order_survives_calls_and_removed_entries_are_swept():
+    queue = PriorityScheduler(BOOSTS)
+    for q in range(1, 301):
+        queue.push(patient(q, q, "elderly" if q % 7 == 0 else None))
+    expected = called(queue)
+    popped = [queue.pop()["Q_number"] for _ in range(100)]
+    assert popped == expected[:100]
+    for q in expected[100:250]:
+        queue.remove(q)
+    assert len(queue.heap) < 150  # removed entries were swept out of the heap
+    assert called(queue) == expected[250:]
+    assert queue.position(expected[275]) == 25
+    assert [queue.pop()["Q_number"] for _ in range(50)] == expected[250:]
+    assert len(queue) == 0 and queue.pop() is None
+
+
+def test_reported_positions_match_the_call_order():
+    rng = random.Random(7)
+    queue = PriorityScheduler(BOOSTS)
+    waiting = []
+    for q in range(1, 1001):
+        priority = rng.choice([None] * 6 + ["urgent", "elderly"])
+        at = queue.push(patient(q, q * 0.5, priority))
+        assert called(queue).index(q) == at
+        waiting.append(q)
+        roll = rng.random()
+        if roll < 0.3:
+            waiting.remove(queue.pop()["Q_number"])
+        elif roll < 0.4:
+            queue.remove(waiting.pop(rng.randrange(len(waiting))))
+    assert sorted(called(queue)) == sorted(waiting)
+    assert all(queue.position(q) == k for k, q in enumerate(called(queue)))
+
+def test_state_round_trip_keeps_ranks_and_order():
+    queue = PriorityScheduler(BOOSTS)
+    for q, minute, priority in ((1, 0, None), (2, 5, None), (3, 12, "elderly"), (4, 13, None)):
+        queue.push(patient(q, minute, priority))
+    queue.pop()
+    state = queue.to_state()
+    restored = PriorityScheduler(BOOSTS)
+    restored.load_state(state["items"], state["ranks"], state["clock"])
+    assert called(restored) == called(queue) == [3, 2, 4]
+    # later arrivals rank the same against restored patients as against the originals
+    late = patient(5, 14, "urgent")
+    assert restored.push(dict(late)) == queue.push(dict(late)) == 0
+    assert restored.to_state() == queue.to_state()
@@ -0,0 +1,95 @@
+import asyncio
+import socket
+import pytest
+from src.lib.state_broker import BrokerClient, StateBroker
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs unix sockets")
+
+
+class Replica:
+    """A worker's copy of the state: the events it has applied, in order."""
+
+    def __init__(self):
+        self.events = []
+
+    def on_snapshot(self, state: dict):
+        self.events = list(state["events"])
+
+    def on_event(self, service, op, data):
+        self.events.append([service, op, data["n"]])
+        return len(self.events)
+
+
+async def until(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def run_with_broker(tmp_path, scenario):
+    address = f"unix:{tmp_path / 'state.sock'}"
+    state = Replica()
+    recorded = []
+    broker = StateBroker(address, state.on_event, lambda s, op, d: recorded.append(op),
+                         lambda: {"events": list(state.events)})
+
+    async def run():
+        server = asyncio.create_task(broker.serve())
+        replicas = [Replica(), Replica()]
+        clients = [BrokerClient(address, r.on_snapshot, r.on_event, spawn=False) for r in replicas]
+        try:
+            for client in clients:
+                await client.connect()
+            await scenario(broker, state, clients, replicas)
+        finally:
+            for client in clients:
+                await client.close()
+            server.cancel()
+            await asyncio.gather(server, return_exceptions=True)
+        return recorded
+
+    return asyncio.run(run())
+
+
+def test_workers_apply_each_others_changes_in_broker_order(tmp_path):
+    async def scenario(broker, state, clients, replicas):
+        a, b = clients
+        replica_a, replica_b = replicas
+        results = await asyncio.gather(*(
+            client.publish("inspect", "append", {"n": f"{name}{i}"})
+            for i in range(20) for name, client in (("a", a), ("b", b))
+        ))
+        await until(lambda: b.seq == a.seq == broker.seq)
+        assert len(state.events) == 40
+        assert replica_a.events == replica_b.events == state.events
+        # each publish answers with what applying it returned on the sender
+        assert sorted(results) == list(range(1, 41))
+        # relayed events reach every worker but are not applied by the broker
+        a.send("inspect", "status", {"n": "relay"})
+        await until(lambda: replica_b.events[-1] == ["inspect", "status", "relay"])
+        assert len(state.events) == 40
+
+    recorded = run_with_broker(tmp_path, scenario)
+    assert recorded == ["append"] * 40
+
+
+def test_reconnect_restores_the_brokers_state(tmp_path):
+    async def scenario(broker, state, clients, replicas):
+        a, b = clients
+        replica_b = replicas[1]
+        for i in range(3):
+            await a.publish("inspect", "append", {"n": i})
+        await until(lambda: len(replica_b.events) == 3)
+        # a worker that missed events while it was cut off
+        replica_b.events = replica_b.events[:1]
+        broker.subscribers[b.id].close()
+        await until(lambda: b.reconnects == 1)
+        assert replica_b.events == state.events
+        assert b.metrics()["connected"]
+        # and it keeps receiving events after the resync
+        await a.publish("inspect", "append", {"n": 3})
+        await until(lambda: len(replica_b.events) == 4)
+        assert replica_b.events == state.events
+
+    run_with_broker(tmp_path, scenario)
@@ -0,0 +1,43 @@
+import asyncio
+from src.lib.tts_worker import TTSWorker
+
+
+def test_prerender_task_is_held_and_cancelled_on_stop():
+    async def run():
+        worker = TTSWorker(workers=1)
+        started = asyncio.Event()
+
+        async def prerender(texts, lang):
+            started.set()
+            await asyncio.sleep(3600)
+
+        worker.prerender = prerender
+        task = worker.start_prerender(["คิวหมายเลข"], "th")
+        await started.wait()
+        assert worker.background == {task}
+        await worker.stop()
+        return worker, task
+
+    worker, task = asyncio.run(run())
+    assert task.cancelled()
+    assert worker.background == set()
+    assert worker.start_prerender(["คิวหมายเลข"], "th") is None
+
+
+def test_failed_prerender_is_logged(capsys):
+    async def run():
+        worker = TTSWorker(workers=1)
+
+        async def prerender(texts, lang):
+            raise RuntimeError("engine missing")
+
+        worker.prerender = prerender
+        task = worker.start_prerender(["คิวหมายเลข"], "th")
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        await worker.stop()
+        return worker
+
+    worker = asyncio.run(run())
+    assert worker.background == set()
+    assert "TTS background task failed: engine missing" in capsys.readouterr().out
@@ -0,0 +1,80 @@
+import pytest
+from src.database.visitno import VisitNumberAllocator
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.query = ""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, args=None):
+        self.query = query
+        self.conn.statements.append(query)
+
+    def fetchone(self):
+        if "GET_LOCK" in self.query:
+            return (1 if self.conn.lock_granted else 0,)
+        if "RELEASE_LOCK" in self.query:
+            return (1,)
+        return (self.conn.max_visitno + 1,)
+
+
+class FakeConnection:
+    """Answers the allocator's queries; ``max_visitno`` is what the visit table holds."""
+
+    def __init__(self, max_visitno: int = 41):
+        self.max_visitno = max_visitno
+        self.lock_granted = True
+        self.statements: list[str] = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def test_local_counter_seeds_once_and_hands_out_blocks():
+    conn = FakeConnection()
+    numbers = VisitNumberAllocator()
+    assert numbers.next(conn) == 42
+    assert numbers.next(conn) == 43
+    assert numbers.block(conn, 3) == 44
+    assert numbers.next(conn) == 47
+    assert sum("MAX(visitno)" in q for q in conn.statements) == 1
+
+
+def test_resync_skips_numbers_taken_by_other_clients():
+    conn = FakeConnection()
+    numbers = VisitNumberAllocator()
+    numbers.next(conn)
+    conn.max_visitno = 100
+    numbers.resync(conn)
+    assert numbers.next(conn) == 101
+
+
+def test_shared_mode_reads_the_table_under_a_named_lock():
+    # two workers sharing one database must not reuse each other's numbers
+    conn = FakeConnection()
+    first, second = VisitNumberAllocator(shared=True), VisitNumberAllocator(shared=True)
+    with first.allocating(conn):
+        conn.max_visitno = first.next(conn)
+    with second.allocating(conn):
+        taken = second.next(conn)
+    assert (conn.max_visitno, taken) == (42, 43)
+    locks = [q.split()[1].split("(")[0] for q in conn.statements if "LOCK" in q]
+    assert locks == ["GET_LOCK", "RELEASE_LOCK", "GET_LOCK", "RELEASE_LOCK"]
+    assert all("FOR UPDATE" in q for q in conn.statements if "MAX(visitno)" in q)
+
+
+def test_shared_mode_gives_up_when_the_lock_is_held():
+    conn = FakeConnection()
+    conn.lock_granted = False
+    numbers = VisitNumberAllocator(shared=True, lock_timeout=1)
+    with pytest.raises(TimeoutError):
+        with numbers.allocating(conn):
+            pass
+    assert numbers.lock_waits == 1
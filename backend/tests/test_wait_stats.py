@@ -0,0 +1,51 @@
+import random
+from src.lib.wait_stats import P2Quantile, StreamStats, WaitEstimator
+
+
+def test_streaming_quantiles_track_exact_ones():
+    rng = random.Random(3)
+    samples = [rng.expovariate(1 / 300) for _ in range(20000)]
+    stats = StreamStats()
+    for x in samples:
+        stats.add(x)
+    ordered = sorted(samples)
+    summary = stats.summary()
+    assert summary["count"] == 20000
+    for p in (0.5, 0.9):
+        exact = ordered[int(p * len(ordered))]
+        assert abs(summary[f"p{round(p * 100)}"] - exact) / exact < 0.03
+
+
+def test_few_samples_use_nearest_rank():
+    q = P2Quantile(0.9)
+    assert q.value() is None
+    for x in (30, 10, 20):
+        q.add(x)
+    assert q.value() == 30
+
+
+def test_call_gaps_count_only_while_patients_wait():
+    waits = WaitEstimator(alpha=1.0, max_gap=600)
+    waits.called(1000, 900, backlogged=False)
+    waits.called(1100, 950, backlogged=True)
+    # the queue ran empty in between: not a throughput gap
+    waits.called(1500, 1450, backlogged=False)
+    # longer than max_gap: a break, not a gap
+    waits.called(2200, 1500, backlogged=True)
+    assert waits.gap.count == 1 and waits.call_gap(999) == 100
+    assert waits.wait.count == 4
+    assert waits.positions(3, 999) == [100.0, 200.0, 300.0]
+    assert WaitEstimator().call_gap(240) == 240
+
+
+def test_state_round_trip():
+    waits = WaitEstimator()
+    for i in range(1, 40):
+        waits.called(i * 60.0, i * 60.0 - i, backlogged=True)
+    waits.served("1", 120)
+    restored = WaitEstimator()
+    restored.load_state(waits.to_state())
+    assert restored.summary() == waits.summary()
+    waits.called(3000, 2900, True)
+    restored.called(3000, 2900, True)
+    assert restored.summary() == waits.summary()
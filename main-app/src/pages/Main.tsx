@@ -190,7 +190,8 @@ function Main({
           }
         );
 
-        if (insert_visit.status !== 200) {
+        // 202: the visit is journaled and will reach JHCIS once the database is back
+        if (insert_visit.status !== 200 && insert_visit.status !== 202) {
           Swal.fire({
             title: "เกิดข้อผิดพลาด!",
             text: "ไม่สามารถบันทึกข้อมูลการเข้ารับบริการได้ กรุณาลองใหม่อีกครั้ง.",